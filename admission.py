@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+
+class ServiceSaturated(Exception):
+    def __init__(self, retry_after):
+        """
+        Raised when a request cannot be admitted; the server should answer 503.
+
+        Args:
+            retry_after (int): Seconds the client should wait before retrying.
+        """
+        super().__init__(f"Service saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionStats:
+    def __init__(self, window=1024):
+        """
+        Counters and a rolling window of queue-wait times for an admission controller.
+        """
+        self._waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.busy_time = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self._waits.append(seconds)
+            self.admitted += 1
+
+    def record_reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record_done(self, seconds):
+        with self._lock:
+            self.completed += 1
+            self.busy_time += seconds
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            admitted, rejected, completed = self.admitted, self.rejected, self.completed
+            avg_service = self.busy_time / completed if completed else 0.0
+
+        def pct(p):
+            return waits[min(len(waits) - 1, int(p / 100 * len(waits)))] if waits else 0.0
+
+        return {
+            'admitted': admitted,
+            'rejected': rejected,
+            'completed': completed,
+            'queue_wait_ms': {
+                'p50': round(1000 * pct(50), 1),
+                'p95': round(1000 * pct(95), 1),
+                'p99': round(1000 * pct(99), 1),
+                'max': round(1000 * waits[-1], 1) if waits else 0.0,
+            },
+            'avg_service_ms': round(1000 * avg_service, 1),
+        }
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency=2, max_queue=8, queue_timeout=10.0):
+        """
+        Bounded admission queue in front of detection for thread-based servers.
+
+        At most `max_concurrency` requests run detection at once and at most `max_queue`
+        wait for a slot. Anything beyond that, or waiting longer than `queue_timeout`,
+        is rejected with ServiceSaturated so the server can fail fast with 503.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.stats = AdmissionStats()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a controller from ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE and ADMISSION_QUEUE_TIMEOUT.
+        """
+        return cls(
+            max_concurrency=int(os.getenv('ADMISSION_MAX_CONCURRENCY', '2')),
+            max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '8')),
+            queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+        )
+
+    def retry_after(self):
+        """
+        Rough time until a queued request would get a slot, in whole seconds.
+        """
+        avg_service = self.stats.snapshot()['avg_service_ms'] / 1000 or 1.0
+        backlog = (self._waiting + 1) / max(1, self.max_concurrency)
+        return max(1, int(round(backlog * avg_service)))
+
+    @contextlib.contextmanager
+    def slot(self, timeout=None):
+        """
+        Holds a detection slot for the duration of the with-block.
+
+        Args:
+            timeout (float): Longest time to wait in the queue, defaults to queue_timeout.
+
+        Raises:
+            ServiceSaturated: If the queue is full or the wait times out.
+        """
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        start = time.monotonic()
+        with self._cond:
+            if self._running >= self.max_concurrency and self._waiting >= self.max_queue:
+                self.stats.record_reject()
+                raise ServiceSaturated(self.retry_after())
+            self._waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self._running < self.max_concurrency, timeout)
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                self.stats.record_reject()
+                raise ServiceSaturated(self.retry_after())
+            self._running += 1
+
+        admitted_at = time.monotonic()
+        self.stats.record_wait(admitted_at - start)
+        try:
+            yield
+        finally:
+            self.stats.record_done(time.monotonic() - admitted_at)
+            with self._cond:
+                self._running -= 1
+                self._cond.notify()
+
+    def _counts(self):
+        with self._cond:
+            return self._running, self._waiting
+
+    def metrics(self):
+        """
+        Returns:
+            dict: In-flight and queued requests, saturation and queue-wait percentiles.
+        """
+        running, waiting = self._counts()
+        metrics = self.stats.snapshot()
+        metrics.update({
+            'in_flight': running,
+            'queued': waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'saturation': round((running + waiting) / (self.max_concurrency + self.max_queue), 3),
+        })
+        return metrics
+
+
+class AsyncAdmissionController(AdmissionController):
+    def __init__(self, max_concurrency=2, max_queue=8, queue_timeout=10.0):
+        """
+        Asyncio flavour of AdmissionController for the ASGI server: waiting requests
+        are coroutines, not blocked threads.
+        """
+        super().__init__(max_concurrency, max_queue, queue_timeout)
+        self._semaphore = None
+
+    @contextlib.asynccontextmanager
+    async def slot(self, timeout=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        start = time.monotonic()
+        if self._running >= self.max_concurrency and self._waiting >= self.max_queue:
+            self.stats.record_reject()
+            raise ServiceSaturated(self.retry_after())
+
+        # asyncio.wait_for can time out after the acquire already went through and so leak
+        # a permit (Python 3.11); the permit is handed back when that happens
+        self._waiting += 1
+        acquired = False
+        try:
+            async with asyncio.timeout(timeout):
+                await self._semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                self._semaphore.release()
+            self.stats.record_reject()
+            raise ServiceSaturated(self.retry_after())
+        finally:
+            self._waiting -= 1
+        self._running += 1
+
+        admitted_at = time.monotonic()
+        self.stats.record_wait(admitted_at - start)
+        try:
+            yield
+        finally:
+            self.stats.record_done(time.monotonic() - admitted_at)
+            self._running -= 1
+            self._semaphore.release()
+
+    def _counts(self):
+        return self._running, self._waiting
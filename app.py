@@ -1,19 +1,120 @@
-from flask import Flask, request, jsonify
-import cv2
-import numpy as np
+from flask import Flask, Response, request, jsonify
 import base64
-from finaly import FishDetector, detect_stars, calculate_fish_lengths
-from fish_recognition import recognize_fish_from_image
+import os
+from admission import AdmissionController, ServiceSaturated
+from deadline import Deadline, DeadlineExceeded
+from fish_recognition import fishial_metrics
+from render import Renderer
+from startup import ServiceLoader, ServiceNotReady
 
 app = Flask(__name__)
 
-# Initialize the fish detector once
-fish_detector = FishDetector("model.ts")
+# Load and warm up the models in the background; /readyz reports when they are usable
+service_loader = ServiceLoader.from_env().start()
+
+# Bounded admission queue in front of decode + detection
+admission = AdmissionController.from_env()
+
+# Measured results kept for on-demand annotated images (GET /render/<result_id>)
+renderer = Renderer.from_env()
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Fish Length Detection API is running"})
+    return jsonify({"status": "healthy", "message": "Fish Length Detection API is running",
+                    "ready": service_loader.ready})
+
+@app.route('/livez', methods=['GET'])
+def livez():
+    """Liveness: the process is up and serving HTTP"""
+    return jsonify({"status": "alive"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: both models are loaded and warmed up"""
+    status = service_loader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def get_session_id(data=None):
+    """
+    Optional session or device id of a fixed camera rig, used to reuse its star calibration.
+    """
+    session_id = request.headers.get('X-Session-Id')
+    if not session_id and data is not None:
+        session_id = data.get('session_id') or data.get('device_id')
+    return session_id or None
+
+def saturated_response(error):
+    response = jsonify({"error": "Service is saturated, please retry later", "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def not_ready_response(error):
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def deadline_response(error):
+    return jsonify({"error": str(error), "partial": True, "missing": ["fish", "lengths", "species"]}), 504
+
+def measure_upload(image_bytes, filename, session_id, deadline):
+    """
+    Decodes and measures inside an admission slot, then looks up the species,
+    all within the request's deadline. Shared by the HTTP and gRPC endpoints.
+
+    Returns:
+        tuple: (measurement, fish_species, species_ok, species_by_fish, result_id),
+            or None if the image could not be decoded.
+    """
+    fish_service = service_loader.get()
+    deadline.check('admission')
+    with admission.slot(timeout=deadline.remaining()):
+        image, measurement = fish_service.decode_and_measure(image_bytes, session_id, deadline)
+        if image is None:
+            return None
+
+    # Recognize fish species (network bound, so it does not hold a detection slot)
+    fish_species, species_ok, species_by_fish = fish_service.recognize(image_bytes, filename, measurement,
+                                                                       deadline, image)
+    result_id = renderer.store(image_bytes, image.shape, measurement)
+    return measurement, fish_species, species_ok, species_by_fish, result_id
+
+def measure_and_recognize(image_bytes, filename, session_id, deadline):
+    """
+    Returns:
+        dict: The /fish-length response body, or None if the image could not be decoded.
+    """
+    result = measure_upload(image_bytes, filename, session_id, deadline)
+    if result is None:
+        return None
+    measurement, fish_species, species_ok, species_by_fish, result_id = result
+    return service_loader.get().build_response(measurement, fish_species, session_id, species_ok, species_by_fish,
+                                               result_id)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Admission queue, Fishial circuit breaker, render cache, pipeline stage and inference pool metrics"""
+    report = {"admission": admission.metrics(), "fishial": fishial_metrics(), "render": renderer.metrics()}
+    if service_loader.ready and service_loader.get().pipeline is not None:
+        report["pipeline"] = service_loader.get().pipeline.stats()
+    if service_loader.ready and service_loader.get().inference_pool is not None:
+        report["inference_pool"] = service_loader.get().inference_pool.metrics()
+    return jsonify(report)
+
+@app.route('/render/<result_id>', methods=['GET'])
+def render_result(result_id):
+    """
+    Annotated JPEG of an earlier /fish-length result, downscaled to max_side and encoded at quality
+    """
+    try:
+        max_side, quality = Renderer.parse_options(request.args)
+    except ValueError:
+        return jsonify({"error": "max_side and quality must be integers"}), 400
+
+    encoded = renderer.render(result_id, max_side, quality)
+    if encoded is None:
+        return jsonify({"error": "Unknown or expired result_id"}), 404
+    return Response(encoded, mimetype='image/jpeg', headers={'Cache-Control': 'private, max-age=600'})
 
 @app.route('/fish-length', methods=['POST'])
 def get_fish_length():
@@ -21,6 +122,7 @@ def get_fish_length():
     Get fish lengths and species from uploaded image
     Returns: JSON with fish lengths array and species, or 0 if no fish detected
     """
+    deadline = Deadline.from_headers(request.headers)
     try:
         # Check if image is provided
         if 'image' not in request.files:
@@ -32,55 +134,19 @@ def get_fish_length():
         
         # Read and process the image
         image_bytes = file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        result = measure_and_recognize(image_bytes, file.filename, get_session_id(request.form), deadline)
         
-        if image is None:
+        if result is None:
             return jsonify({"error": "Could not decode image"}), 400
         
-        # Detect fish
-        fish_boxes = fish_detector.detect_fish(image)
-        
-        # If no fish detected, return 0
-        if not fish_boxes:
-            return jsonify({
-                "success": True,
-                "fish_lengths": 0,
-                "fish_count": 0,
-                "fish_species": []
-            })
-        
-        # Detect stars for scale reference
-        star_boxes = detect_stars(image, "epoch162.pt")
-        
-        # Calculate fish lengths
-        fish_lengths, pixels_per_inch = calculate_fish_lengths(fish_boxes, star_boxes)
-        
-        # Extract only the length values
-        lengths = []
-        if fish_lengths:
-            for fish in fish_lengths:
-                lengths.append(round(fish['length_inch'], 2))
-        
-        # Recognize fish species
-        fish_species = recognize_fish_from_image(image_bytes, file.filename)
-        
-        # If no valid lengths calculated, return 0
-        if not lengths:
-            return jsonify({
-                "success": True,
-                "fish_lengths": 0,
-                "fish_count": len(fish_boxes),
-                "fish_species": fish_species
-            })
-        
-        return jsonify({
-            "success": True,
-            "fish_lengths": lengths,
-            "fish_count": len(lengths),
-            "fish_species": fish_species
-        })
+        return jsonify(result)
         
+    except ServiceSaturated as e:
+        return saturated_response(e)
+    except ServiceNotReady as e:
+        return not_ready_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(e)
     except Exception as e:
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
@@ -90,6 +156,7 @@ def get_fish_length_base64():
     Get fish lengths and species from base64 encoded image
     Returns: JSON with fish lengths array and species, or 0 if no fish detected
     """
+    deadline = Deadline.from_headers(request.headers)
     try:
         data = request.get_json()
         if not data or 'image' not in data:
@@ -102,64 +169,42 @@ def get_fish_length_base64():
             image_data = image_data.split(',')[1]
         
         image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        result = measure_and_recognize(image_bytes, "fish.jpg", get_session_id(data), deadline)
         
-        if image is None:
+        if result is None:
             return jsonify({"error": "Could not decode base64 image"}), 400
         
-        # Detect fish
-        fish_boxes = fish_detector.detect_fish(image)
-        
-        # If no fish detected, return 0
-        if not fish_boxes:
-            return jsonify({
-                "success": True,
-                "fish_lengths": 0,
-                "fish_count": 0,
-                "fish_species": []
-            })
-        
-        # Detect stars for scale reference
-        star_boxes = detect_stars(image, "epoch162.pt")
-        
-        # Calculate fish lengths
-        fish_lengths, pixels_per_inch = calculate_fish_lengths(fish_boxes, star_boxes)
-        
-        # Extract only the length values
-        lengths = []
-        if fish_lengths:
-            for fish in fish_lengths:
-                lengths.append(round(fish['length_inch'], 2))
-        
-        # Recognize fish species
-        fish_species = recognize_fish_from_image(image_bytes, "fish.jpg")
-        
-        # If no valid lengths calculated, return 0
-        if not lengths:
-            return jsonify({
-                "success": True,
-                "fish_lengths": 0,
-                "fish_count": len(fish_boxes),
-                "fish_species": fish_species
-            })
-        
-        return jsonify({
-            "success": True,
-            "fish_lengths": lengths,
-            "fish_count": len(lengths),
-            "fish_species": fish_species
-        })
+        return jsonify(result)
         
+    except ServiceSaturated as e:
+        return saturated_response(e)
+    except ServiceNotReady as e:
+        return not_ready_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(e)
     except Exception as e:
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
+# GRPC_PORT=50051 also serves the gRPC API from this process, on the same models and admission queue
+grpc_server = None
+if int(os.getenv('GRPC_PORT', '0')):
+    from grpc_server import start_grpc_server
+    grpc_server = start_grpc_server(measure_upload, int(os.getenv('GRPC_PORT')))
+
 if __name__ == '__main__':
     print("Starting Fish Length & Species Detection API...")
     print("Available endpoints:")
     print("  GET  /health - Health check")
+    print("  GET  /livez - Liveness probe")
+    print("  GET  /readyz - Readiness probe (503 until models are loaded and warmed up)")
+    print("  GET  /metrics - Admission queue, saturation, Fishial breaker, render cache, pipeline and inference pool metrics")
     print("  POST /fish-length - Upload image file (multipart/form-data)")
     print("  POST /fish-length-base64 - Send base64 encoded image (JSON)")
+    print("  GET  /render/<result_id>?max_side=1024&quality=80 - Annotated JPEG of an earlier result")
+    if grpc_server is not None:
+        print(f"  gRPC FishLength.Measure / MeasureStream on port {os.getenv('GRPC_PORT')} (see fish_length.proto)")
+    print("  Optional: X-Session-Id header or session_id field to reuse a fixed rig's star calibration")
+    print("  Optional: X-Request-Deadline-Ms header to bound the request; unfinished parts are flagged as missing")
     print()
     print("Response format:")
     print("  - If fish detected: {'success': True, 'fish_lengths': [4.2, 3.8], 'fish_count': 2, 'fish_species': [{'name': 'Bass', 'accuracy': 0.95}]}")
@@ -0,0 +1,379 @@
+"""
+ASGI version of the Fish Length API
+Same endpoints and request/response contracts as app.py, served by uvicorn:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Slow uploads and the Fishial round trips are awaited on the event loop, so
+they cost a coroutine rather than a worker thread. Decoding and inference
+run in a bounded thread pool (INFERENCE_WORKERS).
+
+The /live WebSocket measures camera preview frames as they come; see live_measure.
+"""
+import asyncio
+import base64
+import contextlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+from admission import AsyncAdmissionController, ServiceSaturated
+from deadline import Deadline, DeadlineExceeded
+from fish_recognition import (recognize_fish_with_status_async, recognize_fish_crops_async, merge_species,
+                              fishial_metrics)
+from render import Renderer
+from startup import ServiceLoader, ServiceNotReady
+
+# Models load and warm up in the background once the server starts; /readyz reports when they are usable
+service_loader = ServiceLoader.from_env('fish_service:create_live_service_from_env')
+# Bounded admission queue in front of decode + detection; the pool matches its concurrency
+admission = AsyncAdmissionController.from_env()
+inference_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INFERENCE_WORKERS', str(admission.max_concurrency))),
+    thread_name_prefix='inference')
+http_client = None
+# Measured results kept for on-demand annotated images (GET /render/<result_id>)
+renderer = Renderer.from_env()
+
+
+async def run_blocking(func, *args):
+    """
+    Runs CPU-bound work (decode, inference) in the bounded inference pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, func, *args)
+
+
+def get_session_id(request, data=None):
+    """
+    Optional session or device id of a fixed camera rig, used to reuse its star calibration.
+    """
+    session_id = request.headers.get('X-Session-Id')
+    if not session_id and data is not None:
+        session_id = data.get('session_id') or data.get('device_id')
+    return session_id or None
+
+
+async def recognize_within(lookup, deadline):
+    """
+    Awaits a species lookup coroutine, cancelling it when the request's budget runs out.
+
+    Returns:
+        tuple: (species, True if the lookup completed)
+    """
+    try:
+        return await asyncio.wait_for(lookup, deadline.remaining())
+    except asyncio.TimeoutError:
+        return None, False
+
+
+async def recognize(fish_service, image, image_bytes, filename, fish_boxes, deadline):
+    """
+    Species lookup on the full photo, or on one crop per fish when crop uploads are enabled.
+
+    Returns:
+        tuple: (species list, True if the lookup completed, species per fish or None)
+    """
+    if not fish_service.crop_uploads:
+        fish_species, species_ok = await recognize_within(
+            recognize_fish_with_status_async(image_bytes, filename, http_client, deadline), deadline)
+        return fish_species or [], species_ok, None
+
+    crops = await run_blocking(fish_service.encode_crops, image, fish_boxes)
+    species_by_fish, species_ok = await recognize_within(
+        recognize_fish_crops_async(crops, http_client, deadline), deadline)
+    species_by_fish = species_by_fish or [[] for _ in crops]
+    return merge_species(species_by_fish), species_ok, species_by_fish
+
+
+async def measure_and_recognize(image_bytes, filename, session_id, deadline):
+    """
+    Decodes and measures in the inference pool, then awaits the species lookup,
+    all within the request's deadline.
+
+    Returns:
+        JSONResponse: The /fish-length response, or None if the image could not be decoded.
+    """
+    deadline.check('admission')
+    fish_service = service_loader.get()
+    async with admission.slot(timeout=deadline.remaining()):
+        image, measurement = await run_blocking(fish_service.decode_and_measure, image_bytes, session_id, deadline)
+        if image is None:
+            return None
+
+    fish_species, species_ok, species_by_fish = [], True, None
+    if measurement['fish_boxes']:
+        fish_species, species_ok, species_by_fish = await recognize(
+            fish_service, image, image_bytes, filename, measurement['fish_boxes'], deadline)
+    result_id = renderer.store(image_bytes, image.shape, measurement)
+    return JSONResponse(fish_service.build_response(measurement, fish_species, session_id, species_ok,
+                                                    species_by_fish, result_id))
+
+
+class LatestFrame:
+    def __init__(self):
+        """
+        Single-slot mailbox of a live connection: a frame that arrives before the previous
+        one was taken replaces it, so the consumer always gets the newest frame.
+        """
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, data):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (self.received, data, time.monotonic())
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def take(self):
+        """
+        Waits for the newest pending frame.
+
+        Returns:
+            tuple: (frame number, encoded bytes, monotonic arrival time), or None once closed.
+        """
+        while self._frame is None:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+async def measure_frame(image_bytes, session_id, deadline):
+    """
+    Measures one live frame with the reduced-size live detector, inside an admission slot.
+
+    Returns:
+        dict: The message to push for the frame.
+    """
+    try:
+        deadline.check('admission')
+        fish_service = service_loader.get()
+        async with admission.slot(timeout=deadline.remaining()):
+            measurement = await run_blocking(fish_service.measure_live, image_bytes, session_id, deadline)
+    except (ServiceSaturated, ServiceNotReady) as e:
+        return {"error": str(e), "retry_after": e.retry_after}
+    except DeadlineExceeded as e:
+        return {"error": str(e)}
+    if measurement is None:
+        return {"error": "Could not decode frame"}
+    return fish_service.build_live_response(measurement)
+
+
+def saturated_response(error):
+    return JSONResponse({"error": "Service is saturated, please retry later", "retry_after": error.retry_after},
+                        status_code=503, headers={'Retry-After': str(error.retry_after)})
+
+
+def not_ready_response(error):
+    return JSONResponse({"error": str(error), "retry_after": error.retry_after},
+                        status_code=503, headers={'Retry-After': str(error.retry_after)})
+
+
+def deadline_response(error):
+    return JSONResponse({"error": str(error), "partial": True, "missing": ["fish", "lengths", "species"]},
+                        status_code=504)
+
+
+async def metrics(request):
+    """Admission queue, Fishial circuit breaker, render cache, pipeline stage and inference pool metrics"""
+    report = {"admission": admission.metrics(), "fishial": fishial_metrics(), "render": renderer.metrics()}
+    if service_loader.ready and service_loader.get().pipeline is not None:
+        report["pipeline"] = service_loader.get().pipeline.stats()
+    if service_loader.ready and service_loader.get().inference_pool is not None:
+        report["inference_pool"] = service_loader.get().inference_pool.metrics()
+    return JSONResponse(report)
+
+
+async def render_result(request):
+    """Annotated JPEG of an earlier /fish-length result, rendered in the inference pool"""
+    try:
+        max_side, quality = Renderer.parse_options(request.query_params)
+    except ValueError:
+        return JSONResponse({"error": "max_side and quality must be integers"}, status_code=400)
+
+    encoded = await run_blocking(renderer.render, request.path_params['result_id'], max_side, quality)
+    if encoded is None:
+        return JSONResponse({"error": "Unknown or expired result_id"}, status_code=404)
+    return Response(encoded, media_type='image/jpeg', headers={'Cache-Control': 'private, max-age=600'})
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({"status": "healthy", "message": "Fish Length Detection API is running",
+                         "ready": service_loader.ready})
+
+
+async def livez(request):
+    """Liveness: the process is up and serving HTTP"""
+    return JSONResponse({"status": "alive"})
+
+
+async def readyz(request):
+    """Readiness: both models are loaded and warmed up"""
+    status = service_loader.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+async def get_fish_length(request):
+    """
+    Get fish lengths and species from uploaded image
+    Returns: JSON with fish lengths array and species, or 0 if no fish detected
+    """
+    deadline = Deadline.from_headers(request.headers)
+    try:
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return JSONResponse({"error": "No image provided"}, status_code=400)
+        if not file.filename:
+            return JSONResponse({"error": "No image selected"}, status_code=400)
+
+        image_bytes = await file.read()
+        response = await measure_and_recognize(image_bytes, file.filename, get_session_id(request, form), deadline)
+        if response is None:
+            return JSONResponse({"error": "Could not decode image"}, status_code=400)
+        return response
+
+    except ServiceSaturated as e:
+        return saturated_response(e)
+    except ServiceNotReady as e:
+        return not_ready_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(e)
+    except Exception as e:
+        return JSONResponse({"error": f"Processing failed: {str(e)}"}, status_code=500)
+
+
+async def get_fish_length_base64(request):
+    """
+    Get fish lengths and species from base64 encoded image
+    Returns: JSON with fish lengths array and species, or 0 if no fish detected
+    """
+    deadline = Deadline.from_headers(request.headers)
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data or 'image' not in data:
+            return JSONResponse({"error": "No image data provided"}, status_code=400)
+
+        # Decode base64 image
+        image_data = data['image']
+        if image_data.startswith('data:image'):
+            # Remove data URL prefix if present
+            image_data = image_data.split(',')[1]
+        image_bytes = base64.b64decode(image_data)
+
+        response = await measure_and_recognize(image_bytes, "fish.jpg", get_session_id(request, data), deadline)
+        if response is None:
+            return JSONResponse({"error": "Could not decode base64 image"}, status_code=400)
+        return response
+
+    except ServiceSaturated as e:
+        return saturated_response(e)
+    except ServiceNotReady as e:
+        return not_ready_response(e)
+    except DeadlineExceeded as e:
+        return deadline_response(e)
+    except Exception as e:
+        return JSONResponse({"error": f"Processing failed: {str(e)}"}, status_code=500)
+
+
+async def live_measure(websocket):
+    """
+    Live preview measurement. The client sends encoded frames as binary messages and
+    gets one JSON message per measured frame. Only the newest pending frame is measured
+    and older ones are dropped, so results never queue up behind a fast camera.
+
+    The connection keeps its star calibration between frames (under the `session_id`
+    query parameter or X-Session-Id if given), and fish are detected at LIVE_IMSZ.
+    """
+    await websocket.accept()
+    session_id = websocket.query_params.get('session_id') or websocket.headers.get('X-Session-Id')
+    own_session = session_id is None
+    if own_session:
+        session_id = f"live-{uuid.uuid4().hex}"
+    frame_budget = float(os.getenv('LIVE_FRAME_DEADLINE_S', '2'))
+    frames = LatestFrame()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                # Text messages are not frames
+                if message.get('bytes'):
+                    frames.put(message['bytes'])
+        finally:
+            frames.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while (frame := await frames.take()) is not None:
+            number, image_bytes, received_at = frame
+            result = await measure_frame(image_bytes, session_id, Deadline(frame_budget))
+            result.update(frame=number, dropped=frames.dropped,
+                          latency_ms=round(1000 * (time.monotonic() - received_at), 1))
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        if own_session and service_loader.ready and service_loader.get().calibration_cache is not None:
+            service_loader.get().calibration_cache.invalidate(session_id)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global http_client
+    service_loader.start()
+    # One pooled client for all Fishial calls (certificate checks off, as in fish_recognition.py)
+    http_client = httpx.AsyncClient(verify=False, timeout=None,
+                                    limits=httpx.Limits(max_connections=int(os.getenv('FISHIAL_MAX_CONNECTIONS', '100'))))
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        inference_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health_check, methods=['GET']),
+        Route('/livez', livez, methods=['GET']),
+        Route('/readyz', readyz, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/fish-length', get_fish_length, methods=['POST']),
+        Route('/fish-length-base64', get_fish_length_base64, methods=['POST']),
+        Route('/render/{result_id}', render_result, methods=['GET']),
+        WebSocketRoute('/live', live_measure),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("Starting Fish Length & Species Detection API (ASGI)...")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Batch fish measurement over many images
+Streams image files or packed shards (see shards.py) through the staged decode -> batched detection -> measurement
+pipeline, prints the lengths of every image and per-stage utilization and
+queue-wait statistics for balancing worker counts. --sequential runs the old
+one-image-at-a-time path for comparison. --worker-index/--num-workers split
+the inputs so several processes or machines can each take disjoint shards.
+"""
+import argparse
+import collections
+import json
+import time
+
+from finaly import FishDetector
+from fish_service import FishLengthService
+from image_io import iter_image_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fish in many images with the staged pipeline.")
+    parser.add_argument("images", nargs="+", help="Image files, shards or directories")
+    parser.add_argument("--model", default="model.ts", help="TorchScript fish model")
+    parser.add_argument("--star-model", default="epoch162.torchscript", help="Star model")
+    parser.add_argument("--cascade-imsz", type=int, default=0, help="Input size of the presence pass (0 = off)")
+    parser.add_argument("--rect", action="store_true", help="Minimal-padding rectangular inference")
+    parser.add_argument("--decode-workers", type=int, default=2, help="Threads decoding images")
+    parser.add_argument("--batch-size", type=int, default=4, help="Most images per fish detection forward")
+    parser.add_argument("--measure-workers", type=int, default=2, help="Threads running star detection and lengths")
+    parser.add_argument("--queue-size", type=int, default=8, help="Bound of every stage queue")
+    parser.add_argument("--sequential", action="store_true", help="Process one image at a time without the pipeline")
+    parser.add_argument("--worker-index", type=int, default=0, help="This worker's share of the inputs")
+    parser.add_argument("--num-workers", type=int, default=1, help="Number of workers splitting the inputs")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    detector = FishDetector(args.model, cascade_imsz=args.cascade_imsz or None, rect=args.rect)
+    service = FishLengthService(detector, args.star_model)
+    sources = iter_image_bytes(args.images, args.worker_index, args.num_workers)
+
+    results = []
+    count = 0
+
+    def report(path, image, measurement):
+        # Only the measurement is kept; the decoded image is dropped as soon as it is reported
+        if image is None:
+            print(f"Could not load image: {path}")
+            return
+        lengths = [round(fish['length_inch'], 2) for fish in measurement['fish_lengths']]
+        print(f"{path}: {len(measurement['fish_boxes'])} fish, lengths {lengths if lengths else '-'}")
+        results.append({'image': path, 'fish_boxes': [list(box) for box in measurement['fish_boxes']],
+                        'fish_lengths': lengths, 'pixels_per_inch': measurement['pixels_per_inch']})
+
+    start = time.perf_counter()
+    if args.sequential:
+        pipeline = None
+        for name, data in sources:
+            count += 1
+            report(name, *service.decode_and_measure(data))
+    else:
+        pipeline = service.build_pipeline(args.decode_workers, args.batch_size, args.measure_workers, args.queue_size)
+        # Names of the items in flight; run() yields in input order
+        names = collections.deque()
+
+        def items():
+            for name, data in sources:
+                names.append(name)
+                yield {'image_bytes': data}
+
+        for item in pipeline.run(items(), return_exceptions=True):
+            name = names.popleft()
+            count += 1
+            if isinstance(item, Exception):
+                print(f"{name}: failed: {item}")
+                continue
+            report(name, item['image'], item.get('measurement'))
+        pipeline.close()
+    elapsed = time.perf_counter() - start
+
+    print()
+    print(f"Images: {count} in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.1f} images/s)")
+    if pipeline is not None:
+        print(pipeline.format_stats())
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'images': results, 'elapsed_s': elapsed,
+                       'stages': pipeline.stats() if pipeline is not None else None}, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
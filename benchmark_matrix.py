@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Quality-versus-speed regression matrix
+Runs a labelled image set through every configuration (backend, precision,
+graph optimization, input size, confidence threshold, cascade, ...) and reports
+for each one: throughput, latency percentiles, peak RSS, fish and star recall
+and the error of the measured fish lengths against the labelled values.
+
+Every configuration runs in its own freshly spawned process, so peak RSS and
+lazily loaded state are not shared between configurations.
+
+Labels are a JSON file keyed by image name (as printed by the other tools):
+
+    {"photos/a.jpg": {"fish": [[x1, y1, x2, y2], ...], "stars": [[x1, y1, x2, y2]],
+                      "lengths_inch": [14.2, ...]}}
+
+`lengths_inch` follows the order of `fish`; null skips a fish. --make-labels
+writes this file from the first configuration, to be reviewed by hand.
+
+    python benchmark_matrix.py photos/ --labels labels.json --json matrix.json
+    python benchmark_matrix.py photos/ --labels labels.json --configs configs.json --min-recall 0.95
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+from image_io import box_iou, iter_images
+
+# Configuration keys and their defaults; 'model' and 'star_model' default to the CLI options.
+# A star model ending in .pt runs through ultralytics instead of YOLOInference.
+CONFIG_DEFAULTS = {
+    'precision': 'fp32',
+    'optimize': False,
+    'channels_last': False,
+    'imsz': 640,
+    'conf': 0.05,
+    'star_conf': 0.25,
+    'rect': False,
+    'cascade_imsz': 0,
+    'star_refine': False,
+}
+
+DEFAULT_CONFIGS = [
+    {'name': 'baseline'},
+    {'name': 'bf16', 'precision': 'bf16'},
+    {'name': 'optimized', 'optimize': True, 'channels_last': True},
+    {'name': 'optimized-bf16', 'optimize': True, 'channels_last': True, 'precision': 'bf16'},
+    {'name': 'conf-0.25', 'conf': 0.25},
+    {'name': 'cascade-320', 'cascade_imsz': 320},
+    {'name': 'rect', 'rect': True},
+    {'name': 'star-refine', 'star_refine': True},
+]
+
+
+def match_boxes(reference, candidate, iou_threshold=0.5):
+    """
+    Greedily matches candidate boxes to reference boxes by IoU.
+
+    Returns:
+        list: (reference index, candidate index) pairs.
+    """
+    pairs = sorted(((box_iou(r, c), i, j) for i, r in enumerate(reference) for j, c in enumerate(candidate)),
+                   reverse=True)
+    matched_ref, matched_cand, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i not in matched_ref and j not in matched_cand:
+            matched_ref.add(i)
+            matched_cand.add(j)
+            matches.append((i, j))
+    return matches
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def run_config(config, inputs, star_real_width=1.6):
+    """
+    Measures every image with one configuration. Runs in a worker process.
+
+    Returns:
+        dict: Per-image outputs and latencies, load time and peak RSS.
+    """
+    from finaly import FishDetector, StarDetector, detect_stars_ultralytics, fish_lengths_from_scale, refine_star
+
+    start = time.perf_counter()
+    fish_detector = FishDetector(config['model'], cascade_imsz=config['cascade_imsz'] or None, rect=config['rect'],
+                                 precision=config['precision'], imsz=config['imsz'], conf_threshold=config['conf'],
+                                 optimize=config['optimize'], channels_last=config['channels_last'])
+    if config['star_model'].endswith('.pt'):
+        def detect_stars(image):
+            return detect_stars_ultralytics(image, config['star_model'])
+    else:
+        star_detector = StarDetector(config['star_model'], conf_threshold=config['star_conf'], rect=config['rect'],
+                                     precision=config['precision'], optimize=config['optimize'],
+                                     channels_last=config['channels_last'])
+        star_detector.warm_up()
+        detect_stars = star_detector.detect_stars
+    fish_detector.warm_up()
+    load_time = time.perf_counter() - start
+
+    images = []
+    for name, image in iter_images(inputs):
+        if image is None:
+            continue
+        start = time.perf_counter()
+        fish_boxes = fish_detector.detect_fish(image)
+        star_boxes = detect_stars(image)
+        lengths = None
+        if star_boxes:
+            best_star = max(star_boxes, key=lambda s: s['conf'])
+            if config['star_refine']:
+                refined = refine_star(image, best_star, detect_stars)
+                star_boxes = [refined if star is best_star else star for star in star_boxes]
+                best_star = refined
+            x1, _, x2, _ = best_star['box']
+            pixels_per_inch = best_star.get('width_px', x2 - x1) / star_real_width
+            lengths = [fish['length_inch'] for fish in fish_lengths_from_scale(fish_boxes, pixels_per_inch)]
+        images.append({'image': name, 'latency': time.perf_counter() - start,
+                       'fish': [list(box) for box in fish_boxes],
+                       'stars': [list(star['box']) for star in star_boxes],
+                       'lengths_inch': lengths})
+
+    # ru_maxrss is in kilobytes on Linux
+    return {'load_s': load_time, 'images': images,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def score(run, labels):
+    """
+    Compares one configuration's outputs with the labels.
+
+    Returns:
+        dict: Speed, memory and accuracy figures of the configuration.
+    """
+    latencies = [image['latency'] for image in run['images']]
+    fish_total = fish_found = star_total = star_found = extra = 0
+    length_errors = []
+    for image in run['images']:
+        label = labels.get(image['image']) or labels.get(os.path.basename(image['image']))
+        if label is None:
+            continue
+        fish_matches = match_boxes(label.get('fish', []), image['fish'])
+        star_matches = match_boxes(label.get('stars', []), image['stars'])
+        fish_total += len(label.get('fish', []))
+        fish_found += len(fish_matches)
+        star_total += len(label.get('stars', []))
+        star_found += len(star_matches)
+        extra += len(image['fish']) - len(fish_matches)
+        reference_lengths = label.get('lengths_inch') or []
+        for i, j in fish_matches:
+            if i < len(reference_lengths) and reference_lengths[i] is not None and image['lengths_inch'] is not None:
+                length_errors.append(abs(image['lengths_inch'][j] - reference_lengths[i]))
+
+    total_time = sum(latencies)
+    return {
+        'images': len(latencies),
+        'load_s': round(run['load_s'], 2),
+        'throughput': round(len(latencies) / total_time, 2) if total_time else 0.0,
+        'latency_ms': {f'p{p}': round(1000 * percentile(latencies, p), 1) for p in (50, 95, 99)},
+        'peak_rss_mb': round(run['peak_rss_mb'], 1),
+        'fish_recall': round(fish_found / fish_total, 4) if fish_total else None,
+        'star_recall': round(star_found / star_total, 4) if star_total else None,
+        'extra_fish': extra,
+        'length_mae_inch': round(statistics.mean(length_errors), 3) if length_errors else None,
+        'length_max_error_inch': round(max(length_errors), 3) if length_errors else None,
+    }
+
+
+def format_table(rows):
+    def value(v, fmt):
+        return '-' if v is None else format(v, fmt)
+
+    lines = [f"{'config':<18} {'img/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>8} "
+             f"{'fish rec':>9} {'star rec':>9} {'extra':>6} {'len MAE':>8} {'len max':>8}"]
+    for row in rows:
+        if 'error' in row:
+            lines.append(f"{row['name']:<18} failed: {row['error']}")
+            continue
+        latency = row['latency_ms']
+        lines.append(f"{row['name']:<18} {row['throughput']:>7.2f} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+                     f"{latency['p99']:>8.1f} {row['peak_rss_mb']:>8.1f} {value(row['fish_recall'], '>9.1%')} "
+                     f"{value(row['star_recall'], '>9.1%')} {row['extra_fish']:>6} "
+                     f"{value(row['length_mae_inch'], '>8.3f')} {value(row['length_max_error_inch'], '>8.3f')}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speed and accuracy of many inference configurations.")
+    parser.add_argument("images", nargs="+", help="Image files, shards or directories")
+    parser.add_argument("--labels", help="JSON labels (fish and star boxes, reference lengths)")
+    parser.add_argument("--configs", help="JSON list of configurations (default: a built-in matrix)")
+    parser.add_argument("--model", default="model.ts", help="Default TorchScript fish model")
+    parser.add_argument("--star-model", default="epoch162.torchscript", help="Default star model")
+    parser.add_argument("--make-labels", help="Write labels from the first configuration to this file and stop")
+    parser.add_argument("--min-recall", type=float, help="Fail configurations with lower fish or star recall")
+    parser.add_argument("--max-length-error", type=float, help="Fail configurations with a larger length MAE")
+    parser.add_argument("--json", help="Also write the matrix to this JSON file")
+    args = parser.parse_args()
+
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    else:
+        configs = DEFAULT_CONFIGS
+    configs = [{**CONFIG_DEFAULTS, 'model': args.model, 'star_model': args.star_model, **config} for config in configs]
+    if args.make_labels:
+        configs = configs[:1]
+
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    rows = []
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        name = config.get('name') or ','.join(f"{k}={v}" for k, v in config.items() if CONFIG_DEFAULTS.get(k) != v)
+        print(f"Running {name}...")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                run = pool.submit(run_config, config, args.images).result()
+            except Exception as e:
+                rows.append({'name': name, 'config': config, 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+        if args.make_labels:
+            labels = {image['image']: {'fish': image['fish'], 'stars': image['stars'],
+                                       'lengths_inch': image['lengths_inch']} for image in run['images']}
+            with open(args.make_labels, 'w') as f:
+                json.dump(labels, f, indent=2)
+            print(f"Labels for {len(labels)} images from {name} saved to {args.make_labels}; review them before use")
+            return 0
+        rows.append({'name': name, 'config': config, **score(run, labels)})
+
+    failed = []
+    for row in rows:
+        problems = []
+        if 'error' in row:
+            problems.append('error')
+        else:
+            for key in ('fish_recall', 'star_recall'):
+                if args.min_recall is not None and row[key] is not None and row[key] < args.min_recall:
+                    problems.append(key)
+            if (args.max_length_error is not None and row['length_mae_inch'] is not None
+                    and row['length_mae_inch'] > args.max_length_error):
+                problems.append('length_mae_inch')
+        row['failed'] = problems
+        if problems:
+            failed.append(f"{row['name']} ({', '.join(problems)})")
+
+    print()
+    print(format_table(rows))
+    if not labels:
+        print("No labels given: recall and length errors are not available")
+    if failed:
+        print(f"Failed: {'; '.join(failed)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Matrix saved to {args.json}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
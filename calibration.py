@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+
+
+class Calibration:
+    def __init__(self, star_box, conf, pixels_per_inch, template, image_shape, width_px=None):
+        """
+        Scale calibration of one session: where the reference star is and how big it is.
+
+        Args:
+            star_box (tuple): (x1, y1, x2, y2) of the reference star.
+            conf (float): Detection confidence of the star.
+            pixels_per_inch (float): Scale derived from the star width.
+            template (np.ndarray): Grayscale star patch used for the quick check.
+            image_shape (tuple): (height, width) of the image it was measured on.
+            width_px (float): Sub-pixel star width from refine_star, if it was refined.
+        """
+        self.star_box = star_box
+        self.width_px = width_px
+        self.conf = conf
+        self.pixels_per_inch = pixels_per_inch
+        self.template = template
+        self.image_shape = image_shape
+        self.created_at = time.monotonic()
+        self.hits = 0
+
+    def star_boxes(self):
+        """
+        Returns the star in the format of detect_stars.
+        """
+        star = {'box': self.star_box, 'conf': self.conf}
+        if self.width_px is not None:
+            star['width_px'] = self.width_px
+        return [star]
+
+
+class CalibrationCache:
+    def __init__(self, ttl=600.0, max_sessions=1024, match_threshold=0.8, search_margin=0.5):
+        """
+        TTL'd per-session cache of star calibrations for fixed camera rigs.
+
+        Args:
+            ttl (float): Seconds after which a calibration is refreshed with full star detection.
+            max_sessions (int): Least recently used sessions are evicted beyond this.
+            match_threshold (float): Minimum normalized correlation for the quick check.
+            search_margin (float): Search window around the cached star, as a fraction of its size.
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.match_threshold = match_threshold
+        self.search_margin = search_margin
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Returns the session's calibration, or None if there is none or it expired.
+        """
+        with self._lock:
+            calibration = self._entries.get(session_id)
+            if calibration is None:
+                return None
+            if time.monotonic() - calibration.created_at > self.ttl:
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return calibration
+
+    def put(self, session_id, image, star_box, conf, pixels_per_inch, width_px=None):
+        """
+        Stores a fresh calibration measured on `image`.
+
+        Returns:
+            Calibration: The stored calibration, or None if the star box is empty (zero
+            width or height), which leaves no patch to verify later frames against; the
+            session's previous calibration is dropped then.
+        """
+        x1, y1, x2, y2 = star_box
+        patch = image[y1:y2, x1:x2]
+        if patch.size == 0:
+            self.invalidate(session_id)
+            return None
+        gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+        calibration = Calibration(star_box, conf, pixels_per_inch, gray, image.shape[:2], width_px)
+        with self._lock:
+            self._entries[session_id] = calibration
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+        return calibration
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def verify(self, calibration, image):
+        """
+        Quick check that the cached star is still where it was, at the same scale.
+
+        Matches the stored star patch against a small window around the cached box,
+        which is far cheaper than running the star model.
+
+        Returns:
+            bool: True if the calibration can be reused for `image`.
+        """
+        if image.shape[:2] != calibration.image_shape or calibration.template.size == 0:
+            return False
+
+        x1, y1, x2, y2 = calibration.star_box
+        margin_x = int((x2 - x1) * self.search_margin) + 1
+        margin_y = int((y2 - y1) * self.search_margin) + 1
+        height, width = image.shape[:2]
+        sx1, sy1 = max(0, x1 - margin_x), max(0, y1 - margin_y)
+        sx2, sy2 = min(width, x2 + margin_x), min(height, y2 + margin_y)
+
+        window = cv2.cvtColor(image[sy1:sy2, sx1:sx2], cv2.COLOR_BGR2GRAY)
+        template = calibration.template
+        if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+            return False
+
+        scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, _ = cv2.minMaxLoc(scores)
+        if best < self.match_threshold:
+            return False
+        calibration.hits += 1
+        return True
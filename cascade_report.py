@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Miss-rate report for the low-resolution fish presence cascade
+Runs every image through the single-stage detector and through the
+low-resolution presence model, then reports for each presence threshold how
+many fish images the cascade would have skipped (misses) and how much
+full-resolution work it would have saved.
+"""
+import argparse
+import json
+import time
+
+from finaly import FishDetector
+from image_io import iter_images
+from inference import YOLOInference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cascade miss rates against single-stage detection.")
+    parser.add_argument("images", nargs="+", help="Image files, shards or directories")
+    parser.add_argument("--model", default="model.ts", help="TorchScript fish model")
+    parser.add_argument("--cascade-imsz", type=int, default=320, help="Input size of the presence pass")
+    parser.add_argument("--thresholds", default="0.05,0.1,0.15,0.2,0.25,0.3,0.4,0.5",
+                        help="Comma separated presence thresholds to evaluate")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    thresholds = sorted(float(t) for t in args.thresholds.split(","))
+    detector = FishDetector(args.model)
+    presence = YOLOInference(args.model, imsz=(args.cascade_imsz, args.cascade_imsz),
+                             conf_threshold=thresholds[0], yolo_ver='v10',
+                             model=detector.yolo_inference.model,
+                             channels_last=detector.yolo_inference.channels_last)
+
+    rows = []
+    full_time = low_time = 0.0
+    for path, image in iter_images(args.images):
+        if image is None:
+            print(f"Could not load image: {path}")
+            continue
+
+        start = time.perf_counter()
+        fish_boxes = detector.detect_fish(image)
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        detections = presence.predict_detections(image)
+        low_time += time.perf_counter() - start
+
+        best_score = float(detections.scores.max()) if len(detections) else 0.0
+        rows.append({'image': path, 'fish': len(fish_boxes), 'presence_score': best_score})
+
+    if not rows:
+        print("No images processed")
+        return
+
+    total = len(rows)
+    with_fish = sum(1 for row in rows if row['fish'])
+    avg_full = full_time / total
+    avg_low = low_time / total
+    print(f"Images: {total} ({with_fish} with fish in the single-stage path)")
+    print(f"Average time: full {1000 * avg_full:.1f} ms, presence@{args.cascade_imsz} {1000 * avg_low:.1f} ms")
+    print()
+    print(f"{'threshold':>9} {'misses':>7} {'miss rate':>9} {'skipped':>8} {'skip rate':>9} {'est. ms/img':>11}")
+
+    report = []
+    for threshold in thresholds:
+        passed = [row['presence_score'] > threshold for row in rows]
+        misses = sum(1 for row, ok in zip(rows, passed) if row['fish'] and not ok)
+        skipped = passed.count(False)
+        miss_rate = misses / with_fish if with_fish else 0.0
+        skip_rate = skipped / total
+        # Every image pays the presence pass; only those that pass pay the full pass
+        est_ms = 1000 * (avg_low + (1 - skip_rate) * avg_full)
+        print(f"{threshold:>9.2f} {misses:>7} {miss_rate:>9.2%} {skipped:>8} {skip_rate:>9.2%} {est_ms:>11.1f}")
+        report.append({'threshold': threshold, 'misses': misses, 'miss_rate': miss_rate,
+                       'skipped': skipped, 'skip_rate': skip_rate, 'est_ms_per_image': est_ms})
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cascade_imsz': args.cascade_imsz, 'images': rows, 'thresholds': report,
+                       'avg_full_ms': 1000 * avg_full, 'avg_presence_ms': 1000 * avg_low}, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import contextlib
+import os
+import threading
+import time
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_in):
+        """
+        Raised instead of calling a dependency whose circuit is open.
+
+        Args:
+            name (str): Name of the guarded dependency.
+            retry_in (float): Seconds until the circuit lets a probe through.
+        """
+        super().__init__(f"{name} circuit open, next probe in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, slow_call_s=10.0, reset_timeout=30.0):
+        """
+        Consecutive-failure circuit breaker, safe to share between threads and coroutines.
+
+        After `failure_threshold` consecutive failures (a call slower than `slow_call_s`
+        counts as one) the circuit opens and calls fail immediately with CircuitOpen.
+        After `reset_timeout` seconds one probe call is let through (half-open): its
+        success closes the circuit, its failure opens it again.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_s = slow_call_s
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    @classmethod
+    def from_env(cls, name, prefix):
+        """
+        Builds a breaker from <prefix>_BREAKER_FAILURES, <prefix>_BREAKER_SLOW_S and <prefix>_BREAKER_RESET_S.
+        """
+        return cls(
+            name,
+            failure_threshold=int(os.getenv(f'{prefix}_BREAKER_FAILURES', '5')),
+            slow_call_s=float(os.getenv(f'{prefix}_BREAKER_SLOW_S', '10')),
+            reset_timeout=float(os.getenv(f'{prefix}_BREAKER_RESET_S', '30')),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def acquire(self):
+        """
+        Admits one call, or raises CircuitOpen.
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, retry_in)
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, 0.0)
+                self._probing = True
+
+    def record_success(self, duration):
+        if duration > self.slow_call_s:
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Ends a call that says nothing about the dependency's health (e.g. the caller gave up).
+        """
+        with self._lock:
+            self._probing = False
+
+    @contextlib.contextmanager
+    def guard(self, ignore=()):
+        """
+        Runs the with-block as one guarded call; works around awaits as well.
+
+        Args:
+            ignore (tuple): Exception types that end the call without counting as a failure.
+
+        Raises:
+            CircuitOpen: If the circuit does not admit the call.
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except ignore:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancellation: the caller gave up, not the dependency
+            self.release()
+            raise
+        else:
+            self.record_success(time.monotonic() - start)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,75 @@
+import os
+import time
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage):
+        """
+        Raised when a stage cannot start (or continue) within the request's time budget.
+
+        Args:
+            stage (str): Name of the stage that ran out of budget.
+        """
+        super().__init__(f"Deadline exceeded before {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, budget_s):
+        """
+        Time budget of one request, propagated through detection, star detection and every Fishial hop.
+
+        Args:
+            budget_s (float): Seconds from now until the request must be answered.
+        """
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    @classmethod
+    def from_headers(cls, headers):
+        """
+        Reads the budget from the X-Request-Deadline-Ms header, falling back to REQUEST_DEADLINE_S.
+        """
+        budget_ms = headers.get(DEADLINE_HEADER)
+        if budget_ms:
+            try:
+                return cls(max(0.0, float(budget_ms) / 1000))
+            except ValueError:
+                pass
+        return cls.from_timeout(None)
+
+    @classmethod
+    def from_timeout(cls, timeout_s):
+        """
+        Budget of a caller-supplied timeout in seconds (e.g. a gRPC deadline), or
+        REQUEST_DEADLINE_S when the caller set none.
+        """
+        if timeout_s is None:
+            return cls(float(os.getenv('REQUEST_DEADLINE_S', '30')))
+        return cls(max(0.0, timeout_s))
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        """
+        Raises DeadlineExceeded if there is no budget left to start `stage`.
+        """
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, stage, cap=None):
+        """
+        Timeout for one network hop: whatever budget is left, optionally capped.
+
+        Raises:
+            DeadlineExceeded: If nothing is left.
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        return min(remaining, cap) if cap else remaining
@@ -1,4 +1,5 @@
 import cv2
+from finaly import draw_boxes
 from inference import YOLOInference
 
 class FishDetector:
@@ -19,38 +20,35 @@ class FishDetector:
             list: List of fish bounding boxes as (x1, y1, x2, y2)
         """
         try:
-            results = self.yolo_inference.predict(image)
-            fish_boxes = []
-
-            if results and results[0]:
-                for result in results[0]:
-                    # Take all detected objects as fish (or filter by class if needed)
-                    fish_boxes.append(result.get_box())
-
-            return fish_boxes
+            # Take all detected objects as fish (or filter by class if needed)
+            detections = self.yolo_inference.predict_detections(image)
+            return detections.get_boxes(0)
 
         except Exception as e:
             print(f"Error in fish detection: {e}")
             return []
 
-    def draw_fish_boxes(self, image, fish_boxes):
+    def draw_fish_boxes(self, image, fish_boxes, max_side=None):
         """
         Draw bounding boxes around detected fish.
 
         Args:
             image (numpy.ndarray): Input image
             fish_boxes (list): List of bounding boxes
+            max_side (int): Downscale the drawn image so its longer side is at most
+                this many pixels instead of copying it at full resolution
 
         Returns:
             numpy.ndarray: Image with bounding boxes drawn
         """
-        result_image = image.copy()
-        for i, box in enumerate(fish_boxes):
-            x1, y1, x2, y2 = box
-            cv2.rectangle(result_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(result_image, f"Fish {i+1}", (x1, y1-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        return result_image
+        scale = 1.0
+        if max_side:
+            height, width = image.shape[:2]
+            scale = min(1.0, max_side / max(height, width))
+            if scale < 1.0:
+                image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        return draw_boxes(image, fish_boxes, [], scale=scale)
 
 
 def main():
@@ -66,7 +64,7 @@ def main():
     for i, box in enumerate(fish_boxes):
         print(f"Fish {i+1}: Bounding box = {box}")
 
-    result_image = detector.draw_fish_boxes(image, fish_boxes)
+    result_image = detector.draw_fish_boxes(image, fish_boxes, max_side=1024)
     cv2.imwrite("fish_boxes_result.jpg", result_image)
     print("Result saved to fish_boxes_result.jpg")
 
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+One-time export of the ultralytics star model to TorchScript
+The serving path (finaly.StarDetector) runs the export through YOLOInference,
+so only this script and star_parity.py still need ultralytics.
+
+    python export_star_model.py --weights epoch162.pt
+"""
+import argparse
+import os
+import shutil
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the star model to TorchScript for YOLOInference.")
+    parser.add_argument("--weights", default="epoch162.pt", help="ultralytics star model weights")
+    parser.add_argument("--imgsz", type=int, default=640, help="Square input size of the export")
+    parser.add_argument("--output", help="Where to write the export (default: next to the weights, .torchscript)")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.weights)
+    # TorchScript rather than ONNX: YOLOInference loads models with torch.jit
+    exported = model.export(format='torchscript', imgsz=args.imgsz)
+    if args.output and os.path.abspath(args.output) != os.path.abspath(exported):
+        shutil.move(exported, args.output)
+        exported = args.output
+
+    print(f"Star model exported to {exported}")
+    print(f"Serve it with STAR_MODEL_PATH={exported} and check it with star_parity.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,205 @@
+import copy
+import functools
+import math
+import threading
+
 import cv2
-from inference import YOLOInference
-from ultralytics import YOLO
+import numpy as np
+from inference import Detections, YOLOInference
 
 # ----- Fish Detector -----
 class FishDetector:
-    def __init__(self, model_path="model.ts"):
-        self.yolo_inference = YOLOInference(model_path, yolo_ver='v10')
+    def __init__(self, model_path="model.ts", cascade_imsz=None, presence_threshold=0.25, rect=False, precision=None,
+                 imsz=640, conf_threshold=0.05, optimize=None, channels_last=None):
+        """
+        Args:
+            model_path (str): TorchScript fish model
+            cascade_imsz (int): If set, first run the same model at this input size and
+                skip full-resolution inference when no fish passes `presence_threshold`.
+                Requires a model exported with dynamic input shapes; disabled with a
+                warning otherwise.
+            presence_threshold (float): Score a low-resolution box needs to count as a fish.
+            rect (bool): Minimal-padding rectangular inference, for dynamic-shape models.
+            precision (str): 'fp32', 'bf16', 'fp16' or 'auto'; defaults to INFERENCE_PRECISION.
+            imsz (int): Square input size of full-resolution inference.
+            conf_threshold (float): Minimum fish score.
+            optimize (bool): Freeze and optimize the model; defaults to MODEL_OPTIMIZE.
+            channels_last (bool): channels_last weights and inputs; defaults to MODEL_CHANNELS_LAST.
+        """
+        self.yolo_inference = YOLOInference(model_path, imsz=(imsz, imsz), conf_threshold=conf_threshold,
+                                            yolo_ver='v10', rect=rect, precision=precision,
+                                            optimize=optimize, channels_last=channels_last)
+        self.presence_threshold = presence_threshold
+        self.presence_inference = None
+        if cascade_imsz:
+            self.presence_inference = YOLOInference(model_path, imsz=(cascade_imsz, cascade_imsz),
+                                                    conf_threshold=presence_threshold, yolo_ver='v10',
+                                                    model=self.yolo_inference.model,
+                                                    rect=self.yolo_inference.rect,
+                                                    precision=self.yolo_inference.precision,
+                                                    channels_last=self.yolo_inference.channels_last)
+            # A static-shape export fails every presence forward, which would report every image as empty
+            if not self.presence_inference.supports_dynamic_shapes():
+                print(f"Warning: fish model only runs at {imsz}, presence cascade at {cascade_imsz} disabled")
+                self.presence_inference = None
+
+    def scaled(self, imsz):
+        """
+        The same detector at another square input size, sharing the loaded weights and
+        without the presence cascade; used for low-latency live previews.
+
+        Returns:
+            FishDetector: The scaled detector, or self if imsz is the current size or the
+                model does not accept other input shapes.
+        """
+        inference = self.yolo_inference
+        if (imsz, imsz) == inference.imsz:
+            return self
+        scaled_inference = YOLOInference(None, imsz=(imsz, imsz), conf_threshold=inference.conf_threshold,
+                                         yolo_ver='v10', model=inference.model, rect=inference.rect,
+                                         precision=inference.precision, channels_last=inference.channels_last)
+        if not scaled_inference.supports_dynamic_shapes():
+            print(f"Warning: fish model only runs at {inference.imsz[0]}, not {imsz}")
+            return self
+        detector = copy.copy(self)
+        detector.yolo_inference = scaled_inference
+        detector.presence_inference = None
+        return detector
+
+    def has_fish(self, image):
+        """
+        Cheap low-resolution presence check. Always True when the cascade is disabled.
+        """
+        if self.presence_inference is None:
+            return True
+        return len(self.presence_inference.predict_detections(image)) > 0
 
     def detect_fish(self, image):
         try:
-            results = self.yolo_inference.predict(image)
-            fish_boxes = []
-            if results and results[0]:
-                for result in results[0]:
-                    fish_boxes.append(result.get_box())
-            return fish_boxes
+            if not self.has_fish(image):
+                return []
+            detections = self.yolo_inference.predict_detections(image)
+            return detections.get_boxes(0)
         except Exception as e:
             print(f"Error in fish detection: {e}")
             return []
 
+    def detect(self, images):
+        """
+        Batch detection with the presence cascade, as compact Detections.
+
+        Returns:
+            Detections: Fish of every image, in batch order.
+        """
+        shapes = [image.shape[:2] for image in images]
+        candidates = list(range(len(images)))
+        if self.presence_inference is not None:
+            presence = self.presence_inference.predict_detections(images)
+            candidates = sorted(set(presence.data['image'].tolist()))
+        if not candidates:
+            return Detections.empty(shapes)
+        detections = self.yolo_inference.predict_detections([images[i] for i in candidates])
+        if len(candidates) == len(images):
+            return detections
+        return Detections.merge([(candidates, detections)], shapes)
+
+    def detect_fish_batch(self, images):
+        """
+        Detects fish in several images with one forward per shape bucket.
+
+        Returns:
+            list: One list of (x1, y1, x2, y2) boxes per image.
+        """
+        try:
+            detections = self.detect(images)
+            return [detections.get_boxes(index) for index in range(len(images))]
+        except Exception as e:
+            print(f"Error in fish detection: {e}")
+            return [[] for _ in images]
+
+    def warm_up(self, runs=1, shape=(480, 640, 3)):
+        """
+        Runs the full-size and presence models on a dummy image, so the first request
+        does not pay for lazy initialisation and the first forward pass.
+        """
+        dummy = np.full(shape, 114, dtype=np.uint8)
+        for _ in range(runs):
+            self.yolo_inference.predict_detections(dummy)
+            if self.presence_inference is not None:
+                self.presence_inference.predict_detections(dummy)
+
 # ----- Star Detection -----
-def detect_stars(image, model_path="epoch162.pt"):
-    model = YOLO(model_path)
-    results = model(image)
+class StarDetector:
+    def __init__(self, model_path="epoch162.torchscript", conf_threshold=0.25, nms_threshold=0.7, rect=False,
+                 precision=None, imsz=640, optimize=None, channels_last=None):
+        """
+        Star detector on the same YOLOInference path as the fish model, for a TorchScript
+        export of the ultralytics star model (see export_star_model.py).
+
+        Args:
+            model_path (str): TorchScript star model
+            conf_threshold (float): Minimum star score, as ultralytics' default `conf`.
+            nms_threshold (float): NMS IoU threshold, as ultralytics' default `iou`.
+            rect (bool): Minimal-padding rectangular inference, for dynamic-shape exports.
+            precision (str): 'fp32', 'bf16', 'fp16' or 'auto'; defaults to INFERENCE_PRECISION.
+            imsz (int): Square input size; must match the export unless it has dynamic shapes.
+            optimize (bool): Freeze and optimize the model; defaults to MODEL_OPTIMIZE.
+            channels_last (bool): channels_last weights and inputs; defaults to MODEL_CHANNELS_LAST.
+        """
+        # ultralytics pads with 114 gray and keeps boxes of any size
+        self.yolo_inference = YOLOInference(model_path, imsz=(imsz, imsz), conf_threshold=conf_threshold,
+                                            nms_threshold=nms_threshold, yolo_ver='v8', rect=rect,
+                                            pad_color=(114, 114, 114), min_size=0, precision=precision,
+                                            optimize=optimize, channels_last=channels_last)
+
+    @staticmethod
+    def to_star_boxes(detections, index=0):
+        rows = detections.data[detections.data['image'] == index]
+        boxes = detections.boxes_of(rows).tolist()
+        return [{'box': tuple(box), 'conf': float(conf)} for box, conf in zip(boxes, rows['score'].tolist())]
+
+    def detect_stars(self, image):
+        return self.to_star_boxes(self.yolo_inference.predict_detections(image))
+
+    def detect_stars_batch(self, images):
+        """
+        Returns:
+            list: One list of {'box', 'conf'} dicts per image.
+        """
+        detections = self.yolo_inference.predict_detections(images)
+        return [self.to_star_boxes(detections, index) for index in range(len(images))]
+
+    def warm_up(self, runs=1, shape=(480, 640, 3)):
+        dummy = np.full(shape, 114, dtype=np.uint8)
+        for _ in range(runs):
+            self.yolo_inference.predict_detections(dummy)
+
+@functools.lru_cache(maxsize=None)
+def load_star_detector(model_path="epoch162.torchscript"):
+    """
+    Loads the TorchScript star detector once per path.
+    """
+    return StarDetector(model_path)
+
+# The cached ultralytics model is shared by the Flask, ASGI and gRPC threads, and its
+# predictor keeps per-call state, so calls into it are serialized
+_star_model_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def load_star_model(model_path="epoch162.pt"):
+    """
+    Loads the ultralytics star model once per path; ultralytics is only imported when it is first needed.
+    """
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+def detect_stars_ultralytics(image, model_path="epoch162.pt"):
+    """
+    Star detection through ultralytics on the original .pt weights (reference for star_parity.py).
+    """
+    model = load_star_model(model_path)
+    with _star_model_lock:
+        results = model(image)
     
     star_boxes = []
     for result in results:
@@ -33,15 +210,83 @@ def detect_stars(image, model_path="epoch162.pt"):
             star_boxes.append({'box': (x1, y1, x2, y2), 'conf': float(conf)})
     return star_boxes
 
+def detect_stars(image, model_path="epoch162.torchscript"):
+    """
+    Detects reference stars. TorchScript exports run through YOLOInference; .pt weights
+    still go through ultralytics, which is then needed at runtime.
+
+    Returns:
+        list: {'box': (x1, y1, x2, y2), 'conf': float} for every star.
+    """
+    if model_path.endswith('.pt'):
+        return detect_stars_ultralytics(image, model_path)
+    return load_star_detector(model_path).detect_stars(image)
+
+def refine_star(image, star, detect, context=1.5, upscale_to=640):
+    """
+    Second star pass for a precise scale. The first pass sees the star in a heavily
+    downscaled frame, where one pixel of box error is several source pixels of width.
+    This cuts a small full-resolution crop around the star, upscales it to the model
+    input size and detects again, which gives the width to a fraction of a source pixel.
+
+    Args:
+        image (np.ndarray): Full-resolution BGR image the star was detected on.
+        star (dict): {'box', 'conf'} from the first pass.
+        detect (callable): Star detection on one image, e.g. load_star_detector(path).detect_stars.
+        context (float): Margin around the star on each side, in star sizes.
+        upscale_to (int): Longer side the crop is enlarged to (crops are never shrunk).
+
+    Returns:
+        dict: The star with the refined 'box' and a fractional 'width_px', or the star
+            unchanged if the second pass finds no star at that place.
+    """
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = star['box']
+    side = max(x2 - x1, y2 - y1) * (1 + 2 * context)
+    center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
+    crop_x1, crop_y1 = max(0, int(center_x - side / 2)), max(0, int(center_y - side / 2))
+    crop_x2 = min(width, int(math.ceil(center_x + side / 2)))
+    crop_y2 = min(height, int(math.ceil(center_y + side / 2)))
+    crop = image[crop_y1:crop_y2, crop_x1:crop_x2]
+    if crop.size == 0:
+        return star
+
+    crop_h, crop_w = crop.shape[:2]
+    scale = upscale_to / max(crop_h, crop_w)
+    if scale > 1:
+        crop = cv2.resize(crop, (round(crop_w * scale), round(crop_h * scale)), interpolation=cv2.INTER_LINEAR)
+    scale_x, scale_y = crop.shape[1] / crop_w, crop.shape[0] / crop_h
+
+    # Back to image pixels; only stars centred inside the first-pass box count
+    candidates = []
+    for candidate in detect(crop):
+        cx1, cy1, cx2, cy2 = candidate['box']
+        box = (crop_x1 + cx1 / scale_x, crop_y1 + cy1 / scale_y, crop_x1 + cx2 / scale_x, crop_y1 + cy2 / scale_y)
+        if x1 <= (box[0] + box[2]) / 2 <= x2 and y1 <= (box[1] + box[3]) / 2 <= y2:
+            candidates.append((candidate['conf'], box))
+    if not candidates:
+        return star
+
+    _, box = max(candidates)
+    return {'box': tuple(int(round(v)) for v in box), 'conf': star['conf'], 'width_px': box[2] - box[0]}
+
 # ----- Draw boxes and add info -----
-def draw_boxes(image, fish_boxes, star_boxes, pixels_per_inch=None, fish_lengths=None):
+def draw_boxes(image, fish_boxes, star_boxes, pixels_per_inch=None, fish_lengths=None, scale=1.0):
+    """
+    Draws fish and star boxes with their sizes. With `scale` != 1 the boxes (given in
+    full-resolution pixels) are drawn on a resized image while labels keep the original sizes.
+    """
     result_image = image.copy()
+
+    def to_image(box):
+        return tuple(int(round(v * scale)) for v in box)
     
     # Draw fish boxes
     for i, box in enumerate(fish_boxes):
         x1, y1, x2, y2 = box
         width = x2 - x1
         height = y2 - y1
+        x1, y1, x2, y2 = to_image(box)
         cv2.rectangle(result_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
         length_in = fish_lengths[i]['length_inch'] if fish_lengths else 0
         cv2.putText(result_image, f"Fish {i+1}: {width}px x {height}px, {length_in:.2f}\"",
@@ -52,6 +297,7 @@ def draw_boxes(image, fish_boxes, star_boxes, pixels_per_inch=None, fish_lengths
         x1, y1, x2, y2 = star['box']
         width = x2 - x1
         height = y2 - y1
+        x1, y1, x2, y2 = to_image(star['box'])
         cv2.rectangle(result_image, (x1, y1), (x2, y2), (0, 0, 255), 2)
         if pixels_per_inch:
             cv2.putText(result_image, f"Star {i+1}: {width}px x {height}px, PPI={pixels_per_inch:.2f}",
@@ -71,10 +317,17 @@ def calculate_fish_lengths(fish_boxes, star_boxes, star_real_width=1.6):
     # Use the star with highest confidence
     best_star = max(star_boxes, key=lambda x: x['conf'])
     x1, y1, x2, y2 = best_star['box']
-    star_pixel_width = x2 - x1
+    # Refined stars (see refine_star) carry a sub-pixel width
+    star_pixel_width = best_star.get('width_px', x2 - x1)
     pixels_per_inch = star_pixel_width / star_real_width
     print(f"Using star width {star_real_width}\" -> pixels_per_inch = {pixels_per_inch:.2f}")
 
+    return fish_lengths_from_scale(fish_boxes, pixels_per_inch), pixels_per_inch
+
+def fish_lengths_from_scale(fish_boxes, pixels_per_inch):
+    """
+    Measures fish boxes with an already known scale, e.g. one reused from an earlier frame.
+    """
     fish_lengths = []
     for box in fish_boxes:
         x1, y1, x2, y2 = box
@@ -84,7 +337,7 @@ def calculate_fish_lengths(fish_boxes, star_boxes, star_real_width=1.6):
         fish_length_in = fish_length_px / pixels_per_inch
         fish_lengths.append({'box': box, 'length_inch': fish_length_in, 'width_px': width, 'height_px': height})
     
-    return fish_lengths, pixels_per_inch
+    return fish_lengths
 
 # ----- Main function -----
 def main():
@@ -100,7 +353,7 @@ def main():
     print(f"Detected {len(fish_boxes)} fish")
 
     # Detect stars
-    star_boxes = detect_stars(image, "epoch162.pt")
+    star_boxes = detect_stars(image, "epoch162.torchscript")
     print(f"Detected {len(star_boxes)} stars")
 
     # Calculate fish lengths
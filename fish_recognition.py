@@ -3,18 +3,27 @@
 Fish Recognition Integration Module
 Integrates with the Fishial API to recognize fish species
 """
+import asyncio
 import os
+import random
 import sys
+import threading
+import time
 import json
 import requests
+import httpx
 import hashlib
 import base64
 import mimetypes
 import urllib3
 import logging
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from deadline import DeadlineExceeded
+
 # Load environment variables
 load_dotenv('config.env')
 
@@ -34,6 +43,25 @@ class FishRecognition:
         
         if not self.api_key or not self.secret_key:
             raise ValueError("FISHIAL_API_KEY and FISHIAL_SECRET_KEY must be set in config.env")
+
+        # Base URLs can be pointed at a local stub (see fishial_stub.py) for offline benchmarking
+        self.auth_base_url = os.getenv('FISHIAL_AUTH_URL', 'https://api-users.fishial.ai').rstrip('/')
+        self.api_base_url = os.getenv('FISHIAL_API_URL', 'https://api.fishial.ai').rstrip('/')
+
+        # Upper bound for any single Fishial hop; a request deadline can shorten it further
+        self.timeout = float(os.getenv('FISHIAL_TIMEOUT', '30'))
+        # Concurrent crop uploads per request in the thread-based flow
+        self.max_parallel_uploads = int(os.getenv('FISHIAL_MAX_PARALLEL_UPLOADS', '8'))
+
+        # Bounded retries of failed hops with jittered exponential backoff (0 = no retries)
+        self.retries = int(os.getenv('FISHIAL_RETRIES', '0'))
+        self.retry_backoff = float(os.getenv('FISHIAL_RETRY_BACKOFF', '0.2'))
+        # Send a second recognition GET if the first has not answered after this many seconds (0 = off)
+        self.hedge_delay = float(os.getenv('FISHIAL_HEDGE_DELAY', '0'))
+        self._hedge_executor = None
+
+        # Skip lookups while Fishial keeps failing or is too slow, probing now and then
+        self.breaker = CircuitBreaker.from_env('fishial', 'FISHIAL')
     
     def get_file_metadata(self, image_data, filename="fish.jpg"):
         """
@@ -46,107 +74,441 @@ class FishRecognition:
         checksum = base64.b64encode(hasher.digest()).decode("utf-8")
         return filename, mime, size, checksum
     
-    def recognize_fish_species(self, image_data, filename="fish.jpg"):
+    def auth_request(self):
+        """
+        Returns the URL and JSON payload of the auth token request
+        """
+        auth_url = f"{self.auth_base_url}/v1/auth/token"
+        auth_payload = {"client_id": self.api_key, "client_secret": self.secret_key}
+        return auth_url, auth_payload
+
+    def upload_request(self, name, mime, size, checksum):
+        """
+        Returns the URL and JSON payload of the upload URL request
+        """
+        upload_url_api = f"{self.api_base_url}/v1/recognition/upload"
+        upload_payload = {
+            "blob": {
+                "filename": name,
+                "content_type": mime,
+                "byte_size": size,
+                "checksum": checksum,
+            }
+        }
+        return upload_url_api, upload_payload
+
+    @staticmethod
+    def parse_auth(auth_data):
+        auth_token = auth_data.get("access_token")
+        if not auth_token:
+            raise Exception("Failed to obtain access token")
+        return {"Authorization": f"Bearer {auth_token}"}
+
+    @staticmethod
+    def parse_upload(upload_data, checksum):
+        """
+        Extracts the signed id, direct upload URL and upload headers from the upload URL response
+        """
+        signed_id = upload_data.get("signed-id")
+        direct_upload = upload_data.get("direct-upload", {})
+        direct_upload_url = direct_upload.get("url")
+        direct_upload_headers = direct_upload.get("headers", {})
+        content_disposition = direct_upload_headers.get("Content-Disposition")
+        
+        if not (signed_id and direct_upload_url and content_disposition):
+            raise Exception("Missing upload information in response")
+        
+        put_headers = {
+            "Content-Disposition": content_disposition,
+            "Content-Md5": checksum,
+            "Content-Type": "",
+        }
+        return signed_id, direct_upload_url, put_headers
+
+    def recognition_url(self, signed_id):
+        return f"{self.api_base_url}/v1/recognition/image?q={signed_id}"
+
+    @staticmethod
+    def parse_species(recognition_data):
+        """
+        Flattens the recognition response into a list of {name, accuracy} dicts
+        """
+        results = recognition_data.get("results", [])
+        fish_species = []
+        
+        for fish in results:
+            species_list = fish.get("species", [])
+            for species in species_list:
+                species_name = species.get("name", "Unknown")
+                accuracy = species.get("accuracy", 0)
+                fish_species.append({
+                    "name": species_name,
+                    "accuracy": accuracy
+                })
+        
+        return fish_species
+
+    def hop_timeout(self, stage, deadline=None):
+        """
+        Timeout of one Fishial hop: the configured cap, shortened to the request's remaining budget.
+
+        Raises:
+            DeadlineExceeded: If the request has no budget left for this hop.
+        """
+        if deadline is None:
+            return self.timeout
+        return deadline.timeout(stage, cap=self.timeout)
+
+    @staticmethod
+    def retryable(error):
+        """
+        True for failures worth another attempt: connection errors, timeouts, 429 and 5xx.
+        """
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None:
+            return status == 429 or status >= 500
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError))
+
+    def backoff_delay(self, attempt, deadline=None):
+        """
+        Full-jitter exponential backoff, never sleeping past the request's deadline.
+        """
+        delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+        if deadline is not None:
+            delay = min(delay, deadline.remaining())
+        return delay
+
+    def _send(self, method, url, stage, deadline=None, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                response = requests.request(method, url, timeout=self.hop_timeout(stage, deadline), verify=False,
+                                            **kwargs)
+                response.raise_for_status()
+                return response
+            except requests.RequestException as e:
+                if isinstance(e, requests.Timeout) and deadline is not None and deadline.expired():
+                    # The request ran out of budget; not a sign that Fishial is unhealthy
+                    raise DeadlineExceeded(stage) from e
+                if attempt >= self.retries or not self.retryable(e):
+                    raise
+                logging.warning(f"Retrying {stage} after error: {e}")
+                time.sleep(self.backoff_delay(attempt, deadline))
+
+    async def _send_async(self, client, method, url, stage, deadline=None, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                response = await client.request(method, url, timeout=self.hop_timeout(stage, deadline), **kwargs)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if isinstance(e, httpx.TimeoutException) and deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(stage) from e
+                if attempt >= self.retries or not self.retryable(e):
+                    raise
+                logging.warning(f"Retrying {stage} after error: {e}")
+                await asyncio.sleep(self.backoff_delay(attempt, deadline))
+
+    def _get_hedged(self, url, stage, deadline=None, **kwargs):
+        """
+        GET that sends a second copy when the first is slower than hedge_delay; the first answer wins.
+        """
+        if not self.hedge_delay:
+            return self._send("GET", url, stage, deadline, **kwargs)
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='fishial-hedge')
+
+        pending = {self._hedge_executor.submit(self._send, "GET", url, stage, deadline, **kwargs)}
+        done, _ = wait(pending, timeout=self.hedge_delay)
+        if not done:
+            pending.add(self._hedge_executor.submit(self._send, "GET", url, stage, deadline, **kwargs))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _get_hedged_async(self, client, url, stage, deadline=None, **kwargs):
+        if not self.hedge_delay:
+            return await self._send_async(client, "GET", url, stage, deadline, **kwargs)
+
+        pending = {asyncio.ensure_future(self._send_async(client, "GET", url, stage, deadline, **kwargs))}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if not done:
+                pending.add(asyncio.ensure_future(self._send_async(client, "GET", url, stage, deadline, **kwargs)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The slower copy is no longer needed
+            for task in pending:
+                task.cancel()
+
+    def authenticate(self, deadline=None):
+        """
+        Obtains an auth token and returns the Authorization header for the other hops.
+        """
+        auth_url, auth_payload = self.auth_request()
+        auth_response = self._send("POST", auth_url, "fishial_auth", deadline, json=auth_payload,
+                                   headers={"Content-Type": "application/json"})
+        return self.parse_auth(auth_response.json())
+
+    def recognize_authenticated(self, auth_header, image_data, filename="fish.jpg", deadline=None):
+        """
+        Uploads one image and runs recognition on it with an existing auth header.
+        """
+        # Get file metadata
+        name, mime, size, checksum = self.get_file_metadata(image_data, filename)
+        
+        # Step 2: Obtain upload URL
+        upload_url_api, upload_payload = self.upload_request(name, mime, size, checksum)
+        headers = auth_header.copy()
+        headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+        upload_response = self._send("POST", upload_url_api, "fishial_upload_url", deadline,
+                                     json=upload_payload, headers=headers)
+        signed_id, direct_upload_url, put_headers = self.parse_upload(upload_response.json(), checksum)
+        
+        # Step 3: Upload file
+        self._send("PUT", direct_upload_url, "fishial_upload", deadline, data=image_data, headers=put_headers)
+        
+        # Step 4: Run recognition
+        recognition_response = self._get_hedged(self.recognition_url(signed_id), "fishial_recognition",
+                                                deadline, headers=auth_header)
+        
+        # Extract results
+        return self.parse_species(recognition_response.json())
+
+    def recognize(self, image_data, filename="fish.jpg", deadline=None):
+        """
+        Runs the four Fishial hops and returns the species list.
+
+        Args:
+            deadline (Deadline): Optional request budget; every hop gets at most what is left.
+
+        Raises:
+            Exception: On any failure, including DeadlineExceeded and timeouts.
+        """
+        with self.breaker.guard(ignore=(DeadlineExceeded,)):
+            # Step 1: Obtain auth token
+            auth_header = self.authenticate(deadline)
+            return self.recognize_authenticated(auth_header, image_data, filename, deadline)
+
+    def recognize_crops(self, crops, deadline=None):
+        """
+        Recognizes several fish crops with one auth token and concurrent uploads.
+
+        Args:
+            crops (list): Encoded JPEG bytes, one per fish.
+
+        Returns:
+            tuple: (one species list per crop, True if every lookup completed)
+        """
+        if not crops:
+            return [], True
+
+        def recognize_one(auth_header, index):
+            try:
+                return self.recognize_authenticated(auth_header, crops[index], f"fish_{index}.jpg", deadline), None
+            except Exception as e:
+                logging.error(f"Error in fish recognition of crop {index}: {e}")
+                return [], e
+
+        with self.breaker.guard(ignore=(DeadlineExceeded,)):
+            auth_header = self.authenticate(deadline)
+            with ThreadPoolExecutor(max_workers=min(len(crops), self.max_parallel_uploads)) as executor:
+                results = list(executor.map(lambda index: recognize_one(auth_header, index), range(len(crops))))
+            errors = [error for _, error in results if error is not None]
+            if len(errors) == len(crops):
+                # Nothing got through: count it against Fishial
+                raise errors[0]
+        return [species for species, _ in results], not errors
+
+    def recognize_fish_species(self, image_data, filename="fish.jpg", deadline=None):
         """
         Recognize fish species from image data
         Returns list of fish species with accuracy scores
         """
         try:
-            # Get file metadata
-            name, mime, size, checksum = self.get_file_metadata(image_data, filename)
-            
-            # Step 1: Obtain auth token
-            auth_url = "https://api-users.fishial.ai/v1/auth/token"
-            auth_payload = {"client_id": self.api_key, "client_secret": self.secret_key}
-            
-            auth_response = requests.post(
-                auth_url,
-                json=auth_payload,
-                headers={"Content-Type": "application/json"},
-                verify=False,
-            )
-            auth_response.raise_for_status()
-            auth_data = auth_response.json()
-            auth_token = auth_data.get("access_token")
-            
-            if not auth_token:
-                raise Exception("Failed to obtain access token")
-            
-            auth_header = {"Authorization": f"Bearer {auth_token}"}
-            
-            # Step 2: Obtain upload URL
-            upload_url_api = "https://api.fishial.ai/v1/recognition/upload"
-            upload_payload = {
-                "blob": {
-                    "filename": name,
-                    "content_type": mime,
-                    "byte_size": size,
-                    "checksum": checksum,
-                }
-            }
-            headers = auth_header.copy()
-            headers.update({"Content-Type": "application/json", "Accept": "application/json"})
-            
-            upload_response = requests.post(
-                upload_url_api, json=upload_payload, headers=headers, verify=False
-            )
-            upload_response.raise_for_status()
-            upload_data = upload_response.json()
-            
-            signed_id = upload_data.get("signed-id")
-            direct_upload = upload_data.get("direct-upload", {})
-            direct_upload_url = direct_upload.get("url")
-            direct_upload_headers = direct_upload.get("headers", {})
-            content_disposition = direct_upload_headers.get("Content-Disposition")
-            
-            if not (signed_id and direct_upload_url and content_disposition):
-                raise Exception("Missing upload information in response")
-            
-            # Step 3: Upload file
-            put_headers = {
-                "Content-Disposition": content_disposition,
-                "Content-Md5": checksum,
-                "Content-Type": "",
-            }
-            
-            upload_response = requests.put(
-                direct_upload_url, data=image_data, headers=put_headers, verify=False
-            )
-            upload_response.raise_for_status()
-            
-            # Step 4: Run recognition
-            recognition_url = f"https://api.fishial.ai/v1/recognition/image?q={signed_id}"
-            recognition_response = requests.get(recognition_url, headers=auth_header, verify=False)
-            recognition_response.raise_for_status()
-            recognition_data = recognition_response.json()
-            
-            # Extract results
-            results = recognition_data.get("results", [])
-            fish_species = []
-            
-            for fish in results:
-                species_list = fish.get("species", [])
-                for species in species_list:
-                    species_name = species.get("name", "Unknown")
-                    accuracy = species.get("accuracy", 0)
-                    fish_species.append({
-                        "name": species_name,
-                        "accuracy": accuracy
-                    })
-            
-            return fish_species
-            
+            return self.recognize(image_data, filename, deadline)
         except Exception as e:
             logging.error(f"Error in fish recognition: {e}")
             return []
 
+    async def authenticate_async(self, client, deadline=None):
+        auth_url, auth_payload = self.auth_request()
+        auth_response = await self._send_async(client, "POST", auth_url, "fishial_auth", deadline,
+                                               json=auth_payload, headers={"Content-Type": "application/json"})
+        return self.parse_auth(auth_response.json())
+
+    async def recognize_authenticated_async(self, client, auth_header, image_data, filename="fish.jpg",
+                                            deadline=None):
+        name, mime, size, checksum = self.get_file_metadata(image_data, filename)
+
+        upload_url_api, upload_payload = self.upload_request(name, mime, size, checksum)
+        headers = auth_header.copy()
+        headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+        upload_response = await self._send_async(client, "POST", upload_url_api, "fishial_upload_url", deadline,
+                                                 json=upload_payload, headers=headers)
+        signed_id, direct_upload_url, put_headers = self.parse_upload(upload_response.json(), checksum)
+
+        await self._send_async(client, "PUT", direct_upload_url, "fishial_upload", deadline,
+                               content=image_data, headers=put_headers)
+
+        recognition_response = await self._get_hedged_async(client, self.recognition_url(signed_id),
+                                                            "fishial_recognition", deadline, headers=auth_header)
+        return self.parse_species(recognition_response.json())
+
+    async def recognize_async(self, image_data, filename="fish.jpg", client=None, deadline=None):
+        """
+        Same flow as recognize, awaiting every hop instead of blocking a thread.
+
+        Args:
+            client (httpx.AsyncClient): Shared client; a temporary one is created if omitted.
+        """
+        if client is None:
+            async with httpx.AsyncClient(verify=False) as client:
+                return await self.recognize_async(image_data, filename, client, deadline)
+
+        with self.breaker.guard(ignore=(DeadlineExceeded,)):
+            auth_header = await self.authenticate_async(client, deadline)
+            return await self.recognize_authenticated_async(client, auth_header, image_data, filename, deadline)
+
+    async def recognize_crops_async(self, crops, client=None, deadline=None):
+        """
+        Async recognize_crops: all crop uploads run concurrently on the event loop.
+        """
+        if client is None:
+            async with httpx.AsyncClient(verify=False) as client:
+                return await self.recognize_crops_async(crops, client, deadline)
+        if not crops:
+            return [], True
+        with self.breaker.guard(ignore=(DeadlineExceeded,)):
+            auth_header = await self.authenticate_async(client, deadline)
+            results = await asyncio.gather(
+                *(self.recognize_authenticated_async(client, auth_header, crop, f"fish_{index}.jpg", deadline)
+                  for index, crop in enumerate(crops)),
+                return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if len(errors) == len(crops):
+                raise errors[0]
+
+        species_by_fish = []
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logging.error(f"Error in fish recognition of crop {index}: {result}")
+                result = []
+            species_by_fish.append(result)
+        return species_by_fish, not errors
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+def get_recognizer():
+    """
+    Returns the process-wide FishRecognition, so every request shares its circuit breaker
+    """
+    global _recognizer
+    with _recognizer_lock:
+        if _recognizer is None:
+            _recognizer = FishRecognition()
+        return _recognizer
+
+def fishial_metrics():
+    """
+    Circuit breaker state of the shared recognizer, or None before the first lookup
+    """
+    return _recognizer.breaker.metrics() if _recognizer is not None else None
+
 def recognize_fish_from_image(image_data, filename="fish.jpg"):
     """
     Convenience function to recognize fish species from image data
     """
     try:
-        recognizer = FishRecognition()
+        recognizer = get_recognizer()
         return recognizer.recognize_fish_species(image_data, filename)
     except Exception as e:
         logging.error(f"Failed to initialize fish recognition: {e}")
         return []
+
+def recognize_fish_with_status(image_data, filename="fish.jpg", deadline=None):
+    """
+    Like recognize_fish_from_image, but also reports whether the lookup completed,
+    so callers can tell "no species found" from "lookup failed or ran out of time".
+
+    Returns:
+        tuple: (species list, True if the lookup completed)
+    """
+    try:
+        recognizer = get_recognizer()
+        return recognizer.recognize(image_data, filename, deadline), True
+    except CircuitOpen as e:
+        logging.info(f"Skipping fish recognition: {e}")
+        return [], False
+    except Exception as e:
+        logging.error(f"Error in fish recognition: {e}")
+        return [], False
+
+async def recognize_fish_with_status_async(image_data, filename="fish.jpg", client=None, deadline=None):
+    """
+    Async recognize_fish_with_status.
+    """
+    try:
+        recognizer = get_recognizer()
+        return await recognizer.recognize_async(image_data, filename, client, deadline), True
+    except CircuitOpen as e:
+        logging.info(f"Skipping fish recognition: {e}")
+        return [], False
+    except Exception as e:
+        logging.error(f"Error in fish recognition: {e}")
+        return [], False
+
+def recognize_fish_crops(crops, deadline=None):
+    """
+    Recognizes one encoded crop per fish, uploading them concurrently.
+
+    Returns:
+        tuple: (one species list per crop, True if every lookup completed)
+    """
+    try:
+        recognizer = get_recognizer()
+        return recognizer.recognize_crops(crops, deadline)
+    except CircuitOpen as e:
+        logging.info(f"Skipping fish recognition: {e}")
+        return [[] for _ in crops], False
+    except Exception as e:
+        logging.error(f"Error in fish recognition: {e}")
+        return [[] for _ in crops], False
+
+async def recognize_fish_crops_async(crops, client=None, deadline=None):
+    """
+    Async recognize_fish_crops.
+    """
+    try:
+        recognizer = get_recognizer()
+        return await recognizer.recognize_crops_async(crops, client, deadline)
+    except CircuitOpen as e:
+        logging.info(f"Skipping fish recognition: {e}")
+        return [[] for _ in crops], False
+    except Exception as e:
+        logging.error(f"Error in fish recognition: {e}")
+        return [[] for _ in crops], False
+
+def merge_species(species_by_fish):
+    """
+    Flattens per-fish species into one list, keeping each name once at its best accuracy.
+    """
+    best = {}
+    for species_list in species_by_fish:
+        for species in species_list:
+            name = species["name"]
+            if name not in best or species["accuracy"] > best[name]["accuracy"]:
+                best[name] = species
+    return sorted(best.values(), key=lambda species: species["accuracy"], reverse=True)
@@ -0,0 +1,405 @@
+import os
+from concurrent import futures
+
+import cv2
+import numpy as np
+
+from calibration import CalibrationCache
+from deadline import DeadlineExceeded
+from finaly import FishDetector, detect_stars, calculate_fish_lengths, refine_star
+from fish_recognition import recognize_fish_with_status, recognize_fish_crops, merge_species
+from image_io import crop_with_margin, encode_jpeg
+from pipeline import Pipeline, Stage
+
+
+class FishLengthService:
+    def __init__(self, fish_detector, star_model_path="epoch162.torchscript", calibration_cache=None,
+                 crop_uploads=False, crop_margin=0.15, crop_max_bytes=200_000, star_detector=None,
+                 refine_stars=False):
+        """
+        Measurement logic shared by the API endpoints.
+
+        Args:
+            fish_detector (FishDetector): Shared fish detector, or an InferencePool.
+            star_model_path (str): Star model passed to detect_stars.
+            calibration_cache (CalibrationCache): Optional per-session star calibration cache.
+            crop_uploads (bool): Send Fishial one compact JPEG crop per fish, concurrently,
+                instead of the full photo.
+            crop_margin (float): Margin around each fish box, as a fraction of its size.
+            crop_max_bytes (int): Byte budget of each encoded crop.
+            star_detector: Optional object whose detect_stars(image) replaces the star model
+                path, e.g. an InferencePool.
+            refine_stars (bool): Re-detect the best star on a full-resolution crop for a
+                sub-pixel scale (see finaly.refine_star).
+        """
+        self.fish_detector = fish_detector
+        self.star_model_path = star_model_path
+        self.star_detector = star_detector
+        self.refine_stars = refine_stars
+        self.calibration_cache = calibration_cache
+        self.crop_uploads = crop_uploads
+        self.crop_margin = crop_margin
+        self.crop_max_bytes = crop_max_bytes
+        # Optional staged decode -> batched detection -> measurement pipeline (see enable_pipeline)
+        self.pipeline = None
+        # Worker processes running the models, when INFERENCE_POOL_WORKERS is set
+        self.inference_pool = None
+        # Reduced-size fish detector of the live WebSocket mode (see measure_live)
+        self.live_detector = None
+
+    def warm_up(self, runs=1, shape=(480, 640, 3)):
+        """
+        Loads both models and runs them on a dummy image before the first request.
+        """
+        self.fish_detector.warm_up(runs, shape)
+        if self.live_detector is not None and self.live_detector is not self.fish_detector:
+            self.live_detector.warm_up(runs, shape)
+        dummy = np.full(shape, 114, dtype=np.uint8)
+        for _ in range(runs):
+            self.detect_stars(dummy)
+
+    def detect_stars(self, image):
+        if self.star_detector is not None:
+            return self.star_detector.detect_stars(image)
+        return detect_stars(image, self.star_model_path)
+
+    @staticmethod
+    def decode(image_bytes):
+        """
+        Decodes encoded image bytes to a BGR image, or None if they are not an image.
+        """
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    def calibrate(self, image, session_id=None):
+        """
+        Finds the reference star, reusing the session's cached calibration when it still matches.
+
+        Returns:
+            tuple: (star_boxes, calibration source) where the source is 'detected', 'cached' or None.
+        """
+        cache = self.calibration_cache if session_id else None
+        if cache is not None:
+            calibration = cache.get(session_id)
+            if calibration is not None and cache.verify(calibration, image):
+                return calibration.star_boxes(), 'cached'
+
+        star_boxes = self.detect_stars(image)
+        if star_boxes and self.refine_stars:
+            best_index = max(range(len(star_boxes)), key=lambda i: star_boxes[i]['conf'])
+            star_boxes[best_index] = refine_star(image, star_boxes[best_index], self.detect_stars)
+        if cache is not None:
+            if star_boxes:
+                best_star = max(star_boxes, key=lambda x: x['conf'])
+                _, pixels_per_inch = calculate_fish_lengths([], [best_star])
+                cache.put(session_id, image, best_star['box'], best_star['conf'], pixels_per_inch,
+                          best_star.get('width_px'))
+            else:
+                cache.invalidate(session_id)
+        return star_boxes, 'detected'
+
+    def measure(self, image, session_id=None, deadline=None, fish_detector=None):
+        """
+        Detects fish and stars and measures the fish.
+
+        Args:
+            deadline (Deadline): Optional request budget. Stages that cannot start in time are
+                skipped and listed in the result's 'missing'.
+            fish_detector: Detector to use instead of the shared one, e.g. the live detector.
+
+        Returns:
+            dict: fish_boxes, star_boxes, fish_lengths, pixels_per_inch, calibration source and missing parts.
+
+        Raises:
+            DeadlineExceeded: If there is no budget left to even start fish detection.
+        """
+        # Detect fish
+        if deadline is not None:
+            deadline.check('fish_detection')
+        fish_detector = fish_detector or self.fish_detector
+        return self.measure_with_boxes(image, fish_detector.detect_fish(image), session_id, deadline)
+
+    def measure_with_boxes(self, image, fish_boxes, session_id=None, deadline=None):
+        """
+        Second half of measure: stars and lengths for already detected fish boxes.
+        """
+        result = {'fish_boxes': fish_boxes, 'star_boxes': [], 'fish_lengths': [], 'pixels_per_inch': None,
+                  'calibration': None, 'missing': []}
+        if not result['fish_boxes']:
+            return result
+
+        # Detect stars for scale reference
+        if deadline is not None and deadline.expired():
+            result['missing'].append('lengths')
+            return result
+        result['star_boxes'], result['calibration'] = self.calibrate(image, session_id)
+
+        # Calculate fish lengths
+        result['fish_lengths'], result['pixels_per_inch'] = calculate_fish_lengths(
+            result['fish_boxes'], result['star_boxes'])
+        return result
+
+    def build_pipeline(self, decode_workers=2, batch_size=4, measure_workers=2, queue_size=8):
+        """
+        Builds the decode -> detect -> measure pipeline.
+
+        Items are dicts with 'image_bytes' (or a file 'path'), and optionally 'session_id'
+        and 'deadline'. The pipeline adds 'image', 'fish_boxes' and 'measurement'. Fish
+        detection runs on one thread in batches of up to `batch_size` items, so concurrent
+        requests or consecutive files share forward passes.
+
+        Returns:
+            Pipeline: Not yet started.
+        """
+        def decode(item):
+            image_bytes = item.get('image_bytes')
+            if image_bytes is None:
+                with open(item['path'], 'rb') as f:
+                    image_bytes = f.read()
+            item['image'] = self.decode(image_bytes)
+            return item
+
+        def detect(items):
+            outputs = list(items)
+            live = []
+            for index, item in enumerate(items):
+                deadline = item.get('deadline')
+                if item['image'] is None:
+                    item['fish_boxes'] = []
+                elif deadline is not None and deadline.expired():
+                    outputs[index] = DeadlineExceeded('fish_detection')
+                else:
+                    live.append(index)
+            if live:
+                fish_boxes = self.fish_detector.detect_fish_batch([items[index]['image'] for index in live])
+                for index, boxes in zip(live, fish_boxes):
+                    items[index]['fish_boxes'] = boxes
+            return outputs
+
+        def measure(item):
+            if item['image'] is not None:
+                item['measurement'] = self.measure_with_boxes(item['image'], item['fish_boxes'],
+                                                              item.get('session_id'), item.get('deadline'))
+            return item
+
+        return Pipeline([
+            Stage('decode', decode, workers=decode_workers, queue_size=queue_size),
+            Stage('detect', detect, workers=1, queue_size=queue_size, batch_size=batch_size),
+            Stage('measure', measure, workers=measure_workers, queue_size=queue_size),
+        ])
+
+    def enable_pipeline(self, **kwargs):
+        """
+        Routes decode_and_measure through a started pipeline (see build_pipeline for the options).
+        """
+        self.pipeline = self.build_pipeline(**kwargs).start()
+        return self.pipeline
+
+    def decode_and_measure(self, image_bytes, session_id=None, deadline=None):
+        """
+        Decodes and measures one upload, through the pipeline when it is enabled.
+
+        Returns:
+            tuple: (image, measurement), or (None, None) if the bytes are not an image.
+
+        Raises:
+            DeadlineExceeded: If there is no budget left to start fish detection.
+        """
+        if self.pipeline is None:
+            image = self.decode(image_bytes)
+            if image is None:
+                return None, None
+            return image, self.measure(image, session_id, deadline)
+
+        future = self.pipeline.submit({'image_bytes': image_bytes, 'session_id': session_id, 'deadline': deadline})
+        try:
+            item = future.result(timeout=deadline.remaining() if deadline is not None else None)
+        except futures.TimeoutError:
+            raise DeadlineExceeded('fish_detection')
+        return item['image'], item.get('measurement')
+
+    def measure_live(self, image_bytes, session_id=None, deadline=None):
+        """
+        Decodes and measures one live preview frame with the live detector. Frames skip the
+        pipeline, where they could wait for a batch to fill.
+
+        Returns:
+            dict: The measurement, or None if the bytes are not an image.
+        """
+        image = self.decode(image_bytes)
+        if image is None:
+            return None
+        return self.measure(image, session_id, deadline, self.live_detector)
+
+    def encode_crops(self, image, fish_boxes):
+        """
+        Crops every fish with margin and encodes it as a JPEG within the byte budget.
+
+        Returns:
+            list: Encoded crops, in the order of `fish_boxes`.
+        """
+        return [encode_jpeg(crop_with_margin(image, box, self.crop_margin), self.crop_max_bytes)
+                for box in fish_boxes]
+
+    def recognize(self, image_bytes, filename, measurement, deadline=None, image=None):
+        """
+        Looks up the species if there are fish, within what is left of the deadline.
+
+        With crop uploads enabled (and the decoded `image` given) every fish is looked up
+        on its own crop and the species are also returned per fish.
+
+        Returns:
+            tuple: (species list, True if the lookup completed or was not needed,
+                species per fish or None)
+        """
+        # Recognize fish species (only worth the round trip if there are fish)
+        fish_boxes = measurement['fish_boxes']
+        if not fish_boxes:
+            return [], True, None
+        if deadline is not None and deadline.expired():
+            return [], False, None
+        if self.crop_uploads and image is not None:
+            species_by_fish, species_ok = recognize_fish_crops(self.encode_crops(image, fish_boxes), deadline)
+            return merge_species(species_by_fish), species_ok, species_by_fish
+        fish_species, species_ok = recognize_fish_with_status(image_bytes, filename, deadline)
+        return fish_species, species_ok, None
+
+    def process(self, image, image_bytes, filename, session_id=None, deadline=None):
+        """
+        Runs the full /fish-length flow and builds the JSON response body.
+        """
+        measurement = self.measure(image, session_id, deadline)
+        fish_species, species_ok, species_by_fish = self.recognize(image_bytes, filename, measurement,
+                                                                   deadline, image)
+        return self.build_response(measurement, fish_species, session_id, species_ok, species_by_fish)
+
+    @staticmethod
+    def build_response(measurement, fish_species, session_id=None, species_ok=True, species_by_fish=None,
+                       result_id=None):
+        """
+        Builds the /fish-length response body from a measurement and the species lookup.
+
+        Parts that did not finish (out of budget or failed) are listed under 'missing'
+        and the response is flagged 'partial'. With crop uploads, 'species_by_fish' holds
+        one species list per fish, in the same order as 'fish_lengths'. 'result_id' is
+        added when the result was stored for rendering.
+        """
+        fish_boxes = measurement['fish_boxes']
+        missing = list(measurement.get('missing', []))
+        if not species_ok:
+            missing.append('species')
+
+        # If no fish detected, return 0
+        if not fish_boxes:
+            response = {
+                "success": True,
+                "fish_lengths": 0,
+                "fish_count": 0,
+                "fish_species": []
+            }
+            if result_id:
+                response["result_id"] = result_id
+            return response
+
+        # Extract only the length values
+        lengths = [round(fish['length_inch'], 2) for fish in measurement['fish_lengths']]
+
+        response = {
+            "success": True,
+            "fish_lengths": lengths if lengths else 0,
+            "fish_count": len(lengths) if lengths else len(fish_boxes),
+            "fish_species": fish_species
+        }
+        if species_by_fish is not None:
+            response["species_by_fish"] = species_by_fish
+        if result_id:
+            response["result_id"] = result_id
+        if session_id:
+            response["calibration"] = measurement['calibration']
+        if missing:
+            response["partial"] = True
+            response["missing"] = missing
+        return response
+
+    @staticmethod
+    def build_live_response(measurement):
+        """
+        Builds the message pushed for one live frame: boxes and lengths, without species
+        (a Fishial round trip per preview frame would be far slower than detection).
+        """
+        response = {
+            "fish_count": len(measurement['fish_boxes']),
+            "fish_boxes": [list(box) for box in measurement['fish_boxes']],
+            "fish_lengths": [round(fish['length_inch'], 2) for fish in measurement['fish_lengths']],
+            "star_boxes": [list(star['box']) for star in measurement['star_boxes']],
+            "pixels_per_inch": measurement['pixels_per_inch'],
+            "calibration": measurement['calibration'],
+        }
+        if measurement.get('missing'):
+            response["partial"] = True
+            response["missing"] = list(measurement['missing'])
+        return response
+
+
+def create_service_from_env(live=False):
+    """
+    Builds the service the API servers share, configured from environment variables.
+
+    Args:
+        live (bool): Also build the reduced-size detector of live preview frames; only
+            the ASGI server, which serves /live, needs it.
+    """
+    # FISH_CASCADE_IMSZ=320 enables the low-resolution presence check before full inference
+    fish_model_path = os.getenv('FISH_MODEL_PATH', 'model.ts')
+    star_model_path = os.getenv('STAR_MODEL_PATH', 'epoch162.torchscript')
+    fish_options = {
+        'cascade_imsz': int(os.getenv('FISH_CASCADE_IMSZ', '0')) or None,
+        'presence_threshold': float(os.getenv('FISH_PRESENCE_THRESHOLD', '0.25')),
+        'rect': os.getenv('FISH_RECT', '0') == '1',
+    }
+
+    # INFERENCE_POOL_WORKERS=n runs both models in n worker processes, out of the server's GIL
+    pool = None
+    if int(os.getenv('INFERENCE_POOL_WORKERS', '0')):
+        from inference_pool import InferencePool
+        torchscript_stars = not star_model_path.endswith('.pt')
+        pool = InferencePool.from_env(fish_model_path, star_model_path if torchscript_stars else None,
+                                      fish_options).start()
+        fish_detector = pool
+    else:
+        fish_detector = FishDetector(fish_model_path, **fish_options)
+
+    # Per-session star calibration for fixed camera rigs (sessions pass X-Session-Id or session_id)
+    service = FishLengthService(
+        fish_detector,
+        star_model_path,
+        CalibrationCache(ttl=float(os.getenv('CALIBRATION_TTL', '600'))),
+        # FISHIAL_CROP_UPLOADS=1 sends one compact crop per fish instead of the full photo
+        crop_uploads=os.getenv('FISHIAL_CROP_UPLOADS', '0') == '1',
+        crop_margin=float(os.getenv('FISHIAL_CROP_MARGIN', '0.15')),
+        crop_max_bytes=int(os.getenv('FISHIAL_CROP_MAX_BYTES', '200000')),
+        star_detector=pool if pool is not None and torchscript_stars else None,
+        # STAR_REFINE=1 re-detects the best star on a full-resolution crop for a precise scale
+        refine_stars=os.getenv('STAR_REFINE', '0') == '1',
+    )
+    service.inference_pool = pool
+    if live:
+        # LIVE_IMSZ sets the fish model input size of live preview frames (0 keeps the full size)
+        live_imsz = int(os.getenv('LIVE_IMSZ', '320'))
+        service.live_detector = fish_detector.scaled(live_imsz) if live_imsz else fish_detector
+
+    # MEASURE_PIPELINE=1 overlaps decode, batched detection and measurement across requests
+    if os.getenv('MEASURE_PIPELINE', '0') == '1':
+        service.enable_pipeline(
+            decode_workers=int(os.getenv('PIPELINE_DECODE_WORKERS', '2')),
+            batch_size=int(os.getenv('PIPELINE_BATCH_SIZE', '4')),
+            measure_workers=int(os.getenv('PIPELINE_MEASURE_WORKERS', '2')),
+        )
+    return service
+
+
+def create_live_service_from_env():
+    """
+    Builds the service of the ASGI server, which also measures /live frames.
+    """
+    return create_service_from_env(live=True)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Fishial API
+Serves the four endpoints used by fish_recognition.py (auth, upload URL,
+direct upload, recognition) with configurable latency and error rates, so the
+stack can be benchmarked offline and repeatably.
+
+Point the API at the stub with:
+    FISHIAL_AUTH_URL=http://localhost:5001 FISHIAL_API_URL=http://localhost:5001 python app.py
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, request, jsonify
+
+ENDPOINTS = ("auth", "upload", "put", "recognize")
+
+app = Flask(__name__)
+
+# Runtime configuration, filled in by main()
+config = {
+    "latency_ms": {name: 0.0 for name in ENDPOINTS},
+    "jitter_ms": 0.0,
+    "error_rate": {name: 0.0 for name in ENDPOINTS},
+    "put_kbps": 0.0,
+    "species": [{"name": "Micropterus salmoides", "accuracy": 0.93}],
+}
+
+_rng = random.Random()
+_rng_lock = threading.Lock()
+_uploads = {}
+_uploads_lock = threading.Lock()
+
+
+def _simulate(endpoint, extra_s=0.0):
+    """
+    Sleep for the configured latency of an endpoint and decide whether it fails.
+
+    Returns:
+        bool: True if the call should return an error
+    """
+    with _rng_lock:
+        jitter = _rng.uniform(-config["jitter_ms"], config["jitter_ms"])
+        fail = _rng.random() < config["error_rate"][endpoint]
+    delay = max(0.0, config["latency_ms"][endpoint] + jitter) / 1000 + extra_s
+    if delay:
+        time.sleep(delay)
+    return fail
+
+
+def _error(endpoint):
+    return jsonify({"error": f"stub {endpoint} failure"}), 503
+
+
+@app.route('/v1/auth/token', methods=['POST'])
+def auth_token():
+    if _simulate("auth"):
+        return _error("auth")
+    return jsonify({"access_token": f"stub-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 3600})
+
+
+@app.route('/v1/recognition/upload', methods=['POST'])
+def upload_url():
+    if _simulate("upload"):
+        return _error("upload")
+    blob = (request.get_json(silent=True) or {}).get("blob", {})
+    signed_id = uuid.uuid4().hex
+    return jsonify({
+        "signed-id": signed_id,
+        "direct-upload": {
+            "url": f"{request.host_url}upload/{signed_id}",
+            "headers": {
+                "Content-Disposition": f'inline; filename="{blob.get("filename", "fish.jpg")}"',
+            },
+        },
+    })
+
+
+@app.route('/upload/<signed_id>', methods=['PUT'])
+def direct_upload(signed_id):
+    data = request.get_data()
+    transfer_s = len(data) / (config["put_kbps"] * 1024) if config["put_kbps"] else 0.0
+    if _simulate("put", transfer_s):
+        return _error("put")
+    with _uploads_lock:
+        _uploads[signed_id] = len(data)
+    return "", 204
+
+
+@app.route('/v1/recognition/image', methods=['GET'])
+def recognize():
+    if _simulate("recognize"):
+        return _error("recognize")
+    signed_id = request.args.get("q", "")
+    with _uploads_lock:
+        uploaded = _uploads.pop(signed_id, None)
+    if uploaded is None:
+        return jsonify({"error": "unknown signed id"}), 404
+    return jsonify({"results": [{"species": config["species"]}]})
+
+
+def _parse_per_endpoint(value, default=0.0):
+    """
+    Parse "300" (all endpoints) or "auth=50,recognize=1200" into a dict.
+    """
+    result = {name: default for name in ENDPOINTS}
+    if not value:
+        return result
+    for part in value.split(","):
+        if "=" in part:
+            name, number = part.split("=", 1)
+            if name not in result:
+                raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}', expected one of {ENDPOINTS}")
+            result[name] = float(number)
+        else:
+            result = {name: float(part) for name in ENDPOINTS}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Fishial recognition API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency-ms", default="auth=50,upload=80,put=150,recognize=1200",
+                        help="Mean latency, either one value or per endpoint (auth,upload,put,recognize).")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter added to every call.")
+    parser.add_argument("--error-rate", default="0",
+                        help="Probability of a 503, either one value or per endpoint.")
+    parser.add_argument("--put-kbps", type=float, default=0.0,
+                        help="Simulated uplink bandwidth for the direct upload (0 = unlimited).")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs.")
+    args = parser.parse_args()
+
+    config["latency_ms"] = _parse_per_endpoint(args.latency_ms)
+    config["error_rate"] = _parse_per_endpoint(args.error_rate)
+    config["jitter_ms"] = args.jitter_ms
+    config["put_kbps"] = args.put_kbps
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    print(f"Fishial stub listening on http://{args.host}:{args.port}")
+    print(f"  latency (ms): {config['latency_ms']} +/- {config['jitter_ms']}")
+    print(f"  error rate:   {config['error_rate']}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Local test client for the gRPC API (grpc_server.py).
+
+    python grpc_client.py photo1.jpg photo2.jpg
+    python grpc_client.py photos/ --stream --session-id boat-7 --deadline 10
+"""
+import argparse
+import os
+import time
+
+import grpc
+
+from grpc_server import grpc_options, messages, services, unpack_boxes
+from image_io import list_images
+
+
+def requests_for(paths, session_id):
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield messages.MeasureRequest(image=f.read(), filename=os.path.basename(path),
+                                          session_id=session_id or '')
+
+
+def print_reply(path, reply):
+    if reply.error:
+        print(f"{path}: error: {reply.error}")
+        return
+    print(f"{path}: {reply.fish_count} fish, {len(reply.star_boxes) // 4} stars, "
+          f"{reply.pixels_per_inch:.1f} px/in" + (f", calibration {reply.calibration}" if reply.calibration else ""))
+    for i, box in enumerate(unpack_boxes(reply.fish_boxes)):
+        length = f"{reply.fish_lengths[i]:.2f} in" if i < len(reply.fish_lengths) else "no length"
+        print(f"  fish {i + 1}: {box} {length}")
+    if reply.fish_species:
+        print("  species: " + ", ".join(f"{s.name} ({s.accuracy:.2f})" for s in reply.fish_species))
+    if reply.missing:
+        print(f"  partial, missing: {', '.join(reply.missing)}")
+    if reply.result_id:
+        print(f"  result id: {reply.result_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure images through the gRPC API.")
+    parser.add_argument("images", nargs="+", help="Image files or directories")
+    parser.add_argument("--target", default="localhost:50051", help="Server address")
+    parser.add_argument("--stream", action="store_true", help="Send all images in one client-streaming call")
+    parser.add_argument("--session-id", help="Reuse the session's star calibration")
+    parser.add_argument("--deadline", type=float, help="gRPC deadline in seconds per call")
+    args = parser.parse_args()
+
+    paths = list_images(args.images)
+    with grpc.insecure_channel(args.target, options=grpc_options()) as channel:
+        stub = services.FishLengthStub(channel)
+        start = time.perf_counter()
+        if args.stream:
+            batch = stub.MeasureStream(requests_for(paths, args.session_id), timeout=args.deadline)
+            for path, reply in zip(paths, batch.replies):
+                print_reply(path, reply)
+        else:
+            for path, request in zip(paths, requests_for(paths, args.session_id)):
+                try:
+                    reply = stub.Measure(request, timeout=args.deadline)
+                except grpc.RpcError as e:
+                    retry_after = dict(e.trailing_metadata() or ()).get('retry-after')
+                    print(f"{path}: {e.code().name}: {e.details()}"
+                          + (f" (retry after {retry_after}s)" if retry_after else ""))
+                    continue
+                print_reply(path, reply)
+        elapsed = time.perf_counter() - start
+    print(f"{len(paths)} images in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+gRPC front end of the measurement service (see fish_length.proto).
+
+The servicer wraps the same measure function as the Flask /fish-length
+endpoint, so both protocols share the loaded detectors, the admission queue and
+the render store. app.py starts it in-process when GRPC_PORT is set; run this
+module directly to serve gRPC only:
+
+    GRPC_PORT=50051 python app.py
+    python grpc_server.py --port 50051
+
+The message classes are built from fish_length.proto at import time (this
+needs grpcio-tools), so there is no generated code to keep in sync.
+"""
+import argparse
+import os
+from concurrent import futures
+
+import grpc
+
+from admission import ServiceSaturated
+from deadline import Deadline, DeadlineExceeded
+from startup import ServiceNotReady
+
+messages, services = grpc.protos_and_services("fish_length.proto")
+
+
+def grpc_options():
+    """
+    Channel options shared by the server and the test client. gRPC caps messages
+    at 4 MB by default, below the size of many full-resolution photos.
+    """
+    max_bytes = int(os.getenv('GRPC_MAX_MESSAGE_MB', '32')) << 20
+    return [('grpc.max_receive_message_length', max_bytes), ('grpc.max_send_message_length', max_bytes)]
+
+
+def pack_boxes(boxes):
+    """
+    Flattens (x1, y1, x2, y2) boxes into four integers per box.
+    """
+    return [int(round(v)) for box in boxes for v in box]
+
+
+def unpack_boxes(values):
+    """
+    Returns:
+        list: (x1, y1, x2, y2) tuples from a packed box field.
+    """
+    values = list(values)
+    return [tuple(values[i:i + 4]) for i in range(0, len(values), 4)]
+
+
+def to_species(species):
+    return [messages.Species(name=s['name'], accuracy=s['accuracy']) for s in species]
+
+
+def build_reply(measurement, fish_species, species_ok, species_by_fish, result_id):
+    """
+    Packs a measurement and its species lookup into a MeasureReply.
+    """
+    missing = list(measurement.get('missing', []))
+    if not species_ok:
+        missing.append('species')
+    reply = messages.MeasureReply(
+        fish_count=len(measurement['fish_boxes']),
+        fish_boxes=pack_boxes(measurement['fish_boxes']),
+        fish_lengths=[fish['length_inch'] for fish in measurement['fish_lengths']],
+        star_boxes=pack_boxes(star['box'] for star in measurement['star_boxes']),
+        pixels_per_inch=measurement['pixels_per_inch'] or 0.0,
+        fish_species=to_species(fish_species),
+        missing=missing,
+        calibration=measurement['calibration'] or '',
+        result_id=result_id or '',
+    )
+    for species in species_by_fish or []:
+        reply.species_by_fish.add(species=to_species(species))
+    return reply
+
+
+class FishLengthServicer(services.FishLengthServicer):
+    def __init__(self, measure):
+        """
+        Args:
+            measure (callable): measure(image_bytes, filename, session_id, deadline), returning
+                (measurement, fish_species, species_ok, species_by_fish, result_id) or None for
+                bytes that are not an image; app.measure_upload.
+        """
+        self.measure = measure
+
+    def measure_request(self, request, context):
+        """
+        Measures one request within the client's gRPC deadline (as X-Request-Deadline-Ms
+        is for HTTP), or REQUEST_DEADLINE_S when the client set none.
+
+        Raises:
+            ValueError: If the request bytes are not an image.
+        """
+        deadline = Deadline.from_timeout(context.time_remaining())
+        result = self.measure(request.image, request.filename or 'image.jpg', request.session_id or None, deadline)
+        if result is None:
+            raise ValueError("Invalid image file")
+        return build_reply(*result)
+
+    def Measure(self, request, context):
+        try:
+            return self.measure_request(request, context)
+        except (ServiceSaturated, ServiceNotReady) as e:
+            context.set_trailing_metadata((('retry-after', str(e.retry_after)),))
+            context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+        except DeadlineExceeded as e:
+            context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, str(e))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    def MeasureStream(self, request_iterator, context):
+        replies = []
+        for request in request_iterator:
+            try:
+                replies.append(self.measure_request(request, context))
+            except ServiceNotReady as e:
+                # Nothing in the stream can succeed before the models are loaded
+                context.set_trailing_metadata((('retry-after', str(e.retry_after)),))
+                context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+            except Exception as e:
+                replies.append(messages.MeasureReply(error=str(e)))
+        return messages.MeasureBatchReply(replies=replies)
+
+
+def start_grpc_server(measure, port, workers=None):
+    """
+    Starts serving FishLength on all interfaces.
+
+    Args:
+        measure (callable): See FishLengthServicer.
+        port (int): TCP port.
+        workers (int): Request threads, GRPC_WORKERS by default. Concurrency on the
+            detectors is still bounded by the admission controller.
+
+    Returns:
+        grpc.Server: The started server, or None if the port could not be bound.
+    """
+    workers = workers or int(os.getenv('GRPC_WORKERS', '8'))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers), options=grpc_options())
+    services.add_FishLengthServicer_to_server(FishLengthServicer(measure), server)
+    try:
+        server.add_insecure_port(f"[::]:{port}")
+    except RuntimeError as e:
+        print(f"gRPC server not started: cannot bind port {port} ({e})")
+        return None
+    server.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the fish length API over gRPC only.")
+    parser.add_argument("--port", type=int, default=int(os.getenv('GRPC_PORT', '0')) or 50051, help="TCP port")
+    parser.add_argument("--workers", type=int, help="Request threads (default GRPC_WORKERS or 8)")
+    args = parser.parse_args()
+
+    # Importing the Flask module builds the shared loader, admission queue and
+    # renderer without serving HTTP; it starts gRPC itself when GRPC_PORT is set
+    import app
+
+    server = app.grpc_server or start_grpc_server(app.measure_upload, args.port, args.workers)
+    if server is None:
+        return 1
+    print(f"Serving FishLength gRPC on port {os.getenv('GRPC_PORT') if app.grpc_server else args.port}")
+    server.wait_for_termination()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
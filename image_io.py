@@ -0,0 +1,144 @@
+import os
+
+import cv2
+
+from shards import SHARD_EXTENSION, ShardReader, assign_shards, decode_view
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(paths):
+    """
+    Expands directories into the image files they contain.
+
+    Args:
+        paths (list): Image files and/or directories.
+
+    Returns:
+        list: Image file paths, directory contents in sorted order.
+    """
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(os.path.join(path, name))
+        else:
+            images.append(path)
+    return images
+
+
+def list_inputs(paths):
+    """
+    Like list_images, but directories also contribute their image shards.
+
+    Returns:
+        list: Image file and shard paths.
+    """
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS + (SHARD_EXTENSION,)):
+                    inputs.append(os.path.join(path, name))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def iter_image_bytes(paths, worker_index=0, num_workers=1):
+    """
+    Yields (name, encoded bytes) for image files, directories and shards.
+
+    Shard entries are zero-copy memoryviews into the memory-mapped shard and are
+    named "<shard>/<image>". With several workers, each one takes a disjoint
+    share of the shards and loose files.
+
+    Args:
+        paths (list): Image files, shards and/or directories of either.
+        worker_index (int): This worker, 0 <= worker_index < num_workers.
+        num_workers (int): Number of workers splitting the inputs.
+    """
+    for path in assign_shards(list_inputs(paths), worker_index, num_workers):
+        if path.lower().endswith(SHARD_EXTENSION):
+            try:
+                reader = ShardReader(path)
+            except (ValueError, OSError) as e:
+                print(f"Could not read {path}: {e}")
+                continue
+            with reader:
+                for name, data in reader:
+                    yield f"{path}/{name}", data
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    yield path, f.read()
+            except OSError as e:
+                print(f"Could not read {path}: {e}")
+
+
+def iter_images(paths, worker_index=0, num_workers=1):
+    """
+    Yields (name, BGR image) like iter_image_bytes; the image is None if it could not be decoded.
+    """
+    for name, data in iter_image_bytes(paths, worker_index, num_workers):
+        yield name, decode_view(data)
+
+
+def box_iou(a, b):
+    """
+    Intersection over union of two (x1, y1, x2, y2) boxes.
+    """
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def crop_with_margin(image, box, margin=0.15):
+    """
+    Crops a box out of an image, grown by `margin` of its size on every side.
+
+    Args:
+        image (np.ndarray): BGR image.
+        box (tuple): (x1, y1, x2, y2) in pixels.
+        margin (float): Fraction of the box width/height added on each side.
+
+    Returns:
+        np.ndarray: The crop, clipped to the image.
+    """
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = box
+    pad_x, pad_y = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+    x2, y2 = min(width, x2 + pad_x), min(height, y2 + pad_y)
+    return image[y1:y2, x1:x2]
+
+
+def encode_jpeg(image, max_bytes=200_000, max_side=1024, qualities=(90, 80, 70, 60, 50, 40)):
+    """
+    Encodes an image as a JPEG no larger than `max_bytes` where possible.
+
+    The image is first shrunk so its longer side is at most `max_side`, then the
+    quality is lowered step by step, and finally the image is halved until it fits.
+
+    Returns:
+        bytes: The encoded JPEG (the smallest attempt if nothing fits the budget).
+    """
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+
+    while True:
+        for quality in qualities:
+            ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError("Could not encode image as JPEG")
+            if len(encoded) <= max_bytes:
+                return encoded.tobytes()
+        if min(image.shape[:2]) < 64:
+            return encoded.tobytes()
+        image = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
@@ -1,236 +1,534 @@
+import hashlib
+import os
+
 import cv2
 import torch
 import numpy as np
+from numpy.lib import recfunctions
+from torchvision.ops import batched_nms
 from torchvision.transforms import functional as F
-        
-     
+
+
+# One row per detected box; `image` is the index of the source image in the batch
+DETECTION_DTYPE = np.dtype([
+    ('image', np.int32),
+    ('x1', np.int32),
+    ('y1', np.int32),
+    ('x2', np.int32),
+    ('y2', np.int32),
+    ('score', np.float32),
+    ('cls', np.int32),
+])
+
+# Inference precision modes and the dtype the network input and autocast use
+PRECISIONS = {
+    'fp32': torch.float32,
+    'bf16': torch.bfloat16,
+    'fp16': torch.float16,
+}
+
+
+def cpu_supports(feature):
+    """
+    Checks a CPU feature through torch's own detection ('avx512_bf16', 'amx_tile', 'amx_fp16', ...).
+    """
+    check = getattr(torch._C._cpu, f'_is_{feature}_supported', None)
+    return bool(check and check())
+
+
+def detect_precision():
+    """
+    Picks the reduced precision this CPU runs natively: bf16 with AVX512-BF16 or AMX,
+    fp16 with AMX-FP16, otherwise fp32. Emulated bf16/fp16 is slower than fp32.
+    """
+    if cpu_supports('avx512_bf16') or cpu_supports('amx_tile'):
+        return 'bf16'
+    if cpu_supports('amx_fp16'):
+        return 'fp16'
+    return 'fp32'
+
+
+def resolve_precision(precision=None):
+    """
+    Args:
+        precision (str): 'fp32', 'bf16', 'fp16' or 'auto'; defaults to INFERENCE_PRECISION (fp32).
+
+    Returns:
+        str: A key of PRECISIONS.
+    """
+    precision = precision or os.getenv('INFERENCE_PRECISION', 'fp32')
+    if precision == 'auto':
+        return detect_precision()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISIONS)} or auto")
+    return precision
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Returns:
+        str: SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_model(model_path, optimize=False, channels_last=False, precision='fp32', cache_dir=None):
+    """
+    Loads a TorchScript model for CPU inference, optionally graph-optimized.
+
+    With `optimize`, the model is frozen (weights inlined as constants, conv+batchnorm
+    and similar patterns folded) and saved to `cache_dir` under a key of the model file's
+    hash, the torch version and the memory format, so later starts load the frozen graph
+    directly. For fp32, optimize_for_inference's MKLDNN rewrite is applied on top at every
+    load: it is cheap, but its MKLDNN constants cannot be saved and it does not run under
+    bf16/fp16 autocast.
+
+    Args:
+        model_path (str): TorchScript model file.
+        optimize (bool): Freeze and optimize the model.
+        channels_last (bool): Convert the weights to channels_last memory format; inputs
+            must then be channels_last too (see YOLOInference.to_tensor).
+        precision (str): Inference precision the model will run at.
+        cache_dir (str): Where frozen models are cached, defaults to MODEL_CACHE_DIR (.model_cache).
+
+    Returns:
+        torch.jit.ScriptModule: The model in eval mode.
+    """
+    def load_source():
+        model = torch.jit.load(model_path, map_location='cpu')
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return model.eval()
+
+    if not optimize:
+        return load_source()
+
+    cache_dir = cache_dir or os.getenv('MODEL_CACHE_DIR', '.model_cache')
+    key = hashlib.sha256(f"{file_digest(model_path)}:{torch.__version__}:{channels_last}".encode()).hexdigest()
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    cached = os.path.join(cache_dir, f"{name}-{key[:16]}.ts")
+    if os.path.exists(cached):
+        model = torch.jit.load(cached, map_location='cpu')
+    else:
+        model = torch.jit.freeze(load_source())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cached}.{os.getpid()}.tmp"
+            torch.jit.save(model, tmp_path)
+            os.replace(tmp_path, cached)
+            print(f"Frozen {model_path} cached as {cached}")
+        except OSError as e:
+            print(f"Warning: could not cache the frozen model in {cache_dir} ({e})")
+
+    if precision == 'fp32':
+        try:
+            model = torch.jit.optimize_for_inference(model)
+        except Exception as e:
+            print(f"Warning: optimize_for_inference failed, using the frozen model ({e})")
+    return model
+
+
 class YOLOInference:
-    def __init__(self, model_path, imsz = (640, 640), conf_threshold = 0.05, nms_threshold = 0.3, yolo_ver = 'v10'):
+    def __init__(self, model_path, imsz = (640, 640), conf_threshold = 0.05, nms_threshold = 0.3, yolo_ver = 'v10',
+                 model = None, rect = False, stride = 32, pad_color = (0, 0, 0), min_size = 10, precision = None,
+                 optimize = None, channels_last = None):
         """
         Initializing a class with loading a model from TorchScript.
         Args:
         imsz: Size of input image to YOLO required
         conf_thresh: Confidence threshold to filter out low-confidence boxes.
         iou_thresh: IoU threshold for Non-Maximum Suppression.
+        model: Already loaded TorchScript module, to share weights between instances.
+        rect: Pad only up to a multiple of `stride` instead of the full square. Falls back
+              to square padding if the model does not accept dynamic input shapes.
+        stride: Largest stride of the model.
+        pad_color: Letterbox padding color (ultralytics-trained models expect 114 gray).
+        min_size: Boxes whose width or height is not above this many pixels are dropped.
+        precision: 'fp32', 'bf16' or 'fp16' autocast, or 'auto' to pick from the CPU features
+                   (see resolve_precision). The weights stay fp32, so a shared model can serve
+                   instances with different precisions.
+        optimize: Freeze and optimize the model, with an on-disk cache (see load_model);
+                  defaults to MODEL_OPTIMIZE=1.
+        channels_last: channels_last weights and inputs; defaults to MODEL_CHANNELS_LAST=1.
+                       A shared `model` must have been loaded with the same setting.
 
         """
         self.device = torch.device("cpu")
-        self.model = torch.jit.load(model_path).to(self.device)
+        self.precision = resolve_precision(precision)
+        if optimize is None:
+            optimize = os.getenv('MODEL_OPTIMIZE', '0') == '1'
+        if channels_last is None:
+            channels_last = os.getenv('MODEL_CHANNELS_LAST', '0') == '1'
+        self.channels_last = channels_last
+        if model is None:
+            model = load_model(model_path, optimize, channels_last, self.precision)
+        self.model = model
         self.model.eval()
         
         self.yolo_ver = yolo_ver
 
-        self.fp_16 = False
+        self.dtype = PRECISIONS[self.precision]
+        self.fp_16 = self.precision == 'fp16'
         self.imsz = imsz
         self.conf_threshold = conf_threshold
         self.nms_threshold = nms_threshold
-        self.letterbox = Letterbox(self.imsz)
+        self.stride = stride
+        self.min_size = min_size
+        self.rect = rect and self.supports_dynamic_shapes()
+        self.letterbox = Letterbox(self.imsz, color=pad_color, stride=stride, auto=self.rect)
+
+    def supports_dynamic_shapes(self):
+        """
+        Checks whether the model accepts non-square inputs and still produces a matching anchor grid.
+
+        Returns:
+            bool: True if rectangular inference is safe for this model.
+        """
+        height, width = self.imsz
+        rect_shape = (height, width - self.stride)
+
+        def grid_size(shape):
+            return sum((shape[0] // s) * (shape[1] // s) for s in (8, 16, 32))
+
+        try:
+            with torch.no_grad():
+                square = self.forward(torch.zeros(1, 3, height, width, dtype=self.dtype))
+                rect = self.forward(torch.zeros(1, 3, *rect_shape, dtype=self.dtype))
+        except Exception as e:
+            print(f"Warning: model does not accept dynamic input shapes, using square padding ({e})")
+            return False
+
+        if isinstance(square, (list, tuple)):
+            square, rect = square[0], rect[0]
+        # Models traced with a fixed anchor grid still run on other shapes but return the 640x640 grid
+        if grid_size(self.imsz) in square.shape and grid_size(rect_shape) not in rect.shape:
+            print("Warning: model has a fixed anchor grid, using square padding")
+            return False
+        return True
+
+    @staticmethod
+    def bucket(letterboxed):
+        """
+        Groups letterboxed images by padded shape so every group stacks into one tensor.
+
+        Args:
+            letterboxed (list): (image, params) pairs from Letterbox.
+
+        Returns:
+            list: Lists of indices into `letterboxed`, in first-seen order.
+        """
+        buckets = {}
+        for index, (image, _) in enumerate(letterboxed):
+            buckets.setdefault(image.shape[:2], []).append(index)
+        return list(buckets.values())
 
     def preprocess(self, im):
         """
         Prepares input image before inference.
 
         Args:
-            im (List(np.ndarray)): [(HWC) x B] for list.
+            im (List(np.ndarray)): [(HWC) x B] for list. In rect mode all images
+                must share an aspect ratio bucket (see bucket()).
         """
 
         im, params  = zip(*(self.letterbox(img) for img in im))
-        
-        im = np.stack(im)
-        im = im[..., ::-1].transpose((0, 3, 1, 2))  # BGR to RGB, BHWC to BCHW, (n, 3, h, w)
-        im = np.ascontiguousarray(im)  # contiguous
-        im = torch.from_numpy(im)
+        return self.to_tensor(im), params
 
-        im = im.to('cpu')
-        im = im.half() if self.fp_16 else im.float()  # uint8 to fp16/32
+    def to_tensor(self, im):
+        """
+        Stacks letterboxed images of one shape into a normalized BCHW tensor of the inference dtype.
 
-        im /= 255  # 0 - 255 to 0.0 - 1.0
-        return im, params
+        Args:
+            im (List(np.ndarray)): Letterboxed BGR images.
+        """
+        im = torch.from_numpy(np.stack(im))  # (n, h, w, 3) uint8 BGR
+        n, h, w, _ = im.shape
+        # BGR to RGB, BHWC to BCHW and uint8 to fp32/bf16/fp16 in a single copy,
+        # laid out channels_last when the weights are
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        tensor = torch.empty((n, 3, h, w), dtype=self.dtype, memory_format=memory_format)
+        for channel in range(3):
+            tensor[:, channel].copy_(im[..., 2 - channel])
+
+        tensor /= 255  # 0 - 255 to 0.0 - 1.0
+        return tensor
+
+    def forward(self, input_imgs):
+        """
+        Runs the model, under CPU autocast for bf16/fp16.
+        """
+        if self.dtype == torch.float32:
+            return self.model(input_imgs)
+        with torch.autocast('cpu', dtype=self.dtype):
+            return self.model(input_imgs)
     
-    def v10postprocess(self, predictions):
+    def postprocess_batch(self, predictions, params, shapes, input_shape=None):
         """
-        Post-processing for YOLO v10/v12 object detection model.
-        
+        Vectorized post-processing of a whole batch of v8 or v10 outputs.
+
+        Confidence filtering, box conversion, clipping, NMS, rescaling from the
+        letterbox parameters and the minimum-size filter all run on the batch
+        tensor; only the final rows are converted to NumPy.
+
         Args:
-            predictions (torch.Tensor): Model output tensor
-            
+            predictions (torch.Tensor): Model output, (B, F, N) or (B, N, F) with
+                F = 4 + 1 + [class] for v10 and F = 4 + num_classes for v8.
+            params (list): Letterbox [ratio, dh, dw] of every image.
+            shapes (list): (height, width) of every source image.
+            input_shape (tuple): (height, width) of the network input, defaults to imsz.
+
         Returns:
-            np.array: Array of filtered boxes after NMS
+            Detections: Results for every image in the batch.
         """
-        # Convert to numpy if needed
-        if torch.is_tensor(predictions):
-            predictions = predictions.cpu().numpy()
-        
-        # Handle different output formats
-        if len(predictions.shape) == 3:
-            # Format: (batch, num_classes + 4, num_predictions)
-            predictions = predictions[0]  # Remove batch dimension
-        
-        # Get the shape to determine the format
-        if predictions.shape[0] == 6:  # 4 (bbox) + 1 (conf) + 1 (class)
-            # Format: (6, num_predictions)
-            boxes = predictions[:4].T  # (num_predictions, 4)
-            scores = predictions[4]     # (num_predictions,)
-        elif predictions.shape[0] == 5:  # 4 (bbox) + 1 (conf)
-            # Format: (5, num_predictions)
-            boxes = predictions[:4].T  # (num_predictions, 4)
-            scores = predictions[4]     # (num_predictions,)
+        if isinstance(predictions, (list, tuple)):
+            predictions = predictions[0]
+        if predictions.dim() == 2:
+            predictions = predictions.unsqueeze(0)
+        # Predictions are laid out as (B, F, N) with far fewer features than anchors
+        if predictions.shape[1] <= predictions.shape[2]:
+            predictions = predictions.transpose(1, 2)
+        predictions = predictions.float()
+        if predictions.shape[2] < 5:
+            print(f"Warning: Unexpected prediction shape: {tuple(predictions.shape)}")
+            return Detections.empty(shapes)
+
+        if self.yolo_ver == 'v8':
+            scores, classes = predictions[..., 4:].max(dim=2)
         else:
-            # Try to handle as (num_predictions, features)
-            predictions = predictions.T
-            if predictions.shape[1] >= 5:
-                boxes = predictions[:, :4]
-                scores = predictions[:, 4]
+            scores = predictions[..., 4]
+            if predictions.shape[2] > 5:
+                classes = predictions[..., 5].round().long()
             else:
-                print(f"Warning: Unexpected prediction shape: {predictions.shape}")
-                return np.array([])
-        
+                classes = torch.zeros_like(scores, dtype=torch.long)
+
         # Filter by confidence threshold
-        mask = scores > self.conf_threshold
-        boxes = boxes[mask]
-        scores = scores[mask]
-        
-        if len(boxes) == 0:
-            return np.array([])
-        
-        # Convert to xyxy format if needed (assuming center format)
-        # This is a common YOLO output format
-        if boxes.shape[1] == 4:
-            # Assume center format (cx, cy, w, h) and convert to xyxy
-            cx, cy, w, h = boxes.T
-            x1 = cx - w / 2
-            y1 = cy - h / 2
-            x2 = cx + w / 2
-            y2 = cy + h / 2
-            boxes = np.stack([x1, y1, x2, y2], axis=1)
-        
-        # Clip boxes to image boundaries
-        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, self.imsz[0])
-        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, self.imsz[1])
-        
-        # Combine boxes and scores
-        boxes_scores = np.hstack([boxes, scores.reshape(-1, 1)])
-        
-        # Apply NMS
-        if len(boxes_scores) > 0:
-            indices = self.nms(boxes_scores)
-            boxes_scores = boxes_scores[indices]
-        
-        return boxes_scores
+        image_idx, anchor_idx = (scores > self.conf_threshold).nonzero(as_tuple=True)
+        if image_idx.numel() == 0:
+            return Detections.empty(shapes)
+        boxes = predictions[image_idx, anchor_idx, :4]
+        scores = scores[image_idx, anchor_idx]
+        classes = classes[image_idx, anchor_idx]
+
+        # Center format (cx, cy, w, h) to corners, clipped to the network input
+        in_h, in_w = input_shape if input_shape is not None else self.imsz
+        half_wh = boxes[:, 2:] / 2
+        boxes = torch.cat([boxes[:, :2] - half_wh, boxes[:, :2] + half_wh], dim=1)
+        boxes[:, 0::2] = boxes[:, 0::2].clamp(0, in_w)
+        boxes[:, 1::2] = boxes[:, 1::2].clamp(0, in_h)
+
+        # NMS per image: the image index keeps boxes of different images apart
+        keep = batched_nms(boxes, scores, image_idx, self.nms_threshold)
+        keep = keep[torch.argsort(image_idx[keep], stable=True)]
+        boxes, scores, classes, image_idx = boxes[keep], scores[keep], classes[keep], image_idx[keep]
+
+        # Undo letterbox: remove padding, divide by the resize ratio, clip to the source image
+        params = torch.tensor(params, dtype=boxes.dtype)[image_idx]  # (M, 3): ratio, dh, dw
+        ratio, dh, dw = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+        boxes[:, 0::2] = (boxes[:, 0::2] - dw) / ratio
+        boxes[:, 1::2] = (boxes[:, 1::2] - dh) / ratio
+        sizes = torch.tensor(shapes, dtype=boxes.dtype)[image_idx]  # (M, 2): height, width
+        boxes[:, 0::2] = torch.minimum(boxes[:, 0::2].clamp(min=0), sizes[:, 1:2])
+        boxes[:, 1::2] = torch.minimum(boxes[:, 1::2].clamp(min=0), sizes[:, 0:1])
+
+        # Drop boxes that are too small to be real objects
+        condition = ((boxes[:, 2] - boxes[:, 0]) > self.min_size) & ((boxes[:, 3] - boxes[:, 1]) > self.min_size)
+
+        data = np.zeros(int(condition.sum()), dtype=DETECTION_DTYPE)
+        data['image'] = image_idx[condition].numpy()
+        coords = boxes[condition].numpy().astype(np.int32)
+        for column, name in enumerate(('x1', 'y1', 'x2', 'y2')):
+            data[name] = coords[:, column]
+        data['score'] = scores[condition].numpy()
+        data['cls'] = classes[condition].numpy()
+        return Detections(data, shapes)
+
+    def predict_detections(self, im_bgr):
+        """
+        Runs detection and returns compact columnar results.
 
+        Args:
+            im_bgr (np.ndarray or List(np.ndarray)): One BGR image or a batch of them.
+
+        Returns:
+            Detections: Boxes, scores and classes for every image in the batch.
+        """
+        # Checking the type of the input argument and casting to a list
+        if isinstance(im_bgr, np.ndarray):
+            im_bgr = [im_bgr]
+
+        shapes = [img.shape[:2] for img in im_bgr]
+        letterboxed = [self.letterbox(img) for img in im_bgr]
+
+        # In rect mode images of different aspect ratios get different input shapes,
+        # so run one forward per shape bucket and merge the results back in order
+        parts = []
+        for indices in self.bucket(letterboxed):
+            input_imgs = self.to_tensor([letterboxed[i][0] for i in indices])
+            with torch.no_grad():
+                predictions = self.forward(input_imgs)
+                detections = self.postprocess_batch(predictions, [letterboxed[i][1] for i in indices],
+                                                    [shapes[i] for i in indices], tuple(input_imgs.shape[2:]))
+            parts.append((indices, detections))
+
+        if len(parts) == 1 and parts[0][0] == list(range(len(im_bgr))):
+            return parts[0][1]
+        return Detections.merge(parts, shapes)
+
+    def predict(self, im_bgr):
+        """
+        Runs detection and returns one list of YOLOResult objects per image.
+        Prefer predict_detections, which does not keep the source images alive.
+        """
+        if isinstance(im_bgr, np.ndarray):
+            im_bgr = [im_bgr]
+        return self.predict_detections(im_bgr).to_results(im_bgr)
     
-    def v8postprocess(self, predictions):
+
+class Detections:
+    def __init__(self, data, shapes):
         """
-        Post-processing for the YOLO V8 object detection model.
+        Columnar detection results for one image or a whole batch.
 
-        Arguments:
-        predictions (np.array): Prediction tensor of size (1, 5, 8400).
+        Results hold no pixel data; crops are cut from the source image on demand.
 
-        Returns:
-        np.array:Array of filtered boxes after NMS.
+        Args:
+            data (np.ndarray): Structured array with DETECTION_DTYPE, one row per box.
+            shapes (list): (height, width) of every source image in the batch.
         """
-        # Extracting Predictions from a Tensor
-        x_center, y_center, width, height, confidence = predictions
+        self.data = data
+        self.shapes = [tuple(shape) for shape in shapes]
 
-        # Convert coordinates from center to angular
-        x1 = x_center - width / 2
-        y1 = y_center - height / 2
-        x2 = x_center + width / 2
-        y2 = y_center + height / 2
+    @classmethod
+    def empty(cls, shapes):
+        return cls(np.zeros(0, dtype=DETECTION_DTYPE), shapes)
 
-        boxes = np.stack((x1, y1, x2, y2, confidence), axis=1)
+    @classmethod
+    def merge(cls, parts, shapes):
+        """
+        Merges results computed on sub-batches back into one batch.
 
-        # Filtering boxes by confidence threshold
-        boxes = boxes[boxes[:, 4] > self.conf_threshold]
+        Args:
+            parts (list): (indices, Detections) pairs; indices map each sub-batch image to its batch position.
+            shapes (list): (height, width) of every image in the full batch.
+        """
+        chunks = []
+        for indices, detections in parts:
+            data = detections.data.copy()
+            data['image'] = np.asarray(indices, dtype=np.int32)[data['image']]
+            chunks.append(data)
+        data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=DETECTION_DTYPE)
+        data = data[np.argsort(data['image'], kind='stable')]
+        return cls(data, shapes)
+
+    def __len__(self):
+        return len(self.data)
 
-        # Application of non-maximum suppression
-        indices = self.nms(boxes)
-        boxes = boxes[indices]
+    def __repr__(self):
+        return f"Detections(images={self.num_images}, boxes={len(self)})"
 
-        return boxes
+    @property
+    def num_images(self):
+        return len(self.shapes)
 
-    def nms(self, boxes):
+    @property
+    def boxes(self):
+        """
+        Returns:
+            np.ndarray: (N, 4) int32 array of x1, y1, x2, y2.
         """
-        Non-Maximum Suppression (NMS) to remove overlapping boxes.
+        return self.boxes_of(self.data)
 
-        Arguments:
-        boxes (np.array): An array of boxes of size (N, 5), where N is the number of boxes.
+    @property
+    def scores(self):
+        return self.data['score']
 
+    @property
+    def classes(self):
+        return self.data['cls']
+
+    def for_image(self, index):
+        """
+        Returns the detections of a single image of the batch.
+        """
+        data = self.data[self.data['image'] == index].copy()
+        data['image'] = 0
+        return Detections(data, [self.shapes[index]])
+
+    def split(self):
+        """
         Returns:
-        list: List of indexes of selected boxes.
+            list: One Detections per image in the batch.
+        """
+        return [self.for_image(index) for index in range(self.num_images)]
+
+    def get_boxes(self, index=0):
+        """
+        Returns the boxes of one image as (x1, y1, x2, y2) tuples of ints.
         """
+        rows = self.data[self.data['image'] == index]
+        return [tuple(box) for box in self.boxes_of(rows).tolist()]
+
+    @staticmethod
+    def boxes_of(rows):
+        return recfunctions.structured_to_unstructured(rows[['x1', 'y1', 'x2', 'y2']])
 
-        x1 = boxes[:, 0]
-        y1 = boxes[:, 1]
-        x2 = boxes[:, 2]
-        y2 = boxes[:, 3]
-        scores = boxes[:, 4]
+    def crop(self, i, image):
+        """
+        Cuts the i-th box out of its source image.
 
-        areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-        order = scores.argsort()[::-1]
+        Args:
+            i (int): Row index into this result.
+            image (np.ndarray): Source image the row was detected on.
 
-        keep = []
-        while order.size > 0:
-            i = order[0]
-            keep.append(i)
+        Returns:
+            np.ndarray: View of the box region of `image`.
+        """
+        row = self.data[i]
+        return image[row['y1']:row['y2'], row['x1']:row['x2']]
 
-            xx1 = np.maximum(x1[i], x1[order[1:]])
-            yy1 = np.maximum(y1[i], y1[order[1:]])
-            xx2 = np.minimum(x2[i], x2[order[1:]])
-            yy2 = np.minimum(y2[i], y2[order[1:]])
+    def crops(self, images):
+        """
+        Lazily yields (row index, crop) for every box.
 
-            w = np.maximum(0, xx2 - xx1 + 1)
-            h = np.maximum(0, yy2 - yy1 + 1)
+        Args:
+            images (np.ndarray or List(np.ndarray)): Source image(s), in batch order.
+        """
+        if isinstance(images, np.ndarray):
+            images = [images]
+        for i, image_index in enumerate(self.data['image'].tolist()):
+            yield i, self.crop(i, images[image_index])
 
-            inter = w * h
-            overlap = inter / (areas[i] + areas[order[1:]] - inter)
+    def to_json(self):
+        """
+        Converts the results to JSON-serializable lists, one per image.
 
-            order = order[np.where(overlap <= self.nms_threshold)[0] + 1]
+        Returns:
+            list: [[{'box': [x1, y1, x2, y2], 'score': float, 'class': int}, ...], ...]
+        """
+        per_image = [[] for _ in range(self.num_images)]
+        for image_index, x1, y1, x2, y2, score, cls in self.data.tolist():
+            per_image[image_index].append({'box': [x1, y1, x2, y2], 'score': score, 'class': cls})
+        return per_image
 
-        return keep
+    def to_results(self, images):
+        """
+        Converts to the YOLOResult API, one list per image.
 
-    def scale_coords_back(self, img_shape, coords, params):
-        # Rescale coords (xyxy) from target image shape to original image shape
-        ratio, dh, dw = params
-        gain = ratio
-        
-        coords[:, [0, 2]] -= dw  # x padding
-        coords[:, [1, 3]] -= dh  # y padding
-        
-        coords[:, :4] /= gain
-        
-        coords = np.clip(coords, 0, [np.max(img_shape), np.max(img_shape), img_shape[1], img_shape[0], 1])
-       
-        condition = (coords[:, 2] - coords[:, 0] > 10) & (coords[:, 3] - coords[:, 1] > 10)
-        coords = coords[condition]
+        Args:
+            images (np.ndarray or List(np.ndarray)): Source image(s), in batch order.
+        """
+        if isinstance(images, np.ndarray):
+            images = [images]
+        results = [[] for _ in range(self.num_images)]
+        for image_index, x1, y1, x2, y2, score, _ in self.data.tolist():
+            box = np.array([x1, y1, x2, y2, score])
+            results[image_index].append(YOLOResult(box, images[image_index]))
+        return results
 
-        return coords
-    
-    def predict(self, im_bgr):
-        
-        # Checking the type of the input argument and casting to a list
-        if isinstance(im_bgr, np.ndarray):
-            im_bgr = [im_bgr]
-            
-        input_imgs, params = self.preprocess(im_bgr)
-        
-        with torch.no_grad():
-            predictions = self.model(input_imgs)
-                
-        final_pred = []
-        for bbox_id in range(len(predictions)):
-            if self.yolo_ver == 'v8':
-                filtered_boxes = self.v8postprocess(predictions[bbox_id])
-            elif self.yolo_ver == 'v10':
-                filtered_boxes = self.v10postprocess(predictions[bbox_id])
-                
-            if len(filtered_boxes) == 0:
-                final_pred.append([])
-            else:
-                boxes = self.scale_coords_back(im_bgr[bbox_id].shape[:2], filtered_boxes, params[bbox_id])
-                final_pred.append([YOLOResult(box, im_bgr[bbox_id]) for box in boxes])
-        return final_pred
-    
 
 class YOLOResult:
     def __init__(self, box, image):
@@ -346,9 +644,19 @@ class YOLOResult:
         }
     
 class Letterbox:
-    def __init__(self, target_size, color=(0, 0, 0)):
+    def __init__(self, target_size, color=(0, 0, 0), stride=32, auto=False):
+        """
+        Args:
+            target_size (tuple): (height, width) to fit the image into.
+            color (tuple): Padding color.
+            stride (int): Model stride, used when `auto` is set.
+            auto (bool): Minimal padding: pad only up to a multiple of `stride` on each axis
+                instead of the full target size (rectangular inference).
+        """
         self.target_size = target_size
         self.color = color
+        self.stride = stride
+        self.auto = auto
 
     def __call__(self, image):
         return self.letterbox(image)
@@ -363,6 +671,8 @@ class Letterbox:
         
         # Compute padding
         dh, dw = new_shape[0] - new_unpad[0], new_shape[1] - new_unpad[1]
+        if self.auto:  # minimum rectangle
+            dh, dw = dh % self.stride, dw % self.stride
         dw /= 2  # divide padding into 2 sides
         dh /= 2
 
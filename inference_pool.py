@@ -0,0 +1,496 @@
+"""
+Fish and star inference in a pool of worker processes.
+
+Python-side pre- and postprocessing (letterbox, NMS, result construction) holds
+the GIL, so request threads in one process serialize on it. The pool runs the
+detectors in separate processes instead. Decoded images are handed over in
+multiprocessing.shared_memory segments, and workers send back the compact
+DETECTION_DTYPE arrays, so pixel data is never pickled.
+
+Workers are started as `python inference_pool.py` subprocesses talking over an
+inherited socket pair rather than with multiprocessing's spawn, which would
+re-import the server's __main__ module (and start another service) in every worker.
+"""
+import contextlib
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+
+class InferenceWorkerError(RuntimeError):
+    """
+    Raised when a worker fails a task, crashes, times out, or no worker is available.
+    """
+
+
+class SharedImage:
+    def __init__(self, image):
+        """
+        Copies an image into a new shared memory segment, owned (and unlinked) by this process.
+        """
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, image.dtype, buffer=self.shm.buf)[...] = image
+        self.spec = (self.shm.name, image.shape, image.dtype.str)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def attach_image(spec):
+    """
+    Maps an image another process put into shared memory, without copying it.
+
+    Returns:
+        tuple: (SharedMemory to close once the image is no longer used, np.ndarray view)
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    # The creating process unlinks the segment; keep this process's resource tracker from doing it too
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm, np.ndarray(shape, dtype, buffer=shm.buf)
+
+
+# Marks a slot whose worker the monitor is starting, so no one else starts one there
+_RESTARTING = object()
+
+
+class _Worker:
+    def __init__(self, slot, options, target='inference_pool:worker_main'):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.slot = slot
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_conn.fileno()), json.dumps(options), target],
+            pass_fds=(child_conn.fileno(),))
+        child_conn.close()
+        self.conn = parent_conn
+        self.tasks = 0
+        self.started_at = time.monotonic()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"worker not ready after {timeout}s")
+        status, payload = self.conn.recv()
+        if status != 'ready':
+            raise InferenceWorkerError(payload)
+
+    def call(self, message, timeout):
+        """
+        Raises:
+            InferenceWorkerError: If the task failed inside an otherwise healthy worker.
+            TimeoutError, EOFError, OSError: If the worker is hung or gone.
+        """
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"no answer within {timeout}s")
+        status, payload = self.conn.recv()
+        self.tasks += 1
+        if status == 'error':
+            raise InferenceWorkerError(payload)
+        return payload
+
+    def stop(self, timeout=2):
+        with contextlib.suppress(OSError):
+            self.conn.send(('stop',))
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+
+class InferencePool:
+    def __init__(self, model_path="model.ts", star_model_path="epoch162.torchscript", workers=2,
+                 threads_per_worker=None, task_timeout=30.0, load_timeout=120.0, health_interval=5.0,
+                 fish_options=None, worker_target='inference_pool:worker_main'):
+        """
+        A drop-in for FishDetector (detect_fish, detect_fish_batch, warm_up) that also
+        detects stars, running both models in `workers` processes.
+
+        A monitor thread starts every replacement worker, so a request never waits for
+        models to load. It pings idle workers every `health_interval` seconds and retires
+        dead or hung ones; a caller whose worker crashes or times out retires it and
+        wakes the monitor.
+
+        Args:
+            model_path (str): TorchScript fish model.
+            star_model_path (str): TorchScript star model (None to detect fish only).
+            workers (int): Worker processes.
+            threads_per_worker (int): torch threads per worker, defaults to CPUs / workers.
+            task_timeout (float): Longest wait for a worker and for its answer.
+            load_timeout (float): Longest wait for a new worker to load its models.
+            health_interval (float): Seconds between health checks (0 disables the monitor).
+            fish_options (dict): Extra FishDetector arguments (cascade_imsz, rect, ...).
+            worker_target (str): 'module:function' run in each worker process.
+        """
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.load_timeout = load_timeout
+        self.health_interval = health_interval
+        self.options = {
+            'model_path': model_path,
+            'star_model_path': star_model_path,
+            'threads': threads_per_worker or max(1, (os.cpu_count() or 1) // workers),
+            'fish_options': fish_options or {},
+        }
+        self.worker_target = worker_target
+        # Per slot: the running _Worker, _RESTARTING while one is being started, or None
+        self._slots = [None] * workers
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._monitor = None
+        self.restarts = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, model_path, star_model_path, fish_options=None):
+        """
+        Builds a pool from INFERENCE_POOL_WORKERS, INFERENCE_POOL_THREADS, INFERENCE_POOL_TIMEOUT
+        and INFERENCE_POOL_HEALTH_INTERVAL.
+        """
+        return cls(model_path, star_model_path,
+                   workers=int(os.getenv('INFERENCE_POOL_WORKERS', '2')),
+                   threads_per_worker=int(os.getenv('INFERENCE_POOL_THREADS', '0')) or None,
+                   task_timeout=float(os.getenv('INFERENCE_POOL_TIMEOUT', '30')),
+                   health_interval=float(os.getenv('INFERENCE_POOL_HEALTH_INTERVAL', '5')),
+                   fish_options=fish_options)
+
+    def start(self):
+        """
+        Starts all workers and waits until they have loaded their models.
+
+        Raises:
+            InferenceWorkerError: If a worker fails to start.
+        """
+        for slot in range(self.workers):
+            if self._claim(slot):
+                self._spawn(slot)
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._watch, name='inference-pool-monitor', daemon=True)
+            self._monitor.start()
+        return self
+
+    def _workers(self):
+        with self._lock:
+            return [worker for worker in self._slots if isinstance(worker, _Worker)]
+
+    def _claim(self, slot):
+        """
+        Marks an empty slot as restarting.
+
+        Returns:
+            bool: True if the caller now owns the slot and must start its worker.
+        """
+        with self._lock:
+            if self._slots[slot] is not None or self._closed.is_set():
+                return False
+            self._slots[slot] = _RESTARTING
+            return True
+
+    def _spawn(self, slot):
+        """
+        Starts a worker in a claimed slot and makes it available once its models are loaded.
+
+        Raises:
+            InferenceWorkerError: If the worker fails to start; the slot is empty again.
+        """
+        worker = _Worker(slot, self.options, self.worker_target)
+        try:
+            worker.wait_ready(self.load_timeout)
+        except Exception as e:
+            worker.stop(timeout=0)
+            with self._lock:
+                self._slots[slot] = None
+            raise InferenceWorkerError(f"Inference worker {slot} failed to start: {e}")
+        with self._lock:
+            closed = self._closed.is_set()
+            self._slots[slot] = None if closed else worker
+        if closed:
+            worker.stop()
+            raise InferenceWorkerError("Inference pool is closed")
+        self._idle.put(worker)
+        return worker
+
+    def _retire(self, worker, reason):
+        """
+        Kills a broken worker and empties its slot; the monitor starts the replacement.
+        """
+        print(f"Restarting inference worker {worker.slot} (pid {worker.process.pid}): {reason}")
+        with self._lock:
+            self.restarts += 1
+            if self._slots[worker.slot] is worker:
+                self._slots[worker.slot] = None
+        worker.stop(timeout=0)
+        self._wake.set()
+
+    def _call(self, message):
+        try:
+            worker = self._idle.get(timeout=self.task_timeout)
+        except queue.Empty:
+            raise InferenceWorkerError(f"No inference worker available within {self.task_timeout}s")
+        try:
+            return worker.call(message, self.task_timeout)
+        except InferenceWorkerError:
+            with self._lock:
+                self.failures += 1
+            raise
+        except (TimeoutError, EOFError, OSError) as e:
+            with self._lock:
+                self.failures += 1
+            self._retire(worker, f"{type(e).__name__}: {e}")
+            worker = None
+            raise InferenceWorkerError(f"Inference worker failed: {type(e).__name__}: {e}")
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def _ping_idle(self):
+        """
+        Pings the idle workers one at a time, so the others stay available to callers.
+        """
+        pinged = set()
+        for _ in range(self.workers):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker in pinged:
+                # Went round the queue once already
+                self._idle.put(worker)
+                return
+            pinged.add(worker)
+            try:
+                if not worker.alive():
+                    raise EOFError(f"exited with status {worker.process.returncode}")
+                worker.call(('ping',), timeout=min(self.task_timeout, 5.0))
+            except (InferenceWorkerError, TimeoutError, EOFError, OSError) as e:
+                self._retire(worker, f"health check failed: {e}")
+                continue
+            self._idle.put(worker)
+
+    def _watch(self):
+        """
+        Monitor loop: restarts retired workers as soon as a caller reports them, and pings
+        idle workers every health_interval seconds (0 disables the pings).
+        """
+        next_ping = time.monotonic() + self.health_interval
+        while not self._closed.is_set():
+            timeout = max(0.0, next_ping - time.monotonic()) if self.health_interval else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._closed.is_set():
+                return
+            for slot in range(self.workers):
+                if self._claim(slot):
+                    try:
+                        self._spawn(slot)
+                    except InferenceWorkerError as e:
+                        print(e)
+            if self.health_interval and time.monotonic() >= next_ping:
+                self._ping_idle()
+                next_ping = time.monotonic() + self.health_interval
+
+    def _each_worker(self, message):
+        """
+        Sends a message to every live worker, one at a time.
+        """
+        taken = []
+        try:
+            for _ in range(len(self._workers())):
+                worker = self._idle.get(timeout=self.task_timeout)
+                taken.append(worker)
+                worker.call(message, self.load_timeout)
+        finally:
+            for worker in taken:
+                self._idle.put(worker)
+
+    def detect(self, images, imsz=None):
+        """
+        Args:
+            imsz (int): Run the fish model at this square input size instead (see FishDetector.scaled).
+
+        Returns:
+            Detections: Fish of every image, computed in a worker.
+        """
+        from inference import Detections
+
+        with contextlib.ExitStack() as stack:
+            specs = [stack.enter_context(SharedImage(image)).spec for image in images]
+            data = self._call(('fish', specs, imsz))
+        return Detections(data, [image.shape[:2] for image in images])
+
+    def detect_fish_batch(self, images):
+        detections = self.detect(images)
+        return [detections.get_boxes(index) for index in range(len(images))]
+
+    def detect_fish(self, image):
+        return self.detect_fish_batch([image])[0]
+
+    def detect_stars(self, image):
+        """
+        Returns:
+            list: {'box', 'conf'} for every star, as finaly.detect_stars.
+        """
+        from finaly import StarDetector
+        from inference import Detections
+
+        with SharedImage(image) as shared:
+            data = self._call(('stars', [shared.spec]))
+        return StarDetector.to_star_boxes(Detections(data, [image.shape[:2]]))
+
+    def warm_up(self, runs=1, shape=(480, 640, 3)):
+        self._each_worker(('warm_up', runs, shape, None))
+
+    def scaled(self, imsz):
+        """
+        Returns:
+            ScaledPoolDetector: This pool's fish detection at another input size, as FishDetector.scaled.
+        """
+        return ScaledPoolDetector(self, imsz)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Live, restarting and idle workers, restarts, failed tasks and per-worker pid and task count.
+        """
+        workers = [{'slot': worker.slot, 'pid': worker.process.pid, 'alive': worker.alive(), 'tasks': worker.tasks,
+                    'uptime_s': round(time.monotonic() - worker.started_at, 1)}
+                   for worker in self._workers()]
+        return {'workers': self.workers, 'live': sum(1 for worker in workers if worker['alive']),
+                'restarting': sum(1 for worker in self._slots if worker is _RESTARTING),
+                'idle': self._idle.qsize(), 'restarts': self.restarts, 'failures': self.failures,
+                'processes': workers}
+
+    def close(self):
+        """
+        Stops every worker. A worker still being started is stopped once it is ready.
+        """
+        with self._lock:
+            self._closed.set()
+            workers = [worker for worker in self._slots if isinstance(worker, _Worker)]
+            self._slots = [None] * self.workers
+        self._wake.set()
+        for worker in workers:
+            worker.stop()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+
+class ScaledPoolDetector:
+    def __init__(self, pool, imsz):
+        """
+        Fish detection in `pool` at another square input size; workers build the scaled
+        detector on first use.
+        """
+        self.pool = pool
+        self.imsz = imsz
+
+    def detect(self, images):
+        return self.pool.detect(images, self.imsz)
+
+    def detect_fish_batch(self, images):
+        detections = self.detect(images)
+        return [detections.get_boxes(index) for index in range(len(images))]
+
+    def detect_fish(self, image):
+        return self.detect_fish_batch([image])[0]
+
+    def warm_up(self, runs=1, shape=(480, 640, 3)):
+        self.pool._each_worker(('warm_up', runs, shape, self.imsz))
+
+
+def worker_main(fd, options):
+    """
+    Worker process loop: loads the detectors, then answers tasks until told to stop
+    or until the parent goes away.
+    """
+    conn = Connection(fd)
+    try:
+        import torch
+        torch.set_num_threads(options['threads'])
+
+        from finaly import FishDetector, StarDetector
+        fish_detector = FishDetector(options['model_path'], **options['fish_options'])
+        star_path = options['star_model_path']
+        star_detector = StarDetector(star_path) if star_path and not star_path.endswith('.pt') else None
+    except Exception as e:
+        conn.send(('failed', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', os.getpid()))
+    scaled_detectors = {}
+
+    def fish_detector_at(imsz):
+        if not imsz:
+            return fish_detector
+        if imsz not in scaled_detectors:
+            scaled_detectors[imsz] = fish_detector.scaled(imsz)
+        return scaled_detectors[imsz]
+
+    while True:
+        try:
+            op, *args = conn.recv()
+        except (EOFError, OSError):
+            return
+        if op == 'stop':
+            return
+        try:
+            if op == 'ping':
+                result = 'pong'
+            elif op == 'warm_up':
+                runs, shape, imsz = args
+                fish_detector_at(imsz).warm_up(runs, tuple(shape))
+                if star_detector is not None and not imsz:
+                    star_detector.warm_up(runs, tuple(shape))
+                result = None
+            elif op in ('fish', 'stars'):
+                if op == 'stars' and star_detector is None:
+                    raise ValueError("This pool has no TorchScript star model")
+                segments, images = zip(*(attach_image(spec) for spec in args[0]))
+                try:
+                    if op == 'fish':
+                        result = fish_detector_at(args[1]).detect(list(images)).data
+                    else:
+                        result = star_detector.yolo_inference.predict_detections(list(images)).data
+                finally:
+                    # Views must be gone before the mapping can close; if a traceback still
+                    # holds one, the mapping is released when it is garbage collected
+                    images = None
+                    for shm in segments:
+                        with contextlib.suppress(BufferError):
+                            shm.close()
+            else:
+                raise ValueError(f"Unknown task {op!r}")
+            conn.send(('ok', result))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+if __name__ == "__main__":
+    module_name, function_name = sys.argv[3].split(':')
+    target = getattr(importlib.import_module(module_name), function_name)
+    target(int(sys.argv[1]), json.loads(sys.argv[2]))
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Fish Length API
+Drives /fish-length or /fish-length-base64 either with a fixed number of
+concurrent clients (closed loop) or at a fixed arrival rate (open loop), and
+reports throughput and latency percentiles.
+
+Example (offline, against the local Fishial stub):
+    python fishial_stub.py --latency-ms recognize=2000 &
+    FISHIAL_AUTH_URL=http://localhost:5001 FISHIAL_API_URL=http://localhost:5001 python app.py &
+    python load_test.py --image 4104.jpg --concurrency 8 --duration 60
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadTest:
+    def __init__(self, base_url, endpoint, images, timeout=120.0):
+        """
+        Args:
+            base_url (str): API base URL, e.g. http://localhost:5000
+            endpoint (str): 'fish-length' or 'fish-length-base64'
+            images (list): Paths of images to cycle through
+            timeout (float): Per-request client timeout in seconds
+        """
+        self.url = f"{base_url.rstrip('/')}/{endpoint}"
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+        # Build the request bodies once so the generator itself stays cheap
+        self.payloads = []
+        for path in images:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if endpoint == 'fish-length-base64':
+                self.payloads.append((os.path.basename(path), base64.b64encode(data).decode('utf-8')))
+            else:
+                self.payloads.append((os.path.basename(path), data))
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _next_payload(self):
+        with self._lock:
+            payload = self.payloads[self._counter % len(self.payloads)]
+            self._counter += 1
+        return payload
+
+    def send_one(self, scheduled_at=None):
+        """
+        Send one request and record its latency.
+
+        Args:
+            scheduled_at (float): perf_counter time the request was due. In open-loop
+                mode latency is measured from here, so client-side queueing is included.
+        """
+        name, body = self._next_payload()
+        start = time.perf_counter() if scheduled_at is None else scheduled_at
+        try:
+            if self.endpoint == 'fish-length-base64':
+                response = self._session().post(self.url, json={'image': body}, timeout=self.timeout)
+            else:
+                response = self._session().post(self.url, files={'image': (name, body)}, timeout=self.timeout)
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            self.statuses[status] += 1
+            if status == 200:
+                self.latencies.append(latency)
+            else:
+                self.errors[status] += 1
+
+    def run_closed_loop(self, concurrency, duration=None, total=None):
+        """
+        Run `concurrency` clients that each send the next request as soon as the previous one returns.
+        """
+        stop_at = time.perf_counter() + duration if duration else None
+        remaining = [total]
+
+        def take_ticket():
+            with self._lock:
+                if remaining[0] is None:
+                    return True
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def client():
+            while (stop_at is None or time.perf_counter() < stop_at) and take_ticket():
+                self.send_one()
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - started
+
+    def run_open_loop(self, rate, duration=None, total=None, max_inflight=256, seed=None):
+        """
+        Send requests with Poisson arrivals at `rate` requests/second, regardless of response times.
+        """
+        rng = random.Random(seed)
+        started = time.perf_counter()
+        next_at = started
+        sent = 0
+        with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+            while True:
+                if total is not None and sent >= total:
+                    break
+                if duration is not None and next_at - started >= duration:
+                    break
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send_one, next_at)
+                sent += 1
+                next_at += rng.expovariate(rate)
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        completed = sum(self.statuses.values())
+        return {
+            'url': self.url,
+            'elapsed_s': round(elapsed, 3),
+            'requests': completed,
+            'succeeded': len(latencies),
+            'failed': completed - len(latencies),
+            'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+            'latency_ms': {
+                'mean': round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                'p50': round(1000 * percentile(latencies, 50), 1),
+                'p95': round(1000 * percentile(latencies, 95), 1),
+                'p99': round(1000 * percentile(latencies, 99), 1),
+                'max': round(1000 * latencies[-1], 1) if latencies else 0.0,
+            },
+            'statuses': {str(k): v for k, v in self.statuses.items()},
+        }
+
+
+def print_report(report):
+    lat = report['latency_ms']
+    print(f"URL:         {report['url']}")
+    print(f"Elapsed:     {report['elapsed_s']:.1f}s")
+    print(f"Requests:    {report['requests']} ({report['succeeded']} ok, {report['failed']} failed)")
+    print(f"Throughput:  {report['throughput_rps']:.2f} req/s")
+    print(f"Latency ms:  mean={lat['mean']}  p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}  max={lat['max']}")
+    print(f"Statuses:    {report['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the Fish Length API.")
+    parser.add_argument("--url", default="http://localhost:5000", help="API base URL.")
+    parser.add_argument("--endpoint", choices=["fish-length", "fish-length-base64"], default="fish-length")
+    parser.add_argument("--image", action="append", required=True,
+                        help="Image to send (repeat to cycle through several).")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=4, help="Closed loop: number of concurrent clients.")
+    mode.add_argument("--rate", type=float, help="Open loop: arrival rate in requests/second.")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds.")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests.")
+    parser.add_argument("--warmup", type=int, default=1, help="Requests sent before measuring.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request in seconds.")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open loop: cap on outstanding requests.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for open-loop arrivals.")
+    parser.add_argument("--json", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    if args.duration is None and args.requests is None:
+        args.duration = 30.0
+
+    for _ in range(args.warmup):
+        LoadTest(args.url, args.endpoint, args.image[:1], args.timeout).send_one()
+
+    test = LoadTest(args.url, args.endpoint, args.image, args.timeout)
+    if args.rate:
+        print(f"Open loop at {args.rate} req/s against {test.url} ...")
+        elapsed = test.run_open_loop(args.rate, args.duration, args.requests, args.max_inflight, args.seed)
+    else:
+        print(f"Closed loop with {args.concurrency} clients against {test.url} ...")
+        elapsed = test.run_closed_loop(args.concurrency, args.duration, args.requests)
+
+    report = test.report(elapsed)
+    report['mode'] = {'rate': args.rate} if args.rate else {'concurrency': args.concurrency}
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Tells a stage worker that no more items will come
+_STOP = object()
+
+
+class StageStats:
+    def __init__(self, window=1024):
+        """
+        Work and queue-wait counters of one pipeline stage.
+        """
+        self._lock = threading.Lock()
+        self._waits = collections.deque(maxlen=window)
+        self.items = 0
+        self.batches = 0
+        self.failures = 0
+        self.busy_time = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self._waits.append(seconds)
+
+    def record_batch(self, size, seconds, failures=0):
+        with self._lock:
+            self.items += size
+            self.batches += 1
+            self.failures += failures
+            self.busy_time += seconds
+
+    def snapshot(self, workers, elapsed):
+        with self._lock:
+            waits = sorted(self._waits)
+            items, batches, failures, busy = self.items, self.batches, self.failures, self.busy_time
+
+        def pct(p):
+            return waits[min(len(waits) - 1, int(p / 100 * len(waits)))] if waits else 0.0
+
+        return {
+            'items': items,
+            'failures': failures,
+            'avg_batch': round(items / batches, 2) if batches else 0.0,
+            'busy_s': round(busy, 3),
+            # Share of the stage's worker time spent working rather than waiting for input
+            'utilization': round(busy / (workers * elapsed), 3) if elapsed > 0 else 0.0,
+            'queue_wait_ms': {'p50': round(1000 * pct(50), 1), 'p95': round(1000 * pct(95), 1)},
+        }
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, queue_size=8, batch_size=1, batch_timeout=0.005):
+        """
+        One step of a Pipeline.
+
+        Args:
+            name (str): Name used in stats.
+            fn (callable): With batch_size 1, called with one item and returns the next item.
+                Otherwise called with a list of items and returns a list of the same length;
+                an Exception instance in that list fails just that item.
+            workers (int): Threads running this stage.
+            queue_size (int): Bound of the stage's input queue; producers block when it is full.
+            batch_size (int): Most items passed to `fn` at once.
+            batch_timeout (float): Longest wait for more items once a batch has been started.
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats()
+
+
+class Pipeline:
+    def __init__(self, stages):
+        """
+        Staged producer/consumer engine: every stage has its own worker threads and a
+        bounded input queue, so decode, inference and postprocessing of different items
+        overlap and a slow stage pushes back on the ones before it.
+
+        Use submit() for one item at a time (e.g. from request handlers, whose items then
+        share forward batches) or run() to stream an iterable through in order.
+        """
+        self.stages = stages
+        self._threads = []
+        self._lock = threading.Lock()
+        self._live_workers = [stage.workers for stage in stages]
+        self._started_at = None
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if self._started_at is not None:
+                return self
+            self._started_at = time.monotonic()
+            for index, stage in enumerate(self.stages):
+                for worker in range(stage.workers):
+                    thread = threading.Thread(target=self._work, args=(index,),
+                                              name=f'pipeline-{stage.name}-{worker}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        return self
+
+    def submit(self, item):
+        """
+        Queues one item, blocking while the first stage's queue is full.
+
+        Returns:
+            Future: Resolves to the last stage's output, or to the exception a stage raised.
+        """
+        if self._closed:
+            raise RuntimeError("Pipeline is closed")
+        self.start()
+        future = Future()
+        self.stages[0].queue.put((item, future, time.monotonic()))
+        return future
+
+    def run(self, items, window=None, return_exceptions=False):
+        """
+        Streams items through the pipeline and yields their outputs in input order.
+
+        Args:
+            items (iterable): Inputs of the first stage; consumed lazily.
+            window (int): Most items in flight, defaults to the total queue and worker capacity.
+            return_exceptions (bool): Yield a failed item's exception instead of raising it.
+        """
+        if window is None:
+            window = sum(stage.queue.maxsize + stage.workers * stage.batch_size for stage in self.stages)
+        pending = collections.deque()
+
+        def result(future):
+            try:
+                return future.result()
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        for item in items:
+            pending.append(self.submit(item))
+            if len(pending) >= window:
+                yield result(pending.popleft())
+        while pending:
+            yield result(pending.popleft())
+
+    def close(self, wait=True):
+        """
+        Lets queued items finish, then stops the workers.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._started_at is None:
+            return
+        for _ in range(self.stages[0].workers):
+            self.stages[0].queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_batch(self, stage):
+        """
+        Blocks for one entry, then collects up to batch_size - 1 more within batch_timeout.
+
+        Returns:
+            tuple: (entries, True if the stop marker was seen)
+        """
+        entry = stage.queue.get()
+        if entry is _STOP:
+            return [], True
+        batch = [entry]
+        deadline = time.monotonic() + stage.batch_timeout
+        while len(batch) < stage.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = stage.queue.get(timeout=remaining) if remaining > 0 else stage.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _work(self, index):
+        stage = self.stages[index]
+        next_queue = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch(stage)
+            if not batch:
+                continue
+            now = time.monotonic()
+            for _, _, queued_at in batch:
+                stage.stats.record_wait(now - queued_at)
+
+            start = time.monotonic()
+            try:
+                if stage.batch_size == 1:
+                    outputs = [stage.fn(batch[0][0])]
+                else:
+                    outputs = stage.fn([item for item, _, _ in batch])
+                    if len(outputs) != len(batch):
+                        raise RuntimeError(f"Stage {stage.name} returned {len(outputs)} outputs for {len(batch)} items")
+            except Exception as e:
+                outputs = [e] * len(batch)
+            failures = sum(1 for output in outputs if isinstance(output, Exception))
+            stage.stats.record_batch(len(batch), time.monotonic() - start, failures)
+
+            done = time.monotonic()
+            for (_, future, _), output in zip(batch, outputs):
+                if isinstance(output, Exception):
+                    future.set_exception(output)
+                elif next_queue is None:
+                    future.set_result(output)
+                else:
+                    next_queue.put((output, future, done))
+
+        # The last worker of a stage to stop passes the stop marker on
+        with self._lock:
+            self._live_workers[index] -= 1
+            last = self._live_workers[index] == 0
+        if last and next_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                next_queue.put(_STOP)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per stage: items, failures, average batch, busy time, utilization,
+                queue-wait percentiles and current queue depth.
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        stats = {}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats.snapshot(stage.workers, elapsed)
+            stats[stage.name].update({'workers': stage.workers, 'queued': stage.queue.qsize()})
+        return stats
+
+    def format_stats(self):
+        """
+        Stats as a small text table, for CLI tools.
+        """
+        lines = [f"{'stage':<10} {'workers':>7} {'items':>7} {'batch':>6} {'util':>6} {'wait p50':>9} {'wait p95':>9}"]
+        for name, s in self.stats().items():
+            lines.append(f"{name:<10} {s['workers']:>7} {s['items']:>7} {s['avg_batch']:>6.2f} "
+                         f"{s['utilization']:>6.1%} {s['queue_wait_ms']['p50']:>7.1f}ms {s['queue_wait_ms']['p95']:>7.1f}ms")
+        return "\n".join(lines)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the inference precision modes
+Runs fish and star detection over the same images in every mode (fp32, bf16,
+fp16) and reports, against fp32: the speedup, how far the fish and star boxes
+moved and how much the measured fish lengths changed. Use it before setting
+INFERENCE_PRECISION on a new machine.
+
+    python precision_benchmark.py photos/ --modes fp32,bf16,fp16
+"""
+import argparse
+import json
+import statistics
+import time
+
+from finaly import FishDetector, StarDetector, fish_lengths_from_scale
+from image_io import box_iou, iter_images
+from inference import PRECISIONS, detect_precision
+
+
+def measure(fish_detector, star_detector, image, star_real_width=1.6):
+    """
+    Returns:
+        tuple: (fish boxes, star boxes, fish lengths in inches or None without a star)
+    """
+    fish_boxes = fish_detector.detect_fish(image)
+    star_boxes = star_detector.detect_stars(image)
+    if not star_boxes:
+        return fish_boxes, star_boxes, None
+    x1, _, x2, _ = max(star_boxes, key=lambda s: s['conf'])['box']
+    pixels_per_inch = (x2 - x1) / star_real_width
+    lengths = [fish['length_inch'] for fish in fish_lengths_from_scale(fish_boxes, pixels_per_inch)]
+    return fish_boxes, star_boxes, lengths
+
+
+def box_shift(reference, candidate):
+    """
+    Matches candidate boxes to reference boxes by IoU.
+
+    Returns:
+        tuple: (largest coordinate shift in pixels over matched boxes, number of unmatched boxes)
+    """
+    shift, unmatched = 0, 0
+    remaining = list(candidate)
+    for box in reference:
+        best = max(remaining, key=lambda c: box_iou(box, c), default=None)
+        if best is None or box_iou(box, best) < 0.5:
+            unmatched += 1
+            continue
+        remaining.remove(best)
+        shift = max(shift, max(abs(a - b) for a, b in zip(box, best)))
+    return shift, unmatched + len(remaining)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32, bf16 and fp16 inference.")
+    parser.add_argument("images", nargs="+", help="Image files, shards or directories")
+    parser.add_argument("--model", default="model.ts", help="TorchScript fish model")
+    parser.add_argument("--star-model", default="epoch162.torchscript", help="TorchScript star model")
+    parser.add_argument("--modes", default=",".join(PRECISIONS), help="Comma separated precision modes")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image (the fastest counts)")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    # fp32 is the reference of every other mode, so it always runs first and once
+    modes = args.modes.split(",")
+    if 'fp32' in modes:
+        modes.remove('fp32')
+    modes.insert(0, 'fp32')
+    print(f"Auto-detected precision on this CPU: {detect_precision()}")
+
+    results = {}
+    for mode in modes:
+        fish_detector = FishDetector(args.model, precision=mode)
+        star_detector = StarDetector(args.star_model, precision=mode)
+        fish_detector.warm_up()
+        star_detector.warm_up()
+        rows = []
+        # Images are decoded again for every mode rather than all kept in memory
+        for name, image in iter_images(args.images):
+            if image is None:
+                continue
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                output = measure(fish_detector, star_detector, image)
+                times.append(time.perf_counter() - start)
+            rows.append({'image': name, 'time': min(times), 'output': output})
+        results[mode] = rows
+
+    if not results['fp32']:
+        print("No images processed")
+        return
+
+    report = []
+    baseline = sum(row['time'] for row in results['fp32'])
+    print()
+    print(f"{'mode':<6} {'ms/image':>9} {'speedup':>8} {'fish px':>8} {'star px':>8} {'unmatched':>10} {'length in':>10}")
+    for mode, rows in results.items():
+        total = sum(row['time'] for row in rows)
+        fish_shift = star_shift = unmatched = 0
+        length_shifts = []
+        for reference, row in zip(results['fp32'], rows):
+            ref_fish, ref_stars, ref_lengths = reference['output']
+            fish, stars, lengths = row['output']
+            shift, missing = box_shift(ref_fish, fish)
+            fish_shift, unmatched = max(fish_shift, shift), unmatched + missing
+            shift, missing = box_shift([s['box'] for s in ref_stars], [s['box'] for s in stars])
+            star_shift, unmatched = max(star_shift, shift), unmatched + missing
+            if ref_lengths is not None and lengths is not None and len(ref_lengths) == len(lengths):
+                length_shifts.extend(abs(a - b) for a, b in zip(ref_lengths, lengths))
+        entry = {
+            'mode': mode,
+            'ms_per_image': round(1000 * total / len(rows), 2),
+            'speedup': round(baseline / total, 3) if total else 0.0,
+            'max_fish_box_shift_px': fish_shift,
+            'max_star_box_shift_px': star_shift,
+            'unmatched_boxes': unmatched,
+            'mean_length_shift_inch': round(statistics.mean(length_shifts), 4) if length_shifts else 0.0,
+            'max_length_shift_inch': round(max(length_shifts), 4) if length_shifts else 0.0,
+        }
+        report.append(entry)
+        print(f"{mode:<6} {entry['ms_per_image']:>9.2f} {entry['speedup']:>7.2f}x {fish_shift:>8} {star_shift:>8} "
+              f"{unmatched:>10} {entry['max_length_shift_inch']:>10.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,9 @@ import base64
 import mimetypes
 import urllib3
 import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 
 # Disable warnings about insecure HTTPS requests (mimics curl’s --insecure)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -48,6 +51,233 @@ def get_file_metadata(picture_path):
     return name, mime, size, checksum
 
 
+def list_pictures(paths):
+    """
+    Expands directories (recursively, in sorted order) into the image files they hold.
+    Files given explicitly are kept whatever their type.
+    """
+    pictures = []
+    for path in paths:
+        if not os.path.isdir(path):
+            pictures.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                mime, _ = mimetypes.guess_type(file)
+                if mime and mime.startswith("image/"):
+                    pictures.append(os.path.join(root, file))
+    return pictures
+
+
+def read_picture(picture_path):
+    """
+    Reads a picture once and computes the metadata of get_file_metadata from the bytes
+    in memory, so the upload does not read the file a second time.
+
+    Returns:
+        tuple: (name, mime, size, checksum, data)
+    """
+    with open(picture_path, "rb") as f:
+        data = f.read()
+    mime, _ = mimetypes.guess_type(picture_path)
+    checksum = base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+    return os.path.basename(picture_path), mime or "application/octet-stream", len(data), checksum, data
+
+
+class BatchRecognizer:
+    def __init__(self, key_id, key_secret, auth_url, api_url, jobs=4, timeout=60.0):
+        """
+        Recognizes many pictures with one auth token and one pooled HTTP session.
+
+        Args:
+            auth_url (str): Base URL of the Fishial auth API.
+            api_url (str): Base URL of the Fishial recognition API.
+            jobs (int): Pictures recognized concurrently; sizes the connection pool.
+            timeout (float): Timeout of every HTTP call, in seconds.
+        """
+        self.auth_payload = {"client_id": key_id, "client_secret": key_secret}
+        self.auth_url = f"{auth_url}/v1/auth/token"
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=jobs)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._auth_header = None
+        self._auth_lock = threading.Lock()
+
+    def authenticate(self, stale_header=None):
+        """
+        Returns the Authorization header, obtaining a token on first use. Passing the header
+        that was just rejected fetches a new token, once for all threads that saw it fail.
+        """
+        with self._auth_lock:
+            if self._auth_header is None or self._auth_header is stale_header:
+                r = self.session.post(self.auth_url, json=self.auth_payload, timeout=self.timeout,
+                                      headers={"Content-Type": "application/json"})
+                r.raise_for_status()
+                auth_token = r.json().get("access_token")
+                if not auth_token:
+                    raise ValueError("Failed to obtain access token.")
+                self._auth_header = {"Authorization": f"Bearer {auth_token}"}
+            return self._auth_header
+
+    def authorized(self, method, url, headers=None, **kwargs):
+        """
+        Sends a request with the shared token, renewing it once if it has expired.
+        """
+        auth_header = self.authenticate()
+        r = self.session.request(method, url, headers={**(headers or {}), **auth_header}, timeout=self.timeout,
+                                 **kwargs)
+        if r.status_code == 401:
+            auth_header = self.authenticate(stale_header=auth_header)
+            r = self.session.request(method, url, headers={**(headers or {}), **auth_header}, timeout=self.timeout,
+                                     **kwargs)
+        r.raise_for_status()
+        return r
+
+    def recognize(self, picture_path):
+        """
+        Uploads one picture and runs recognition on it.
+
+        Returns:
+            dict: The JSON Lines record of the picture.
+        """
+        name, mime, size, checksum, data = read_picture(picture_path)
+        upload_payload = {"blob": {"filename": name, "content_type": mime, "byte_size": size, "checksum": checksum}}
+        r = self.authorized("POST", f"{self.api_url}/v1/recognition/upload", json=upload_payload,
+                            headers={"Content-Type": "application/json", "Accept": "application/json"})
+        upload_data = r.json()
+        signed_id = upload_data.get("signed-id")
+        direct_upload = upload_data.get("direct-upload", {})
+        direct_upload_url = direct_upload.get("url")
+        content_disposition = direct_upload.get("headers", {}).get("Content-Disposition")
+        if not (signed_id and direct_upload_url and content_disposition):
+            raise ValueError("Missing upload information in response.")
+
+        put_headers = {"Content-Disposition": content_disposition, "Content-Md5": checksum, "Content-Type": ""}
+        self.session.put(direct_upload_url, data=data, headers=put_headers, timeout=self.timeout).raise_for_status()
+
+        r = self.authorized("GET", f"{self.api_url}/v1/recognition/image?q={signed_id}")
+        results = r.json().get("results", [])
+        return {"file": picture_path, "byte_size": size, "checksum": checksum, "fish_count": len(results),
+                "results": results}
+
+
+def compact_output(output_path):
+    """
+    Prepares an earlier run's JSON Lines output for resuming: keeps one record per
+    recognized picture and drops failed pictures and a line cut off by an interruption,
+    so they are processed again without leaving a stale record behind.
+
+    Returns:
+        set: The pictures already recognized.
+    """
+    records = {}
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                records[record["file"]] = record
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for record in records.values():
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, output_path)
+    return set(records)
+
+
+def run_batch(args):
+    """
+    Batch mode: recognizes every picture with a shared token and connection pool, writing
+    one JSON line per picture as soon as it is done.
+
+    At most twice --jobs pictures are queued at a time. On Ctrl-C the queued ones are
+    cancelled and the ones already being recognized are finished and written, so
+    --resume picks up exactly where the run stopped.
+
+    Returns:
+        int: Exit status, 1 if any picture failed, 130 if interrupted.
+    """
+    pictures = list_pictures(args.pictures)
+    if args.resume:
+        if not args.output:
+            err("--resume needs --output.")
+        done = compact_output(args.output)
+        remaining = [picture for picture in pictures if picture not in done]
+        print(f"Resuming: {len(pictures) - len(remaining)} pictures already recognized", file=sys.stderr)
+        pictures = remaining
+    if not args.identify and (not args.key_id or not args.key_secret):
+        err("Both --key-id and --key-secret must be provided for fish recognition.")
+
+    def process(picture):
+        if args.identify:
+            name, mime, size, checksum, _ = read_picture(picture)
+            return {"file": picture, "name": name, "mime": mime, "byte_size": size, "checksum": checksum}
+        return recognizer.recognize(picture)
+
+    recognizer = None
+    if not args.identify:
+        recognizer = BatchRecognizer(args.key_id, args.key_secret, args.auth_url, args.api_url, args.jobs,
+                                     args.timeout)
+
+    out = open(args.output, "a" if args.resume else "w") if args.output else sys.stdout
+    written = failed = 0
+
+    def write(future, picture):
+        nonlocal written, failed
+        try:
+            record = future.result()
+        except Exception as e:
+            failed += 1
+            record = {"file": picture, "error": f"{type(e).__name__}: {e}"}
+            logging.warning("Failed on %s: %s", picture, e)
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        written += 1
+        logging.debug("%d/%d done", written, len(pictures))
+
+    executor = ThreadPoolExecutor(max_workers=args.jobs)
+    queued = iter(pictures)
+    in_flight = {}
+    interrupted = False
+    try:
+        while True:
+            for picture in queued:
+                in_flight[executor.submit(process, picture)] = picture
+                if len(in_flight) >= 2 * args.jobs:
+                    break
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                write(future, in_flight[future])
+                del in_flight[future]
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted: finishing the pictures being recognized...", file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future, picture in in_flight.items():
+            if not future.cancelled():
+                write(future, picture)
+    finally:
+        executor.shutdown(wait=True)
+        if out is not sys.stdout:
+            out.close()
+    print(f"{written - failed} pictures processed, {failed} failed"
+          + (f", {len(pictures) - written} left for --resume" if interrupted else ""), file=sys.stderr)
+    if interrupted:
+        return 130
+    return 1 if failed else 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Fishial Recognition command line tool.",
@@ -70,9 +300,17 @@ Examples:
 
         Requests recognition of fishes pictured on fishpic.jpg.
         Client key "abc123" with secret "abcd1234" will be used.
+
+    recognize_fish -k abc123 -s abcd1234 -j 8 -o results.jsonl photos/
+    recognize_fish -k abc123 -s abcd1234 -j 8 -o results.jsonl --resume photos/
+
+        Batch mode: recognizes every picture in photos/, 8 at a time, with one
+        auth token, writing one JSON line per picture to results.jsonl.
+        --resume skips the pictures an interrupted run already recognized.
 """,
     )
-    parser.add_argument("picture", nargs="?", help="Picture file to process")
+    parser.add_argument("pictures", nargs="*",
+                        help="Picture file to process. Several files or a directory select batch mode.")
     parser.add_argument(
         "-i",
         "--identify",
@@ -84,19 +322,35 @@ Examples:
     parser.add_argument(
         "--debug", action="store_true", help="Enable debug logging output."
     )
+    parser.add_argument("-o", "--output", help="Batch mode: JSON Lines output file (default: standard output).")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Batch mode: pictures recognized concurrently.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Batch mode: skip pictures already recognized in --output and append to it.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Batch mode: timeout of every HTTP call.")
+    parser.add_argument("--auth-url", default=os.getenv("FISHIAL_AUTH_URL", "https://api-users.fishial.ai"),
+                        help="Base URL of the Fishial auth API.")
+    parser.add_argument("--api-url", default=os.getenv("FISHIAL_API_URL", "https://api.fishial.ai"),
+                        help="Base URL of the Fishial recognition API.")
 
     args = parser.parse_args()
+    args.auth_url = args.auth_url.rstrip("/")
+    args.api_url = args.api_url.rstrip("/")
 
     # Update logging level based on the --debug flag.
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
-    if args.picture is None or not os.path.isfile(args.picture):
+    if (args.output or len(args.pictures) > 1
+            or any(os.path.isdir(picture) for picture in args.pictures)):
+        sys.exit(run_batch(args))
+
+    if not args.pictures or not os.path.isfile(args.pictures[0]):
         err("No picture file has been specified.")
+    picture = args.pictures[0]
 
     # IDENTIFY METADATA
     print("Identifying picture metadata...\n")
-    name, mime, size, checksum = get_file_metadata(args.picture)
+    name, mime, size, checksum = get_file_metadata(picture)
     print(f"  file name: {name}")
     print(f"  MIME type: {mime}")
     print(f"  byte size: {size}")
@@ -114,7 +368,7 @@ Examples:
     # OBTAIN AUTH TOKEN
     #############################
     print("Obtaining auth token...")
-    auth_url = "https://api-users.fishial.ai/v1/auth/token"
+    auth_url = f"{args.auth_url}/v1/auth/token"
     auth_payload = {"client_id": args.key_id, "client_secret": args.key_secret}
 
     logging.debug("Auth token request URL: %s", auth_url)
@@ -151,7 +405,7 @@ Examples:
     # OBTAIN UPLOAD URL
     #############################
     print("\nObtaining upload url...")
-    upload_url_api = "https://api.fishial.ai/v1/recognition/upload"
+    upload_url_api = f"{args.api_url}/v1/recognition/upload"
     upload_payload = {
         "blob": {
             "filename": name,
@@ -207,7 +461,7 @@ Examples:
     logging.debug("File upload headers: %s", json.dumps(put_headers))
 
     try:
-        with open(args.picture, "rb") as f:
+        with open(picture, "rb") as f:
             r = requests.put(
                 direct_upload_url, data=f, headers=put_headers, verify=False
             )
@@ -230,7 +484,7 @@ Examples:
     # RUN RECOGNITION
     #############################
     print("\nRequesting fish recognition...")
-    recognition_url = f"https://api.fishial.ai/v1/recognition/image?q={signed_id}"
+    recognition_url = f"{args.api_url}/v1/recognition/image?q={signed_id}"
     logging.debug("Fish recognition URL: %s", recognition_url)
 
     try:
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# cv2.imdecode flags that let libjpeg decode straight to 1/2, 1/4 or 1/8 resolution
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class ByteBudgetLRU:
+    def __init__(self, max_bytes, ttl=None):
+        """
+        Thread-safe LRU mapping bounded by the total size of its values.
+
+        Args:
+            max_bytes (int): Least recently used entries are evicted beyond this many bytes.
+            ttl (float): Optional seconds after which an entry is dropped.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.size -= nbytes
+
+    def metrics(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+class StoredResult:
+    def __init__(self, image_bytes, image_shape, fish_boxes, star_boxes, fish_lengths, pixels_per_inch):
+        """
+        What is needed to annotate a measured image later: the encoded upload and its detections.
+        """
+        self.image_bytes = image_bytes
+        self.image_shape = image_shape
+        self.fish_boxes = fish_boxes
+        self.star_boxes = star_boxes
+        self.fish_lengths = fish_lengths
+        self.pixels_per_inch = pixels_per_inch
+
+
+def decode_downscaled(image_bytes, image_shape, max_side):
+    """
+    Decodes an image with its longer side at most `max_side`, using libjpeg's
+    reduced-resolution decoding where possible instead of decoding full size.
+
+    Returns:
+        tuple: (image, scale relative to the original), or (None, None) if it cannot be decoded.
+    """
+    height, width = image_shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+        if scale <= 1 / factor:
+            flag = reduced_flag
+            break
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if image is None:
+        return None, None
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if (image.shape[1], image.shape[0]) != target:
+        image = cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+    return image, scale
+
+
+def render_result(result, max_side=1024, quality=80):
+    """
+    Draws a stored result's fish and star boxes on a downscaled copy of its image.
+
+    Returns:
+        bytes: The annotated JPEG, or None if the stored image cannot be decoded.
+    """
+    image, scale = decode_downscaled(result.image_bytes, result.image_shape, max_side)
+    if image is None:
+        return None
+
+    from finaly import draw_boxes
+
+    # Labels keep the full-resolution measurements
+    annotated = draw_boxes(image, result.fish_boxes, result.star_boxes, result.pixels_per_inch,
+                           result.fish_lengths, scale)
+    ok, encoded = cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+class Renderer:
+    def __init__(self, store_bytes=256 << 20, cache_bytes=64 << 20, ttl=600.0):
+        """
+        Keeps measured results by id and renders annotated images on request.
+
+        Args:
+            store_bytes (int): Memory budget for stored uploads (LRU beyond it).
+            cache_bytes (int): Memory budget for rendered JPEGs (LRU beyond it).
+            ttl (float): Seconds a result can be rendered after it was measured.
+        """
+        self.results = ByteBudgetLRU(store_bytes, ttl)
+        self.rendered = ByteBudgetLRU(cache_bytes, ttl)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a renderer from RESULT_STORE_MB, RENDER_CACHE_MB and RESULT_TTL.
+        """
+        return cls(
+            store_bytes=int(float(os.getenv('RESULT_STORE_MB', '256')) * (1 << 20)),
+            cache_bytes=int(float(os.getenv('RENDER_CACHE_MB', '64')) * (1 << 20)),
+            ttl=float(os.getenv('RESULT_TTL', '600')),
+        )
+
+    def store(self, image_bytes, image_shape, measurement):
+        """
+        Keeps a measurement for later rendering.
+
+        Returns:
+            str: The result id clients pass to /render/<result_id>.
+        """
+        result_id = uuid.uuid4().hex
+        result = StoredResult(image_bytes, image_shape, measurement['fish_boxes'], measurement['star_boxes'],
+                              measurement['fish_lengths'], measurement['pixels_per_inch'])
+        self.results.put(result_id, result, len(image_bytes))
+        return result_id
+
+    def render(self, result_id, max_side=1024, quality=80):
+        """
+        Returns the annotated JPEG of a stored result, rendering it on a cache miss.
+
+        Returns:
+            bytes: The JPEG, or None if the result is unknown or expired.
+        """
+        key = (result_id, max_side, quality)
+        encoded = self.rendered.get(key)
+        if encoded is not None:
+            return encoded
+
+        result = self.results.get(result_id)
+        if result is None:
+            return None
+        encoded = render_result(result, max_side, quality)
+        if encoded is not None:
+            self.rendered.put(key, encoded, len(encoded))
+        return encoded
+
+    @staticmethod
+    def parse_options(args):
+        """
+        Reads max_side and quality query parameters, clamped to sane ranges.
+
+        Raises:
+            ValueError: If a parameter is not an integer.
+        """
+        max_side = min(4096, max(64, int(args.get('max_side', 1024))))
+        quality = min(95, max(10, int(args.get('quality', 80))))
+        return max_side, quality
+
+    def metrics(self):
+        return {'results': self.results.metrics(), 'rendered': self.rendered.metrics()}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Packed image shards for bulk reprocessing
+A shard is one flat file holding many encoded images back to back, followed by
+a JSON index of (name, offset, length) and a fixed-size footer pointing at it.
+Reading a shard memory-maps it once and hands cv2.imdecode zero-copy slices,
+instead of opening every small JPEG on a slow network filesystem.
+
+    python shards.py pack archive/2019 --output shards/ --prefix 2019
+    python shards.py list shards/2019-00000.shard
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import cv2
+import numpy as np
+
+SHARD_EXTENSION = '.shard'
+SHARD_MAGIC = b'FSHARD01'
+# index offset, index length, magic
+_FOOTER = struct.Struct('<QQ8s')
+
+
+class ShardWriter:
+    def __init__(self, path):
+        """
+        Writes one shard. The file appears under `path` only once close() has
+        written the index, so readers never see a half-written shard.
+        """
+        self.path = path
+        self.index = []
+        self.size = len(SHARD_MAGIC)
+        self._tmp_path = path + '.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(SHARD_MAGIC)
+
+    def add(self, name, data):
+        """
+        Appends the encoded bytes of one image.
+        """
+        self._file.write(data)
+        self.index.append((name, self.size, len(data)))
+        self.size += len(data)
+
+    def close(self):
+        if self._file is None:
+            return
+        index = json.dumps(self.index).encode('utf-8')
+        self._file.write(index)
+        self._file.write(_FOOTER.pack(self.size, len(index), SHARD_MAGIC))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+
+class ShardReader:
+    def __init__(self, path):
+        """
+        Memory-maps a shard and parses its index.
+
+        Views returned by view() and iteration point into the mapping; the mapping
+        stays alive until the reader is closed and no view is left.
+
+        Raises:
+            ValueError: If the file is not a shard.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if len(self._mmap) < len(SHARD_MAGIC) + _FOOTER.size or self._view[:len(SHARD_MAGIC)] != SHARD_MAGIC:
+            self.close()
+            raise ValueError(f"Not an image shard: {path}")
+        index_offset, index_length, magic = _FOOTER.unpack(self._view[-_FOOTER.size:])
+        if magic != SHARD_MAGIC:
+            self.close()
+            raise ValueError(f"Truncated image shard: {path}")
+        self.index = json.loads(bytes(self._view[index_offset:index_offset + index_length]))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.index]
+
+    def view(self, i):
+        """
+        Returns:
+            memoryview: The encoded bytes of image i, without copying.
+        """
+        _, offset, length = self.index[i]
+        return self._view[offset:offset + length]
+
+    def __iter__(self):
+        """
+        Yields (name, memoryview) for every image in the shard.
+        """
+        for i, (name, _, _) in enumerate(self.index):
+            yield name, self.view(i)
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views are still in use (e.g. queued in a pipeline); the mapping is
+            # released when the last of them is garbage collected
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def decode_view(data, flags=cv2.IMREAD_COLOR):
+    """
+    Decodes encoded image bytes (bytes or a shard memoryview) without copying them first.
+
+    Returns:
+        np.ndarray: The image, or None if the bytes are not an image.
+    """
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+def assign_shards(paths, worker_index=0, num_workers=1):
+    """
+    Picks the inputs of one worker so that separate workers get disjoint sets.
+
+    Args:
+        paths (list): Shards (or other inputs) in a fixed order, the same for every worker.
+        worker_index (int): This worker, 0 <= worker_index < num_workers.
+        num_workers (int): Number of workers splitting the inputs.
+
+    Returns:
+        list: Every num_workers-th input, starting at worker_index.
+    """
+    if not 0 <= worker_index < num_workers:
+        raise ValueError(f"worker_index must be in [0, {num_workers}), got {worker_index}")
+    return paths[worker_index::num_workers]
+
+
+def pack_images(paths, output_dir, prefix='images', max_bytes=1 << 30):
+    """
+    Packs image files into shards of at most about `max_bytes` each.
+
+    Files are stored as they are (no re-encoding) under their path as given.
+
+    Returns:
+        list: Paths of the written shards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shards = []
+    writer = None
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if writer is not None and writer.size + len(data) > max_bytes:
+            writer.close()
+            writer = None
+        if writer is None:
+            shard_path = os.path.join(output_dir, f"{prefix}-{len(shards):05d}{SHARD_EXTENSION}")
+            writer = ShardWriter(shard_path)
+            shards.append(shard_path)
+        writer.add(os.path.normpath(path), data)
+    if writer is not None:
+        writer.close()
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack images into shards or list a shard's contents.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Pack image files into shards")
+    pack.add_argument("images", nargs="+", help="Image files or directories")
+    pack.add_argument("--output", required=True, help="Directory for the shards")
+    pack.add_argument("--prefix", default="images", help="Shard file name prefix")
+    pack.add_argument("--shard-mb", type=int, default=1024, help="Approximate size of each shard")
+    listing = commands.add_parser("list", help="List the images in shards")
+    listing.add_argument("shards", nargs="+")
+    args = parser.parse_args()
+
+    from image_io import list_images
+
+    if args.command == "pack":
+        paths = list_images(args.images)
+        shards = pack_images(paths, args.output, args.prefix, args.shard_mb << 20)
+        print(f"Packed {len(paths)} images into {len(shards)} shards in {args.output}")
+    else:
+        for path in args.shards:
+            with ShardReader(path) as reader:
+                for name, _, length in reader.index:
+                    print(f"{path}/{name}\t{length}")
+
+
+if __name__ == "__main__":
+    main()
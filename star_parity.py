@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Parity check of the TorchScript star detector against ultralytics
+Runs every image through ultralytics on the original .pt weights and through
+finaly.StarDetector on the TorchScript export, matches the star boxes by IoU
+and reports boxes or confidences that disagree. Exits with status 1 if any
+image fails, so it can gate a new export.
+
+    python star_parity.py images/ --weights epoch162.pt --export epoch162.torchscript
+"""
+import argparse
+import sys
+import time
+
+from finaly import StarDetector
+from image_io import box_iou, iter_images
+
+
+def match_stars(reference, candidate, iou_tol, conf_tol, conf_threshold):
+    """
+    Greedily matches reference stars to candidate stars by IoU.
+
+    Stars missing on one side only count as failures if their confidence is
+    clearly above the threshold; borderline stars may flip either way.
+
+    Returns:
+        tuple: (list of (reference, candidate, iou) matches, list of failure messages)
+    """
+    matches, failures = [], []
+    unmatched = list(candidate)
+    for star in sorted(reference, key=lambda s: -s['conf']):
+        best = max(unmatched, key=lambda c: box_iou(star['box'], c['box']), default=None)
+        iou = box_iou(star['box'], best['box']) if best is not None else 0.0
+        if best is None or iou < iou_tol:
+            if star['conf'] - conf_threshold > conf_tol:
+                failures.append(f"missing star {star['box']} conf {star['conf']:.3f} (best IoU {iou:.2f})")
+            continue
+        unmatched.remove(best)
+        matches.append((star, best, iou))
+        if abs(star['conf'] - best['conf']) > conf_tol:
+            failures.append(f"conf {best['conf']:.3f} vs {star['conf']:.3f} for {star['box']}")
+
+    for star in unmatched:
+        if star['conf'] - conf_threshold > conf_tol:
+            failures.append(f"extra star {star['box']} conf {star['conf']:.3f}")
+    return matches, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TorchScript star detection with ultralytics.")
+    parser.add_argument("images", nargs="+", help="Image files, shards or directories")
+    parser.add_argument("--weights", default="epoch162.pt", help="ultralytics star model weights")
+    parser.add_argument("--export", default="epoch162.torchscript", help="TorchScript export of the same model")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold for both paths")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold for both paths")
+    parser.add_argument("--iou-tol", type=float, default=0.9, help="Minimum IoU of matching boxes")
+    parser.add_argument("--conf-tol", type=float, default=0.05, help="Largest allowed confidence difference")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    reference_model = YOLO(args.weights)
+    detector = StarDetector(args.export, conf_threshold=args.conf, nms_threshold=args.iou)
+
+    failed = total = 0
+    ious = []
+    reference_time = candidate_time = 0.0
+    for path, image in iter_images(args.images):
+        if image is None:
+            print(f"Could not load image: {path}")
+            continue
+        total += 1
+
+        start = time.perf_counter()
+        result = reference_model(image, conf=args.conf, iou=args.iou, verbose=False)[0]
+        reference_time += time.perf_counter() - start
+        reference = [{'box': tuple(map(int, box)), 'conf': float(conf)}
+                     for box, conf in zip(result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy())]
+
+        start = time.perf_counter()
+        candidate = detector.detect_stars(image)
+        candidate_time += time.perf_counter() - start
+
+        matches, failures = match_stars(reference, candidate, args.iou_tol, args.conf_tol, args.conf)
+        ious.extend(iou for _, _, iou in matches)
+        if failures:
+            failed += 1
+            print(f"❌ {path}: {len(reference)} ultralytics vs {len(candidate)} TorchScript stars")
+            for failure in failures:
+                print(f"     {failure}")
+        else:
+            print(f"✅ {path}: {len(matches)} stars match")
+
+    if not total:
+        print("No images processed")
+        return 1
+
+    print()
+    print(f"Images: {total}, failed: {failed}")
+    if ious:
+        print(f"Matched stars: {len(ious)}, mean IoU {sum(ious) / len(ious):.3f}, min IoU {min(ious):.3f}")
+    print(f"Average time: ultralytics {1000 * reference_time / total:.1f} ms, "
+          f"TorchScript {1000 * candidate_time / total:.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
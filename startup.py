@@ -0,0 +1,123 @@
+import contextlib
+import importlib
+import os
+import threading
+import time
+
+
+class ServiceNotReady(Exception):
+    def __init__(self, retry_after=5):
+        """
+        Raised when a request arrives before the models are loaded and warmed up.
+
+        Args:
+            retry_after (int): Seconds the client should wait before retrying.
+        """
+        super().__init__("Service is starting up, models are not ready yet")
+        self.retry_after = retry_after
+
+
+class ServiceLoader:
+    def __init__(self, factory='fish_service:create_service_from_env', warmup_runs=1):
+        """
+        Builds the measurement service in a background thread so the server can
+        accept connections (and answer liveness probes) while models load.
+
+        Startup runs in phases, each timed and logged: importing the factory's module
+        (which pulls in torch), loading the models, and warm-up inferences on dummy inputs.
+        ultralytics is only imported, during the models phase, when STAR_MODEL_PATH
+        points at .pt weights.
+
+        Args:
+            factory (str): "module:function" that builds the service; imported lazily.
+            warmup_runs (int): Dummy inferences per model before reporting ready (0 skips warm-up).
+        """
+        self.factory = factory
+        self.warmup_runs = warmup_runs
+        self.timings = {}
+        self.error = None
+        self._service = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self._started_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls, factory='fish_service:create_service_from_env'):
+        """
+        Builds a loader from WARMUP_RUNS.
+        """
+        return cls(factory, warmup_runs=int(os.getenv('WARMUP_RUNS', '1')))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        yield
+        self.timings[name] = round(time.monotonic() - start, 3)
+        print(f"[startup] {name}: {self.timings[name]:.2f}s")
+
+    def start(self):
+        """
+        Starts loading in the background; calling it again does nothing.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load, name='service-loader', daemon=True)
+            self._thread.start()
+        return self
+
+    def load(self):
+        try:
+            self._load()
+        finally:
+            self._done.set()
+
+    def _load(self):
+        try:
+            with self.phase('imports'):
+                module_name, function_name = self.factory.split(':')
+                factory = getattr(importlib.import_module(module_name), function_name)
+            with self.phase('models'):
+                service = factory()
+            if self.warmup_runs:
+                with self.phase('warmup'):
+                    service.warm_up(self.warmup_runs)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[startup] failed: {self.error}")
+            return
+        self.timings['total'] = round(time.monotonic() - self._started_at, 3)
+        print(f"[startup] ready after {self.timings['total']:.2f}s")
+        self._service = service
+        self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until loading finishes; returns False on timeout or if loading failed.
+        """
+        self._done.wait(timeout)
+        return self.ready
+
+    def get(self):
+        """
+        Returns the service.
+
+        Raises:
+            ServiceNotReady: While loading, or if loading failed.
+        """
+        if not self._ready.is_set():
+            raise ServiceNotReady()
+        return self._service
+
+    def status(self):
+        """
+        Returns:
+            dict: Readiness, startup phase timings and the loading error, if any.
+        """
+        status = {"ready": self.ready, "timings": dict(self.timings)}
+        if self.error:
+            status["error"] = self.error
+        return status
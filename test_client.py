@@ -1,8 +1,5 @@
 import requests
 import base64
-import json
-from PIL import Image
-import io
 
 # API base URL
 BASE_URL = "http://localhost:5000"
@@ -15,30 +12,37 @@ def test_health():
     print(f"Response: {response.json()}")
     print()
 
+def save_render(result_id, output_path):
+    """Fetch the annotated image of a result and save it"""
+    response = requests.get(f"{BASE_URL}/render/{result_id}", params={'max_side': 1024})
+    if response.status_code == 200:
+        with open(output_path, 'wb') as f:
+            f.write(response.content)
+        print(f"Annotated image saved as: {output_path}")
+    else:
+        print(f"Render failed: {response.status_code} {response.text}")
+
+def print_result(data):
+    print(f"Fish detected: {data['fish_count']}")
+    print(f"Fish lengths: {data['fish_lengths']}")
+    for species in data['fish_species']:
+        print(f"Species: {species['name']} ({species['accuracy']:.2f})")
+
 def test_file_upload(image_path):
     """Test file upload endpoint"""
     print(f"Testing file upload with {image_path}...")
     
     with open(image_path, 'rb') as f:
         files = {'image': f}
-        response = requests.post(f"{BASE_URL}/detect", files=files)
+        response = requests.post(f"{BASE_URL}/fish-length", files=files)
     
     print(f"Status: {response.status_code}")
     if response.status_code == 200:
         data = response.json()
-        print(f"Fish detected: {data['detections']['fish_count']}")
-        print(f"Stars detected: {data['detections']['star_count']}")
-        print(f"Pixels per inch: {data['detections']['pixels_per_inch']}")
-        
-        # Save the processed image
-        img_data = base64.b64decode(data['processed_image'])
-        with open(f"api_result_{image_path}", 'wb') as f:
-            f.write(img_data)
-        print(f"Processed image saved as: api_result_{image_path}")
+        print_result(data)
         
-        # Print fish details
-        for fish in data['detections']['fish_details']:
-            print(f"Fish {fish['fish_id']}: {fish['length_inch']:.2f}\"")
+        # Annotated images are rendered on demand from the result id
+        save_render(data['result_id'], f"api_result_{image_path}")
     else:
         print(f"Error: {response.text}")
     print()
@@ -53,24 +57,15 @@ def test_base64_upload(image_path):
         base64_data = base64.b64encode(image_data).decode('utf-8')
     
     payload = {'image': base64_data}
-    response = requests.post(f"{BASE_URL}/detect_base64", json=payload)
+    response = requests.post(f"{BASE_URL}/fish-length-base64", json=payload)
     
     print(f"Status: {response.status_code}")
     if response.status_code == 200:
         data = response.json()
-        print(f"Fish detected: {data['detections']['fish_count']}")
-        print(f"Stars detected: {data['detections']['star_count']}")
-        print(f"Pixels per inch: {data['detections']['pixels_per_inch']}")
-        
-        # Save the processed image
-        img_data = base64.b64decode(data['processed_image'])
-        with open(f"api_result_base64_{image_path}", 'wb') as f:
-            f.write(img_data)
-        print(f"Processed image saved as: api_result_base64_{image_path}")
+        print_result(data)
         
-        # Print fish details
-        for fish in data['detections']['fish_details']:
-            print(f"Fish {fish['fish_id']}: {fish['length_inch']:.2f}\"")
+        # Annotated images are rendered on demand from the result id
+        save_render(data['result_id'], f"api_result_base64_{image_path}")
     else:
         print(f"Error: {response.text}")
     print()
@@ -0,0 +1,34 @@
+"""
+Stand-in for inference_pool.worker_main that loads no models, for pool tests.
+
+Options (besides the pool's own): 'load_delay' seconds before reporting ready,
+and 'pid_log', a file every started worker appends its pid to.
+"""
+import os
+import time
+from multiprocessing.connection import Connection
+
+
+def worker_main(fd, options):
+    conn = Connection(fd)
+    if options.get('pid_log'):
+        with open(options['pid_log'], 'a') as f:
+            f.write(f"{os.getpid()}\n")
+    time.sleep(options.get('load_delay', 0))
+    conn.send(('ready', os.getpid()))
+
+    stall_pings = False
+    while True:
+        try:
+            op, *args = conn.recv()
+        except (EOFError, OSError):
+            return
+        if op == 'stop':
+            return
+        if op == 'hang' or (op == 'ping' and stall_pings):
+            time.sleep(3600)
+        if op == 'exit':
+            os._exit(1)
+        if op == 'stall_pings':
+            stall_pings = True
+        conn.send(('ok', os.getpid()))
@@ -0,0 +1,24 @@
+import asyncio
+
+from admission import AsyncAdmissionController, ServiceSaturated
+
+
+def test_async_slot_returns_every_permit_under_timeouts():
+    controller = AsyncAdmissionController(max_concurrency=2, max_queue=50, queue_timeout=0.01)
+
+    async def job():
+        try:
+            async with controller.slot():
+                await asyncio.sleep(0.005)
+        except ServiceSaturated:
+            pass
+
+    async def run():
+        for _ in range(20):
+            await asyncio.gather(*(job() for _ in range(20)))
+
+    asyncio.run(run())
+    assert controller._semaphore._value == 2
+    metrics = controller.metrics()
+    assert metrics['in_flight'] == 0 and metrics['queued'] == 0
+    assert metrics['rejected'] > 0
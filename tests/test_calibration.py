@@ -0,0 +1,28 @@
+import numpy as np
+
+from calibration import CalibrationCache
+from fish_service import FishLengthService
+
+
+class StubStars:
+    def __init__(self, star_boxes):
+        self.star_boxes = star_boxes
+
+    def detect_stars(self, image):
+        return [dict(star) for star in self.star_boxes]
+
+
+def test_put_skips_empty_star_box():
+    cache = CalibrationCache()
+    image = np.full((100, 100, 3), 114, dtype=np.uint8)
+    assert cache.put('rig', image, (10, 10, 30, 30), 0.9, 12.5) is not None
+    assert cache.put('rig', image, (20, 10, 20, 30), 0.9, 0.0) is None
+    assert cache.get('rig') is None
+
+
+def test_calibrate_with_degenerate_star_box():
+    image = np.full((100, 100, 3), 114, dtype=np.uint8)
+    star_boxes = [{'box': (40, 40, 52, 40), 'conf': 0.8}]
+    service = FishLengthService(None, None, CalibrationCache(), star_detector=StubStars(star_boxes))
+    assert service.calibrate(image, 'rig') == (star_boxes, 'detected')
+    assert service.calibration_cache.get('rig') is None
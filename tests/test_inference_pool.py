@@ -0,0 +1,110 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from inference_pool import InferencePool, InferenceWorkerError
+
+
+def make_pool(tmp_path, workers=1, load_delay=0.0, **kwargs):
+    pool = InferencePool(workers=workers, worker_target='tests.stub_worker:worker_main', **kwargs)
+    pool.options.update(load_delay=load_delay, pid_log=str(tmp_path / 'pids'))
+    return pool
+
+
+def started_pids(tmp_path):
+    with open(tmp_path / 'pids') as f:
+        return [int(line) for line in f]
+
+
+def running(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def call_eventually(pool, message, timeout=10.0):
+    end = time.monotonic() + timeout
+    while True:
+        try:
+            return pool._call(message)
+        except InferenceWorkerError:
+            if time.monotonic() > end:
+                raise
+            time.sleep(0.05)
+
+
+def test_killed_worker_is_restarted(tmp_path):
+    pool = make_pool(tmp_path, task_timeout=2.0, health_interval=0).start()
+    try:
+        pid = pool._call(('echo',))
+        os.kill(pid, signal.SIGKILL)
+        with pytest.raises(InferenceWorkerError):
+            pool._call(('echo',))
+        assert call_eventually(pool, ('echo',)) != pid
+        assert pool.restarts == 1
+    finally:
+        pool.close()
+
+
+def test_hung_task_fails_without_waiting_for_the_restart(tmp_path):
+    pool = make_pool(tmp_path, load_delay=1.0, task_timeout=0.3, health_interval=0).start()
+    try:
+        start = time.monotonic()
+        with pytest.raises(InferenceWorkerError):
+            pool._call(('hang',))
+        # The caller pays the task timeout, not the replacement's model loading
+        assert time.monotonic() - start < 0.9
+        assert call_eventually(pool, ('echo',)) not in started_pids(tmp_path)[:1]
+    finally:
+        pool.close()
+
+
+def test_monitor_does_not_double_start_a_restarting_slot(tmp_path):
+    # The monitor ticks many times while the replacement is loading
+    pool = make_pool(tmp_path, load_delay=0.5, task_timeout=0.2, health_interval=0.02).start()
+    try:
+        with pytest.raises(InferenceWorkerError):
+            pool._call(('hang',))
+        call_eventually(pool, ('echo',))
+        time.sleep(0.3)
+        assert len(started_pids(tmp_path)) == 2
+        assert pool._idle.qsize() == 1
+    finally:
+        pool.close()
+    assert not any(running(pid) for pid in started_pids(tmp_path))
+
+
+def test_hung_idle_worker_does_not_starve_callers(tmp_path):
+    pool = make_pool(tmp_path, workers=2, task_timeout=2.0, health_interval=0.05).start()
+    try:
+        pool._call(('stall_pings',))
+        errors = []
+
+        def caller():
+            for _ in range(20):
+                try:
+                    pool._call(('echo',))
+                except InferenceWorkerError as e:
+                    errors.append(e)
+                time.sleep(0.02)
+
+        threads = [threading.Thread(target=caller) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+    finally:
+        pool.close()
+
+
+def test_close_stops_every_worker(tmp_path):
+    pool = make_pool(tmp_path, workers=2, health_interval=0.05).start()
+    pool.close()
+    assert not any(running(pid) for pid in started_pids(tmp_path))
+    assert pool.metrics()['live'] == 0
@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def jittered(fn):
+    def stage_fn(item):
+        time.sleep(random.uniform(0, 0.005))
+        return fn(item)
+    return stage_fn
+
+
+def test_run_yields_in_input_order():
+    pipeline = Pipeline([
+        Stage('add', jittered(lambda x: x + 1), workers=3, queue_size=2),
+        Stage('double', jittered(lambda x: x * 2), workers=2, queue_size=2),
+    ])
+    assert list(pipeline.run(range(50))) == [(x + 1) * 2 for x in range(50)]
+    pipeline.close()
+
+
+def test_failed_item_raises_or_is_returned():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("three")
+        return x
+
+    pipeline = Pipeline([Stage('check', fail_on_three, workers=2)])
+    outputs = list(pipeline.run(range(6), return_exceptions=True))
+    assert isinstance(outputs[3], ValueError)
+    assert outputs[:3] + outputs[4:] == [0, 1, 2, 4, 5]
+    with pytest.raises(ValueError):
+        list(pipeline.run(range(6)))
+    pipeline.close()
+    assert pipeline.stats()['check']['failures'] == 2
+
+
+def test_batches_and_per_item_failures():
+    sizes = []
+
+    def batch_fn(items):
+        sizes.append(len(items))
+        return [ValueError(item) if item % 5 == 0 else item * 10 for item in items]
+
+    pipeline = Pipeline([Stage('batch', batch_fn, queue_size=16, batch_size=4, batch_timeout=0.05)])
+    outputs = list(pipeline.run(range(1, 21), return_exceptions=True))
+    pipeline.close()
+    assert max(sizes) == 4 and sum(sizes) == 20 and len(sizes) < 20
+    for item, output in zip(range(1, 21), outputs):
+        if item % 5 == 0:
+            assert isinstance(output, ValueError)
+        else:
+            assert output == item * 10
+
+
+def test_batch_with_wrong_output_count_fails_its_items():
+    pipeline = Pipeline([Stage('batch', lambda items: items[:1], batch_size=4, batch_timeout=0.05)])
+    futures = [pipeline.submit(i) for i in range(4)]
+    pipeline.close()
+    assert all(isinstance(future.exception(), RuntimeError) for future in futures)
+
+
+def test_close_finishes_queued_items_and_stops_workers():
+    gate = threading.Event()
+
+    def slow(x):
+        gate.wait()
+        return x
+
+    pipeline = Pipeline([Stage('slow', slow, workers=2), Stage('last', lambda x: -x, workers=2)])
+    futures = [pipeline.submit(i) for i in range(6)]
+    gate.set()
+    pipeline.close()
+    assert [future.result(timeout=0) for future in futures] == [-i for i in range(6)]
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+    with pytest.raises(RuntimeError):
+        pipeline.submit(0)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Video and burst-sequence fish measurement
+Streams frames from a measuring-board video (or a burst of photos), samples
+them adaptively, detects fish in batches and reuses the star scale between
+frames. Star detection only re-runs periodically or when the scene changes.
+Per-fish lengths are combined across frames with simple IoU tracking.
+"""
+import argparse
+import json
+import statistics
+
+import cv2
+import numpy as np
+
+from finaly import FishDetector, detect_stars, calculate_fish_lengths, fish_lengths_from_scale
+from image_io import box_iou, iter_images, list_inputs
+from shards import SHARD_EXTENSION
+
+
+def iter_video_frames(path):
+    """
+    Yields (frame_index, frame) from a video file or stream without loading it all.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_burst_frames(paths):
+    """
+    Yields (frame_index, frame) for a burst of still images or image shards, decoding one at a time.
+    """
+    for index, (path, frame) in enumerate(iter_images(paths)):
+        if frame is None:
+            print(f"Could not load image: {path}")
+            continue
+        yield index, frame
+
+
+def thumbnail(frame, size=64):
+    """
+    Small grayscale version of a frame used for cheap motion and scene-change checks.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def frame_difference(thumb_a, thumb_b):
+    """
+    Mean absolute difference between two thumbnails, in gray levels (0-255).
+    """
+    return float(np.mean(np.abs(thumb_a - thumb_b)))
+
+
+class IoUTracker:
+    def __init__(self, iou_threshold=0.3, max_age=10):
+        """
+        Greedy IoU tracker that links fish boxes across frames.
+
+        Args:
+            iou_threshold (float): Minimum IoU to continue a track.
+            max_age (int): Processed frames a track may go unmatched before it is closed.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, frame_index, fish_lengths):
+        """
+        Assigns each measured fish of a frame to a track.
+
+        Args:
+            frame_index (int): Index of the frame in the source.
+            fish_lengths (list): Output of calculate_fish_lengths for the frame.
+        """
+        active = [t for t in self.tracks if t['age'] <= self.max_age]
+        pairs = []
+        for t_index, track in enumerate(active):
+            for f_index, fish in enumerate(fish_lengths):
+                iou = box_iou(track['box'], fish['box'])
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, t_index, f_index))
+
+        matched_tracks, matched_fish = set(), set()
+        for iou, t_index, f_index in sorted(pairs, reverse=True):
+            if t_index in matched_tracks or f_index in matched_fish:
+                continue
+            matched_tracks.add(t_index)
+            matched_fish.add(f_index)
+            self._extend(active[t_index], frame_index, fish_lengths[f_index])
+
+        for t_index, track in enumerate(active):
+            if t_index not in matched_tracks:
+                track['age'] += 1
+
+        for f_index, fish in enumerate(fish_lengths):
+            if f_index not in matched_fish:
+                track = {'track_id': self._next_id, 'box': fish['box'], 'age': 0,
+                         'first_frame': frame_index, 'last_frame': frame_index, 'lengths': []}
+                self._next_id += 1
+                self._extend(track, frame_index, fish)
+                self.tracks.append(track)
+
+    @staticmethod
+    def _extend(track, frame_index, fish):
+        track['box'] = fish['box']
+        track['age'] = 0
+        track['last_frame'] = frame_index
+        track['lengths'].append(fish['length_inch'])
+
+    def summary(self, min_frames=1):
+        """
+        Returns:
+            list: One dict per track with the combined length over its frames.
+        """
+        tracks = []
+        for track in self.tracks:
+            lengths = track['lengths']
+            if len(lengths) < min_frames:
+                continue
+            tracks.append({
+                'track_id': track['track_id'],
+                'frames': len(lengths),
+                'first_frame': track['first_frame'],
+                'last_frame': track['last_frame'],
+                'length_inch': round(statistics.median(lengths), 2),
+                'length_inch_mean': round(statistics.fmean(lengths), 2),
+                'length_inch_min': round(min(lengths), 2),
+                'length_inch_max': round(max(lengths), 2),
+            })
+        return tracks
+
+
+class VideoMeasurer:
+    def __init__(self, fish_detector, star_model_path="epoch162.torchscript", batch_size=8, sample_every=1,
+                 motion_threshold=1.5, max_skip=15, star_interval=30, scene_change_threshold=12.0,
+                 star_real_width=1.6, iou_threshold=0.3, max_age=10):
+        """
+        Args:
+            fish_detector (FishDetector): Shared fish detector.
+            star_model_path (str): Star model passed to detect_stars.
+            batch_size (int): Sampled frames per fish-detection batch.
+            sample_every (int): Only consider every n-th decoded frame.
+            motion_threshold (float): Frames differing less than this from the last processed
+                frame are skipped as duplicates.
+            max_skip (int): Process at least one of this many consecutive considered frames.
+            star_interval (int): Re-run star detection after this many processed frames.
+            scene_change_threshold (float): Re-run star detection when the frame differs this
+                much from the frame the scale was measured on.
+            star_real_width (float): Real star width in inches.
+        """
+        self.fish_detector = fish_detector
+        self.star_model_path = star_model_path
+        self.batch_size = batch_size
+        self.sample_every = max(1, sample_every)
+        self.motion_threshold = motion_threshold
+        self.max_skip = max_skip
+        self.star_interval = star_interval
+        self.scene_change_threshold = scene_change_threshold
+        self.star_real_width = star_real_width
+        self.tracker = IoUTracker(iou_threshold, max_age)
+
+        self.pixels_per_inch = None
+        self._calibration_thumb = None
+        self._frames_since_calibration = 0
+        self.stats = {'frames_read': 0, 'frames_processed': 0, 'frames_skipped': 0, 'star_detections': 0}
+
+    def sample(self, frames):
+        """
+        Adaptive frame sampling: drops frames that are nearly identical to the last kept one.
+
+        Yields:
+            (frame_index, frame, thumb) for frames worth processing.
+        """
+        last_thumb = None
+        skipped = 0
+        for index, frame in frames:
+            self.stats['frames_read'] += 1
+            if index % self.sample_every:
+                self.stats['frames_skipped'] += 1
+                continue
+            thumb = thumbnail(frame)
+            if (last_thumb is not None and skipped < self.max_skip
+                    and frame_difference(thumb, last_thumb) < self.motion_threshold):
+                skipped += 1
+                self.stats['frames_skipped'] += 1
+                continue
+            last_thumb = thumb
+            skipped = 0
+            yield index, frame, thumb
+
+    def _needs_calibration(self, thumb):
+        if self.pixels_per_inch is None:
+            return True
+        if self._frames_since_calibration >= self.star_interval:
+            return True
+        return frame_difference(thumb, self._calibration_thumb) > self.scene_change_threshold
+
+    def _calibrate(self, frame, thumb):
+        star_boxes = detect_stars(frame, self.star_model_path)
+        self.stats['star_detections'] += 1
+        self._calibration_thumb = thumb
+        self._frames_since_calibration = 0
+        if star_boxes:
+            # Keep the previous scale if the star is hidden in this frame
+            _, self.pixels_per_inch = calculate_fish_lengths([], star_boxes, self.star_real_width)
+
+    def _process_batch(self, batch):
+        fish_boxes_batch = self.fish_detector.detect_fish_batch([frame for _, frame, _ in batch])
+        for (index, frame, thumb), fish_boxes in zip(batch, fish_boxes_batch):
+            self.stats['frames_processed'] += 1
+            if fish_boxes and self._needs_calibration(thumb):
+                self._calibrate(frame, thumb)
+            self._frames_since_calibration += 1
+            if fish_boxes and self.pixels_per_inch:
+                self.tracker.update(index, fish_lengths_from_scale(fish_boxes, self.pixels_per_inch))
+
+    def process(self, frames, min_track_frames=2):
+        """
+        Measures fish over a stream of (frame_index, frame) pairs.
+
+        Returns:
+            dict: Processing statistics and one combined length per tracked fish.
+        """
+        batch = []
+        for item in self.sample(frames):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._process_batch(batch)
+                batch = []
+        if batch:
+            self._process_batch(batch)
+
+        return {
+            'stats': self.stats,
+            'pixels_per_inch': self.pixels_per_inch,
+            'fish': self.tracker.summary(min_track_frames),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fish in a video or a burst of photos.")
+    parser.add_argument("inputs", nargs="+", help="A video file, or image files/shards/directories of a burst")
+    parser.add_argument("--model", default="model.ts", help="TorchScript fish model")
+    parser.add_argument("--star-model", default="epoch162.torchscript", help="Star model (TorchScript export, or .pt through ultralytics)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--every", type=int, default=1, help="Consider every n-th frame")
+    parser.add_argument("--motion-threshold", type=float, default=1.5)
+    parser.add_argument("--star-interval", type=int, default=30)
+    parser.add_argument("--scene-change-threshold", type=float, default=12.0)
+    parser.add_argument("--min-track-frames", type=int, default=2)
+    parser.add_argument("--json", help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    images = list_inputs(args.inputs)
+    if (len(args.inputs) == 1 and images == args.inputs and not args.inputs[0].lower().endswith(SHARD_EXTENSION)
+            and not cv2.haveImageReader(args.inputs[0])):
+        frames = iter_video_frames(args.inputs[0])
+    else:
+        frames = iter_burst_frames(images)
+
+    measurer = VideoMeasurer(FishDetector(args.model), args.star_model, batch_size=args.batch_size,
+                             sample_every=args.every, motion_threshold=args.motion_threshold,
+                             star_interval=args.star_interval,
+                             scene_change_threshold=args.scene_change_threshold)
+    summary = measurer.process(frames, args.min_track_frames)
+
+    stats = summary['stats']
+    print(f"Frames read: {stats['frames_read']}, processed: {stats['frames_processed']}, "
+          f"skipped: {stats['frames_skipped']}, star detections: {stats['star_detections']}")
+    for fish in summary['fish']:
+        print(f"Fish {fish['track_id']}: {fish['length_inch']:.2f}\" over {fish['frames']} frames "
+              f"(min {fish['length_inch_min']:.2f}\", max {fish['length_inch_max']:.2f}\")")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()